@@ -21,10 +21,12 @@ from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.event import listen
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.pool import Pool
-from SDSSconnect.models import createRelationships
+from SDSSconnect.models import createRelationships, requiredTables
 from SDSSconnect.models.utils import ModelWrapper, cameliseClassname
 from SDSSconnect.exceptions import SDSSconnectUserWarning, SDSSconnectError
 from SDSSconnect.models import methods
+from SDSSconnect import schemaCache
+from SDSSconnect.lookupTables import LookupTables
 
 import warnings
 import ConfigParser
@@ -154,8 +156,21 @@ class DatabaseConnection(object):
     @classmethod
     def _createNewInstance(cls, profile=None, databaseConnectionString=None,
                            expireOnCommit=True, models='all',
-                           profilePath=None, name=None, **kwargs):
-        """Creates a new instance of the connection."""
+                           profilePath=None, name=None, cacheMetadata=False,
+                           cacheDir=None, onlyRequiredTables=False, **kwargs):
+        """Creates a new instance of the connection.
+
+        If `cacheMetadata=True`, the reflected metadata is saved to (and read
+        from) a cache file in `cacheDir` (by default
+        ``~/.sdssconnect/cache``), keyed by connection profile and a
+        fingerprint of the schemas. If `onlyRequiredTables=True`, only the
+        tables in `SDSSconnect.models.requiredTables` are reflected for the
+        ``platedb`` and ``mangadb`` schemas.
+
+        The label to pk maps of the lookup tables are available as
+        `lookupTables` (see `SDSSconnect.lookupTables.LookupTables`).
+
+        """
 
         me = object.__new__(cls)
 
@@ -173,6 +188,13 @@ class DatabaseConnection(object):
 
         me.engine = create_engine(me.databaseConnectionString, echo=False)
 
+        me.cacheMetadata = cacheMetadata
+        me.cacheDir = cacheDir or os.path.join('~', '.sdssconnect', 'cache')
+        me.onlyRequiredTables = onlyRequiredTables
+        me.metadataFromCache = False
+
+        me.lookupTables = LookupTables(me)
+
         me.metadata = MetaData()
         me.Session = scoped_session(
             sessionmaker(bind=me.engine, autocommit=True,
@@ -232,16 +254,23 @@ class DatabaseConnection(object):
         assert isinstance(models, (list, tuple, basestring)), \
             ('models must be \'all\' or a list of strings.')
 
-        self.metadata = MetaData(bind=self.engine)
-
         if models == 'all':
             models = __MODELS__
 
-        for model in models:
-            if hasattr(self, model) and not overwrite:
-                continue
+        schemas = [model.lower() for model in models
+                   if overwrite or not hasattr(self, model)]
 
-            self.metadata.reflect(schema=model.lower())
+        # Keeps the tables added by previous calls, except those of the
+        # schemas that are going to be reflected again.
+        self.metadata.bind = self.engine
+        for table in list(self.metadata.tables.values()):
+            if table.schema in schemas:
+                self.metadata.remove(table)
+
+        if self.cacheMetadata and len(schemas) > 0:
+            self._reflectWithCache(schemas)
+        else:
+            self._reflect(schemas)
 
         self.Base = automap_base(metadata=self.metadata)
         self.Base.prepare(engine=self.engine,
@@ -272,3 +301,56 @@ class DatabaseConnection(object):
                 setattr(self, model,
                         ModelWrapper(self.Base,
                                      '{0}_'.format(model.capitalize())))
+
+        self.lookupTables.refresh()
+
+    def _getTables(self, schemas):
+        """Returns the tables to reflect for each schema, or None for all."""
+
+        if not self.onlyRequiredTables:
+            return None
+
+        return dict((schema, requiredTables[schema])
+                    for schema in schemas if schema in requiredTables)
+
+    def _reflect(self, schemas, metadata=None):
+        """Reflects a list of schemas into `metadata` (or `self.metadata`)."""
+
+        if metadata is None:
+            metadata = self.metadata
+
+        tables = self._getTables(schemas) or {}
+
+        for schema in schemas:
+            only = None
+            if schema in tables:
+                schemaTables = tables[schema]
+                only = lambda tableName, metadata: tableName in schemaTables
+
+            metadata.reflect(schema=schema, only=only)
+
+    def _reflectWithCache(self, schemas):
+        """Reads the metadata from the cache or reflects and caches it.
+
+        The tables are then copied to `self.metadata`, so that the tables
+        added by previous calls to `addModels` are kept.
+
+        """
+
+        cachePath = schemaCache.getCachePath(
+            self.cacheDir, self.profile, self.engine.url, schemas,
+            tables=self._getTables(schemas))
+        fingerprint = schemaCache.getSchemaFingerprint(self.engine, schemas)
+
+        metadata = schemaCache.readCachedMetadata(cachePath, fingerprint)
+
+        if metadata is not None:
+            self.metadataFromCache = True
+        else:
+            metadata = MetaData(bind=self.engine)
+            self._reflect(schemas, metadata=metadata)
+            schemaCache.saveCachedMetadata(cachePath, metadata, fingerprint)
+            self.metadataFromCache = False
+
+        for table in metadata.sorted_tables:
+            table.tometadata(self.metadata)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+lookupTables.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from sqlalchemy.orm.interfaces import MANYTOONE
+from SDSSconnect.exceptions import SDSSconnectError
+
+
+class LookupTables(object):
+    """Label to pk maps for the lookup tables of a connection.
+
+    Lookup tables (e.g., ``platedb.survey`` or ``mangadb.set_status``) are
+    small tables with a ``pk`` and a ``label`` column. The map for a table is
+    loaded with a single query the first time it is needed and kept in memory
+    until `refresh` is called. Labels not found in the map trigger a refresh
+    of that table before raising an error, so that rows added after the map
+    was loaded are found.
+
+    Parameters
+    ----------
+    connection : `DatabaseConnection`
+        The connection whose lookup tables will be loaded.
+
+    Example
+    -------
+    To filter plateDB exposures by flavour without joining the flavour table
+    ::
+      >> lookupTables = db.lookupTables
+      >> session.query(db.plateDB.Exposure).filter(
+      ..     lookupTables.filterBy(db.plateDB.Exposure.flavor, 'Science'))
+
+    """
+
+    def __init__(self, connection):
+
+        self._connection = connection
+        self._maps = {}
+
+    @staticmethod
+    def _getKey(model):
+        """Returns the key of a model in the maps."""
+
+        return model.__table__.fullname
+
+    def _getMap(self, model):
+        """Returns the label to pk map of a model, loading it if needed."""
+
+        key = self._getKey(model)
+
+        if key not in self._maps:
+            session = self._connection.Session()
+            rows = session.query(model.label, model.pk).all()
+            self._maps[key] = dict((label, pk) for label, pk in rows)
+
+        return self._maps[key]
+
+    def refresh(self, model=None):
+        """Reloads the map of `model` or, if `model=None`, of all tables.
+
+        The maps are reloaded the next time they are used.
+
+        """
+
+        if model is None:
+            self._maps = {}
+        else:
+            self._maps.pop(self._getKey(model), None)
+
+    def getPK(self, model, label):
+        """Returns the pk of the row of `model` with a certain label.
+
+        Raises `SDSSconnectError` if the label does not exist.
+
+        """
+
+        if label not in self._getMap(model):
+            self.refresh(model)
+            if label not in self._getMap(model):
+                raise SDSSconnectError('label {0!r} not found in {1}'
+                                       .format(label, self._getKey(model)))
+
+        return self._getMap(model)[label]
+
+    def getPKs(self, model, labels):
+        """Returns a list of pks for a list of labels. See `getPK`."""
+
+        return [self.getPK(model, label) for label in labels]
+
+    def filterBy(self, relationship, labels):
+        """Returns a filter on the foreign key of a relationship.
+
+        Parameters
+        ----------
+        relationship : many-to-one relationship
+            The relationship to the lookup table, e.g.,
+            ``plateDB.Exposure.flavor``.
+        labels : string or list of strings
+            The label or list of labels to select.
+
+        Returns
+        -------
+        filter : SQLAlchemy expression
+            An expression comparing the local foreign key column with the pks
+            of the labels, which does not require joining the lookup table.
+
+        """
+
+        prop = relationship.property
+
+        if prop.direction is not MANYTOONE or len(prop.local_columns) != 1:
+            raise SDSSconnectError('{0} is not a many-to-one relationship '
+                                   'with a single foreign key'
+                                   .format(relationship))
+
+        column = list(prop.local_columns)[0]
+        model = prop.mapper.class_
+
+        if isinstance(labels, basestring):
+            return column == self.getPK(model, labels)
+        else:
+            return column.in_(self.getPKs(model, labels))
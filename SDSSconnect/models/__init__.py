@@ -7,4 +7,4 @@ import warnings
 warnings.filterwarnings('ignore',
                         'Skipped unsupported reflection of expression-based')
 
-from relationships import createRelationships
+from relationships import createRelationships, requiredTables
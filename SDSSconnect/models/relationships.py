@@ -18,6 +18,29 @@ from __future__ import print_function
 from sqlalchemy.orm import relationship, backref
 
 
+# The tables, per schema, on which the relationships below are defined. If
+# a connection is created with onlyRequiredTables=True, only these tables
+# (and the ones they reference) are reflected.
+requiredTables = {
+    'platedb': [
+        'active_plugging', 'boss_plugging_info', 'boss_sn2_threshold',
+        'camera', 'camera_frame', 'cartridge', 'cmm_meas', 'design',
+        'design_field', 'design_value', 'exposure', 'exposure_flavor',
+        'exposure_header_keyword', 'exposure_header_value', 'exposure_status',
+        'fiber', 'gprobe', 'instrument', 'object_type', 'observation',
+        'observation_status', 'pl_plugmap_m', 'plate',
+        'plate_completion_status', 'plate_completion_status_history',
+        'plate_hole', 'plate_hole_type', 'plate_holes_file', 'plate_input',
+        'plate_location', 'plate_pointing', 'plate_run', 'plate_status',
+        'plate_to_plate_status', 'plate_to_survey', 'plugging',
+        'plugging_status', 'plugging_to_instrument', 'pointing',
+        'profilometry', 'prof_measurement', 'prof_tolerances', 'survey',
+        'survey_mode', 'tile', 'tile_status', 'tile_status_history'],
+    'mangadb': [
+        'data_cube', 'exposure', 'exposure_status', 'exposure_to_data_cube',
+        'plate', 'sn2_values', 'set', 'set_status', 'spectrum']}
+
+
 def createRelationships(Base):
     """Creates relationships."""
 
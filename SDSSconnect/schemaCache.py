@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+schemaCache.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from sqlalchemy import text
+from SDSSconnect.exceptions import SDSSconnectUserWarning
+
+import sqlalchemy
+import cPickle as pickle
+import hashlib
+import os
+import warnings
+
+
+# Increase if the format of the cache files changes.
+_CACHE_VERSION = 1
+
+# Returns a single hash of the columns and constraints of a list of schemas,
+# which changes whenever a table, column or constraint is added, removed or
+# modified. It runs a single query on the catalogue.
+_fingerprintQuery = text("""
+    SELECT md5(coalesce(string_agg(item, ',' ORDER BY item), ''))
+    FROM (
+        SELECT nn.nspname || '.' || cc.relname || '.' || aa.attname || ':' ||
+               format_type(aa.atttypid, aa.atttypmod) || ':' ||
+               aa.attnotnull::text AS item
+        FROM pg_catalog.pg_attribute aa
+        JOIN pg_catalog.pg_class cc ON aa.attrelid = cc.oid
+        JOIN pg_catalog.pg_namespace nn ON cc.relnamespace = nn.oid
+        WHERE nn.nspname::text = ANY(:schemas) AND aa.attnum > 0 AND
+              NOT aa.attisdropped AND cc.relkind IN ('r', 'v', 'm', 'f')
+        UNION ALL
+        SELECT nn.nspname || '.' || co.conname || ':' ||
+               pg_get_constraintdef(co.oid) AS item
+        FROM pg_catalog.pg_constraint co
+        JOIN pg_catalog.pg_namespace nn ON co.connamespace = nn.oid
+        WHERE nn.nspname::text = ANY(:schemas)) AS items
+    """)
+
+
+def getSchemaFingerprint(engine, schemas):
+    """Returns a hash that changes if the definition of the schemas changes.
+
+    Parameters
+    ----------
+    engine : SQLAlchemy engine
+        The engine to use to query the database.
+    schemas : list of strings
+        The schemas to fingerprint.
+
+    """
+
+    with engine.connect() as connection:
+        fingerprint = connection.execute(
+            _fingerprintQuery,
+            schemas=sorted([schema.lower() for schema in schemas])).scalar()
+
+    return fingerprint
+
+
+def getCachePath(cacheDir, profile, url, schemas, tables=None):
+    """Returns the path of the cache file for a connection and schemas.
+
+    The file name includes the profile and a hash of the database URL
+    (without the password), the schemas and the list of tables to reflect.
+
+    """
+
+    md5 = hashlib.md5()
+    md5.update('{0}@{1}:{2}/{3}'.format(url.username, url.host, url.port,
+                                        url.database))
+    md5.update(repr(sorted([schema.lower() for schema in schemas])))
+    md5.update(repr(sorted((key, sorted(tables[key]))
+                           for key in tables) if tables else None))
+
+    return os.path.join(os.path.expanduser(cacheDir),
+                        'metadata_{0}_{1}.pickle'.format(profile,
+                                                         md5.hexdigest()))
+
+
+def readCachedMetadata(path, fingerprint):
+    """Reads a cached `MetaData` object.
+
+    Returns None if the file does not exist, cannot be read, or was created
+    with a different cache format, version of SQLAlchemy, or for a schema
+    with a different fingerprint.
+
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as cache:
+            cached = pickle.load(cache)
+    except Exception:
+        return None
+
+    if (not isinstance(cached, dict) or
+            cached.get('version') != _CACHE_VERSION or
+            cached.get('sqlalchemy') != sqlalchemy.__version__ or
+            cached.get('fingerprint') != fingerprint):
+        return None
+
+    return cached['metadata']
+
+
+def saveCachedMetadata(path, metadata, fingerprint):
+    """Saves a `MetaData` object to the cache.
+
+    Failing to write the cache only issues a warning.
+
+    """
+
+    cached = {'version': _CACHE_VERSION,
+              'sqlalchemy': sqlalchemy.__version__,
+              'fingerprint': fingerprint,
+              'metadata': metadata}
+
+    try:
+        cacheDir = os.path.dirname(path)
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+
+        # Writes to a temporary file first, so that a concurrent process
+        # never reads a partial cache.
+        tmpPath = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmpPath, 'wb') as cache:
+            pickle.dump(cached, cache, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpPath, path)
+    except Exception as ee:
+        warnings.warn('failed saving the metadata cache to {0}: {1}'
+                      .format(path, ee), SDSSconnectUserWarning)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+test_LookupTables.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import unittest
+from sqlalchemy import event
+from SDSSconnect import DatabaseConnection
+from SDSSconnect.exceptions import SDSSconnectError
+
+
+connectionString = 'postgresql+psycopg2://sdssdb@localhost:5432/apodb'
+
+
+class TestLookupTables(unittest.TestCase):
+    """Test suite for the label to pk maps of the lookup tables."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Creates the connection."""
+
+        cls.db = DatabaseConnection(databaseConnectionString=connectionString,
+                                    new=True, name='test_lookup')
+        cls.plateDB = cls.db.plateDB
+        cls.mangaDB = cls.db.mangaDB
+
+    def setUp(self):
+        self.db.lookupTables.refresh()
+        self.session = self.db.Session()
+
+    def _countQueries(self, func, *args):
+        """Returns the number of queries issued while calling func."""
+
+        queries = []
+
+        def countQuery(*args):
+            queries.append(args)
+
+        event.listen(self.db.engine, 'before_cursor_execute', countQuery)
+        try:
+            func(*args)
+        finally:
+            event.remove(self.db.engine, 'before_cursor_execute', countQuery)
+
+        return len(queries)
+
+    def testGetPK(self):
+        """Compares the pks in the maps with the DB."""
+
+        for model, label in [(self.plateDB.Survey, 'MaNGA'),
+                             (self.plateDB.PlateLocation, 'APO'),
+                             (self.plateDB.ExposureFlavor, 'Science'),
+                             (self.mangaDB.ExposureStatus, 'Totoro Good'),
+                             (self.mangaDB.SetStatus, 'Excellent')]:
+            with self.session.begin():
+                pk = self.session.query(model.pk).filter(
+                    model.label == label).scalar()
+            self.assertEqual(self.db.lookupTables.getPK(model, label), pk)
+
+    def testMapsAreCached(self):
+        """Tests that each map is only loaded once until refreshed."""
+
+        lookupTables = self.db.lookupTables
+        Survey = self.plateDB.Survey
+
+        self.assertEqual(
+            self._countQueries(lookupTables.getPK, Survey, 'MaNGA'), 1)
+        self.assertEqual(
+            self._countQueries(lookupTables.getPK, Survey, 'MaNGA'), 0)
+
+        lookupTables.refresh(Survey)
+        self.assertEqual(
+            self._countQueries(lookupTables.getPK, Survey, 'MaNGA'), 1)
+
+    def testUnknownLabel(self):
+        """Tests that an unknown label raises an error."""
+
+        with self.assertRaises(SDSSconnectError):
+            self.db.lookupTables.getPK(self.plateDB.Survey, 'NotASurvey')
+
+    def testFilterBy(self):
+        """Tests that filterBy matches filtering by label."""
+
+        Exposure = self.plateDB.Exposure
+
+        with self.session.begin():
+            byLabel = self.session.query(Exposure.pk).join(
+                self.plateDB.ExposureFlavor).filter(
+                    self.plateDB.ExposureFlavor.label == 'Science').order_by(
+                        Exposure.pk).limit(100).all()
+            byPK = self.session.query(Exposure.pk).filter(
+                self.db.lookupTables.filterBy(Exposure.flavor,
+                                              'Science')).order_by(
+                    Exposure.pk).limit(100).all()
+
+        self.assertEqual(byLabel, byPK)
+
+        with self.assertRaises(SDSSconnectError):
+            self.db.lookupTables.filterBy(self.plateDB.Plate.pluggings, 'Good')
+
+
+if __name__ == '__main__':
+    unittest.main()
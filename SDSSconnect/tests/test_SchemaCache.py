@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+test_SchemaCache.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+import warnings
+from sqlalchemy import create_engine
+from SDSSconnect import DatabaseConnection
+from SDSSconnect import schemaCache
+
+
+# The tests create (and drop) a small schema in the local test database, so
+# that they do not depend on the platedb and mangadb schemas.
+connectionString = 'postgresql+psycopg2://sdssdb@localhost:5432/apodb'
+testSchema = 'sdssconnect_cache_test'
+extraSchema = 'sdssconnect_cache_extra'
+
+
+class TestSchemaCache(unittest.TestCase):
+    """Test suite for the cache of reflected metadata."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Creates the test schema and a temporary cache directory."""
+
+        cls.engine = create_engine(connectionString)
+        cls.cacheDir = tempfile.mkdtemp()
+
+        with cls.engine.begin() as connection:
+            for schema in [testSchema, extraSchema]:
+                connection.execute('DROP SCHEMA IF EXISTS {0} CASCADE'
+                                   .format(schema))
+                connection.execute('CREATE SCHEMA {0}'.format(schema))
+            connection.execute('CREATE TABLE {0}.extra (pk serial PRIMARY '
+                               'KEY)'.format(extraSchema))
+            connection.execute('CREATE TABLE {0}.status (pk serial PRIMARY '
+                               'KEY, label text)'.format(testSchema))
+            connection.execute('CREATE TABLE {0}.item (pk serial PRIMARY KEY, '
+                               'status_pk integer REFERENCES {0}.status(pk))'
+                               .format(testSchema))
+
+    @classmethod
+    def tearDownClass(cls):
+        """Drops the test schema and the cache directory."""
+
+        with cls.engine.begin() as connection:
+            for schema in [testSchema, extraSchema]:
+                connection.execute('DROP SCHEMA IF EXISTS {0} CASCADE'
+                                   .format(schema))
+
+        shutil.rmtree(cls.cacheDir)
+
+        DatabaseConnection._singletons.pop('cacheTest', None)
+
+    def _connect(self, cacheDir=None):
+        """Creates a new connection to the test schema using the cache."""
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return DatabaseConnection(
+                databaseConnectionString=connectionString, new=True,
+                name='cacheTest', models=[testSchema], cacheMetadata=True,
+                cacheDir=cacheDir or self.cacheDir)
+
+    def _alterSchema(self, column):
+        """Adds a column to the test schema."""
+
+        with self.engine.begin() as connection:
+            connection.execute('ALTER TABLE {0}.item ADD COLUMN {1} real'
+                               .format(testSchema, column))
+
+    def testFingerprint(self):
+        """Tests that the fingerprint only changes with the schema."""
+
+        fingerprint = schemaCache.getSchemaFingerprint(self.engine,
+                                                       [testSchema])
+        self.assertEqual(
+            schemaCache.getSchemaFingerprint(self.engine, [testSchema]),
+            fingerprint)
+
+        self._alterSchema('fingerprint_test')
+
+        self.assertNotEqual(
+            schemaCache.getSchemaFingerprint(self.engine, [testSchema]),
+            fingerprint)
+
+    def testCachedConnection(self):
+        """Tests that the metadata is cached and invalidated."""
+
+        db1 = self._connect()
+        self.assertFalse(db1.metadataFromCache)
+        self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+
+        db2 = self._connect()
+        self.assertTrue(db2.metadataFromCache)
+        self.assertItemsEqual(db2.metadata.tables.keys(),
+                              db1.metadata.tables.keys())
+
+        # The models created from the cache can be queried.
+        models = getattr(db2, testSchema)
+        session = db2.Session()
+        with session.begin():
+            self.assertEqual(session.query(models.Item).count(), 0)
+
+        # Changing the schema invalidates the cache.
+        self._alterSchema('cache_test')
+
+        db3 = self._connect()
+        self.assertFalse(db3.metadataFromCache)
+        self.assertIn('cache_test',
+                      db3.metadata.tables[testSchema + '.item'].columns)
+
+    def testAddModelsIncrementally(self):
+        """Tests that addModels keeps the tables of previous calls."""
+
+        # Uses its own cache directory, so that the other tests start
+        # without a cache.
+        cacheDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cacheDir)
+
+        # The first connection writes the cache, the second one reads it.
+        for fromCache in [False, True]:
+
+            db = self._connect(cacheDir=cacheDir)
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                db.addModels([extraSchema])
+
+            self.assertEqual(db.metadataFromCache, fromCache)
+            self.assertIn(testSchema + '.item', db.metadata.tables)
+            self.assertIn(extraSchema + '.extra', db.metadata.tables)
+
+            session = db.Session()
+            with session.begin():
+                self.assertEqual(
+                    session.query(getattr(db, testSchema).Item).count(), 0)
+                self.assertEqual(
+                    session.query(getattr(db, extraSchema).Extra).count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,18 +21,51 @@ log = initLog()
 log.debug('Logging starts now.')
 log.debug('Configuration file has been loaded.')
 
-try:
-    from sdss.manga import DustMap
-    dustMap = DustMap()
-except (ImportError, ValueError):
-    warnings.warn('no dust map found. No Galactic extinction '
-                  'will be applied', DustMapWarning)
-    dustMap = None
-except:
-    raise TotoroError('something went wrong while importing the dust map.')
-
-from sdss.utilities.Site import Site
-site = Site()
+# The dust map and the site are expensive to load, so they are only created
+# the first time they are used.
+from core.lazy import LazyObject
+
+_dustMap = None
+_dustMapLoaded = False
+
+
+def getDustMap():
+    """Returns the dust map, loading it on first use.
+
+    Returns None (and issues a `DustMapWarning`) if the dust map cannot be
+    found.
+
+    """
+
+    global _dustMap, _dustMapLoaded
+
+    if _dustMapLoaded:
+        return _dustMap
+
+    try:
+        from sdss.manga import DustMap
+        _dustMap = DustMap()
+    except (ImportError, ValueError):
+        warnings.warn('no dust map found. No Galactic extinction '
+                      'will be applied', DustMapWarning)
+        _dustMap = None
+    except:
+        raise TotoroError('something went wrong while importing the dust '
+                          'map.')
+
+    _dustMapLoaded = True
+
+    return _dustMap
+
+
+def _getSite():
+    """Creates the `Site` instance for APO."""
+
+    from sdss.utilities.Site import Site
+    return Site()
+
+
+site = LazyObject(_getSite)
 
 from Totoro.dbclasses import *
 from Totoro.scheduler import Planner, Plugger
@@ -19,7 +19,8 @@ from Totoro import log
 from Totoro.db import getConnection
 from Totoro.dbclasses.exposure import Exposure, setExposureStatus
 from Totoro.dbclasses.set import Set, checkSet, setErrorCodes
-from Totoro.dbclasses.plate_utils import getConsecutiveSets, removeOrphanedSets
+from Totoro.dbclasses.flagging import batchFlagging, flushActiveBuffer
+from Totoro.dbclasses.plate_utils import allocateSetPKs, removeOrphanedSets
 from Totoro.dbclasses import fromPlateID
 from Totoro.exceptions import TotoroUserWarning, TotoroError, EmptySet
 
@@ -114,56 +115,70 @@ def override(args):
     if len(np.unique(originalSetPKs)) == 1 and originalSetPKs[0] is not None:
         overridenSetPK = originalSetPKs[0]
     else:
-        overridenSetPK = getConsecutiveSets(1)[0]
-        if verbose:
-            log.info('creating new set pk={0}'.format(overridenSetPK))
         with session.begin():
+            overridenSetPK = allocateSetPKs(session, 1)[0]
             ss = db.mangaDB.Set(pk=overridenSetPK)
             session.add(ss)
-
-    for totExp in totExposures:
-        setExposureStatus(totExp, 'Override ' + mode)
         if verbose:
-            log.info('changing exposure_no={0} mangaDB status to Override {1}'
-                     .format(totExp.exposure_no, mode))
+            log.info('created new set pk={0}'.format(overridenSetPK))
 
-        if totExp._mangaExposure.set_pk != overridenSetPK:
-            with session.begin():
-                totExp._mangaExposure.set_pk = overridenSetPK
-            if verbose:
-                log.info('changing set_pk for exposure_no={0} to {1}'
-                         .format(totExp.exposure_no, overridenSetPK))
+    # The exposures and the remaining sets are flagged in a single
+    # transaction at the end of the block.
+    origStatuses = {}
 
-    # Overrides the set good/bad.
-    with session.begin():
-        ss = session.query(db.mangaDB.Set).get(overridenSetPK)
-        ss.set_status_pk = overriddenStatusPK
+    with batchFlagging():
 
-    # Reflags the remaining sets
-    for setPK in np.unique(originalSetPKs):
-        if setPK == overridenSetPK or setPK is None:
-            continue
+        for totExp in totExposures:
+            setExposureStatus(totExp, 'Override ' + mode)
+            if verbose:
+                log.info('changing exposure_no={0} mangaDB status to '
+                         'Override {1}'.format(totExp.exposure_no, mode))
 
-        try:
-            ss = Set(setPK, format='pk')
-            origStatus = None if ss.status is None else ss.status.label
-            checkSet(ss, flag=True, force=True)
+            if totExp._mangaExposure.set_pk != overridenSetPK:
+                with session.begin():
+                    totExp._mangaExposure.set_pk = overridenSetPK
+                if verbose:
+                    log.info('changing set_pk for exposure_no={0} to {1}'
+                             .format(totExp.exposure_no, overridenSetPK))
 
-            if verbose:
-                ss = Set(setPK, format='pk')
-                newStatus = None if ss.status is None else ss.status.label
-                if newStatus != origStatus:
-                    log.info('set pk={0} status changed from {1} to {2}'
-                             .format(setPK, origStatus, newStatus))
+        # Overrides the set good/bad.
+        with session.begin():
+            ss = session.query(db.mangaDB.Set).get(overridenSetPK)
+            ss.set_status_pk = overriddenStatusPK
 
-        except EmptySet:
+        # Reflags the remaining sets
+        for setPK in np.unique(originalSetPKs):
+            if setPK == overridenSetPK or setPK is None:
+                continue
 
-            if verbose:
-                log.info('set pk={0} is empty. Removing it.'.format(setPK))
+            try:
+                ss = Set(setPK, format='pk')
+                origStatuses[setPK] = (None if ss.status is None
+                                       else ss.status.label)
+                checkSet(ss, flag=True, force=True)
+
+            except EmptySet:
+
+                if verbose:
+                    log.info('set pk={0} is empty. Removing it.'
+                             .format(setPK))
+                flushActiveBuffer()
+                with session.begin():
+                    ss = session.query(db.mangaDB.Set).get(setPK)
+                    session.delete(ss)
+                continue
+
+    # Logs the changes in the status of the remaining sets, once they have
+    # been applied.
+    if verbose:
+        for setPK, origStatus in origStatuses.items():
             with session.begin():
                 ss = session.query(db.mangaDB.Set).get(setPK)
-                session.delete(ss)
-            continue
+                newStatus = (None if ss is None or ss.status is None
+                             else ss.status.label)
+            if newStatus != origStatus:
+                log.info('set pk={0} status changed from {1} to {2}'
+                         .format(setPK, origStatus, newStatus))
 
     # Checks if completion has changed for the plate and, if so, issues a
     # warning. Otherwise, issues a general warning.
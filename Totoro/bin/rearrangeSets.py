@@ -25,13 +25,14 @@ if TotoroPath not in sys.path:
     sys.path.append(TotoroPath)
 
 
-def rearrageSets(plateid, force=False, LST=None, **kwargs):
+def rearrageSets(plateid, force=False, LST=None, mode='optimal',
+                 nWorkers=None, **kwargs):
     """Triggers a set rearrangement for a certain plate."""
 
     from Totoro.dbclasses import plate
 
     pp = plate.fromPlateID(plateid)
-    pp.rearrangeSets(force=force, LST=LST)
+    pp.rearrangeSets(force=force, LST=LST, mode=mode, nWorkers=nWorkers)
 
 
 if __name__ == '__main__':
@@ -55,6 +56,18 @@ if __name__ == '__main__':
     parser.add_argument('-l', '--lst', type=float, dest='LST',
                         help='tries to rearrange sets so that at least an '
                              'incomplete set is available after that LST.')
+    parser.add_argument('-m', '--mode', type=str, dest='mode',
+                        default='optimal',
+                        choices=['optimal', 'sequential', 'branchAndBound'],
+                        help='the rearrangement mode. branchAndBound returns '
+                             'the same optimal arrangement as optimal but '
+                             'discards the permutations that cannot be '
+                             'selected without testing them.')
+    parser.add_argument('-w', '--workers', type=int, dest='nWorkers',
+                        default=None,
+                        help='the number of processes used to test the '
+                             'permutations. Defaults to '
+                             'config.setArrangement.nWorkers.')
     parser.add_argument('-v', '--verbose', action='store_true', dest='verbose',
                         help='Print lots of extra output.')
 
@@ -62,4 +75,5 @@ if __name__ == '__main__':
 
     if args.outputflush:
         sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
-    rearrageSets(args.plate, force=args.force, LST=args.LST)
+    rearrageSets(args.plate, force=args.force, LST=args.LST,
+                 mode=args.mode, nWorkers=args.nWorkers)
@@ -1,2 +1,3 @@
 from configuration import TotoroConfig
 from logger import TotoroLogger
+from lazy import LazyObject
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+lazy.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+
+__all__ = ['LazyObject']
+
+_empty = object()
+
+
+class LazyObject(object):
+    """A proxy to an object that is only created the first time it is used.
+
+    Attribute access, calls, item access, iteration, length and
+    representation are forwarded to the object returned by
+    ``factory(*args, **kwargs)``, which is called once, on first use. This
+    allows to define expensive module-level singletons without paying their
+    cost at import time.
+
+    Parameters
+    ----------
+    factory : callable
+        The function or class that creates the object.
+    args, kwargs
+        Arguments to be passed to `factory`.
+
+    """
+
+    def __init__(self, factory, *args, **kwargs):
+
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_args', args)
+        object.__setattr__(self, '_kwargs', kwargs)
+        object.__setattr__(self, '_wrapped', _empty)
+
+    def _getWrapped(self):
+        """Returns the proxied object, creating it if necessary."""
+
+        wrapped = object.__getattribute__(self, '_wrapped')
+
+        if wrapped is _empty:
+            factory = object.__getattribute__(self, '_factory')
+            wrapped = factory(*object.__getattribute__(self, '_args'),
+                              **object.__getattribute__(self, '_kwargs'))
+            object.__setattr__(self, '_wrapped', wrapped)
+
+        return wrapped
+
+    def _isLoaded(self):
+        """Returns True if the proxied object has been created."""
+
+        return object.__getattribute__(self, '_wrapped') is not _empty
+
+    def __getattr__(self, name):
+        return getattr(self._getWrapped(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._getWrapped(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._getWrapped(), name)
+
+    def __getitem__(self, key):
+        return self._getWrapped()[key]
+
+    def __setitem__(self, key, value):
+        self._getWrapped()[key] = value
+
+    def __call__(self, *args, **kwargs):
+        return self._getWrapped()(*args, **kwargs)
+
+    def __len__(self):
+        return len(self._getWrapped())
+
+    def __iter__(self):
+        return iter(self._getWrapped())
+
+    def __contains__(self, item):
+        return item in self._getWrapped()
+
+    def __nonzero__(self):
+        return bool(self._getWrapped())
+
+    __bool__ = __nonzero__
+
+    def __dir__(self):
+        return dir(self._getWrapped())
+
+    def __repr__(self):
+        if not self._isLoaded():
+            factory = object.__getattribute__(self, '_factory')
+            return '<LazyObject of {0}>'.format(
+                getattr(factory, '__name__', repr(factory)))
+        return repr(self._getWrapped())
+
+    def __str__(self):
+        return str(self._getWrapped())
@@ -33,6 +33,16 @@ def getConfigurationProfiles():
     return profiles
 
 
+def getSchemaCacheOptions():
+    """Returns the schema cache options to pass to `DatabaseConnection`."""
+
+    cacheConfig = config['dbSchemaCache']
+
+    return {'cacheMetadata': cacheConfig['enabled'],
+            'cacheDir': cacheConfig['cacheDir'],
+            'onlyRequiredTables': cacheConfig['onlyRequiredTables']}
+
+
 def getConnection(profile=None):
     """Returns a connection.
 
@@ -52,7 +62,8 @@ def getConnection(profile=None):
             .format(**config['dbConnection']))
         dbConn = DatabaseConnection(
             databaseConnectionString=databaseConnectionString,
-            new=True, name=config['dbConnection']['name'], default=True)
+            new=True, name=config['dbConnection']['name'], default=True,
+            **getSchemaCacheOptions())
         checkOpenSession()
         return dbConn
     else:
@@ -67,7 +78,8 @@ def getConnection(profile=None):
                 )
                 dbConn = DatabaseConnection(
                     databaseConnectionString=databaseConnectionString,
-                    new=True, name=profile.lower())
+                    new=True, name=profile.lower(),
+                    **getSchemaCacheOptions())
                 checkOpenSession()
                 return dbConn
             else:
@@ -0,0 +1,826 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+arrangement.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import config, site
+from Totoro import exceptions
+from Totoro.utils import intervals, mlhalimit
+import numpy as np
+import collections
+import heapq
+import itertools
+
+
+# Tolerance used when comparing completion bounds, to avoid pruning branches
+# that only differ from the incumbent because of rounding.
+_boundTolerance = 1e-9
+
+_validStatuses = ['Excellent', 'Good', 'Override Good']
+
+
+def getCompletionFromSN2(plateSN2):
+    """Returns the plate completion for a cumulated SN2 array.
+
+    Uses the same definition as `rearrangeSets`, i.e., the minimum of the
+    blue and red completions.
+
+    """
+
+    blueSN2 = np.nanmean(plateSN2[0:2])
+    blueCompletion = blueSN2 / config['SN2thresholds']['plateBlue']
+    redSN2 = np.nanmean(plateSN2[2:])
+    redCompletion = redSN2 / config['SN2thresholds']['plateRed']
+
+    return np.min([blueCompletion, redCompletion])
+
+
+class SetEvaluator(object):
+    """Compatibility kernel for sets built from a list of exposures.
+
+    On initialisation, computes a matrix with the pairwise constraints that
+    `checkSet` applies to a set (HA span, seeing range, SN2 uniformity, dither
+    positions and plugging). The HA span of larger sets is calculated when
+    their status is first requested. The status and SN2 of any combination of
+    exposures can then be determined without instantiating mock `Totoro.Set`
+    objects.
+
+    Sets are identified by the tuple of sorted indices of their exposures in
+    `exposures`, which is also used as key to cache their status. Exposures
+    with ``ditherPosition=None`` (mock exposures that will be assigned a
+    dither once they are added to a set) are considered compatible with any
+    other dither position.
+
+    """
+
+    def __init__(self, exposures):
+
+        self.exposures = list(exposures)
+        self.nExposures = len(self.exposures)
+        self.nDithers = len(config['set']['ditherPositions'])
+
+        self._sets = {}
+        self._status = {}
+        self._activePluggings = {}
+
+        self._loadExposureData()
+
+        self.compatible = self._getPairCompatibility()
+
+    def __getstate__(self):
+        """Returns a picklable state, without the Totoro exposures.
+
+        Used to send the evaluator to the workers of a process pool. The
+        unpickled evaluator can determine the status and SN2 of any set but
+        cannot create `Totoro.Set` instances.
+
+        """
+
+        for ii in range(self.nExposures):
+            if self.valid[ii]:
+                self._getActivePlugging(ii)
+
+        state = self.__dict__.copy()
+        state['exposures'] = None
+        state['_sets'] = {}
+
+        return state
+
+    def _loadExposureData(self):
+        """Caches the properties of the exposures used by `checkSet`."""
+
+        nExp = self.nExposures
+
+        self.valid = np.zeros(nExp, bool)
+        self.isMock = np.zeros(nExp, bool)
+        self.ditherPositions = []
+        self.seeing = np.zeros(nExp) * np.nan
+        self.sn2 = np.zeros((nExp, 4)) * np.nan
+        self.haRanges = np.zeros((nExp, 2))
+        self.pluggings = np.zeros(nExp, int)
+
+        for ii, exp in enumerate(self.exposures):
+
+            dither = exp.ditherPosition
+            self.ditherPositions.append(dither)
+            self.isMock[ii] = exp.isMock
+
+            if dither is None:
+                # Checks the validity using a temporary dither position, as
+                # getOptimalSet does with the mock sets.
+                exp.ditherPosition = config['set']['ditherPositions'][0]
+                self.valid[ii] = exp.checkExposure(flag=False)[0]
+                exp.ditherPosition = None
+            else:
+                self.valid[ii] = exp.checkExposure(flag=False)[0]
+
+            # Sets with invalid exposures are bad, so we don't need the rest
+            # of the information.
+            if not self.valid[ii]:
+                continue
+
+            if exp.seeing is not None:
+                self.seeing[ii] = exp.seeing
+            self.sn2[ii] = exp.getSN2Array()
+            self.haRanges[ii] = exp.getHA()
+
+            plugging = exp.getPlugging()
+            self.pluggings[ii] = plugging.pk if plugging is not None else 0
+
+    def _getPairCompatibility(self):
+        """Returns a boolean matrix with the pairwise compatibility.
+
+        The element ``[ii, jj]`` is True if exposures ``ii`` and ``jj`` can be
+        in the same set. The diagonal is True if the exposure is valid and its
+        HA span is within the limits.
+
+        """
+
+        nExp = self.nExposures
+
+        maxSN2Factor = config['set']['maxSN2Factor']
+        maxSeeingRange = config['set']['maxSeeingRange']
+        maxHARange = config['set']['maxHARange']
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sn2Ratio = self.sn2[:, np.newaxis, :] / self.sn2[np.newaxis, :, :]
+        sn2Ratio[np.isnan(sn2Ratio)] = maxSN2Factor
+        sn2Compatible = ~np.any((sn2Ratio > maxSN2Factor) |
+                                (sn2Ratio < (1. / maxSN2Factor)), axis=2)
+
+        with np.errstate(invalid='ignore'):
+            seeingCompatible = ~(np.abs(self.seeing[:, np.newaxis] -
+                                        self.seeing[np.newaxis, :]) >
+                                 maxSeeingRange)
+
+        pluggingCompatible = (self.pluggings[:, np.newaxis] ==
+                              self.pluggings[np.newaxis, :])
+
+        ditherCompatible = np.ones((nExp, nExp), bool)
+        haCompatible = np.zeros((nExp, nExp), bool)
+
+        for ii in range(nExp):
+            if not self.valid[ii]:
+                continue
+            haCompatible[ii, ii] = (intervals.intervalLength(
+                self.haRanges[ii]) <= maxHARange)
+            for jj in range(ii + 1, nExp):
+                if not self.valid[jj]:
+                    continue
+                if (self.ditherPositions[ii] is not None and
+                        self.ditherPositions[ii] ==
+                        self.ditherPositions[jj]):
+                    ditherCompatible[ii, jj] = ditherCompatible[jj, ii] = False
+                haLength = self._calculateHALength((ii, jj))
+                haCompatible[ii, jj] = haCompatible[jj, ii] = (haLength <=
+                                                               maxHARange)
+
+        return (self.valid[:, np.newaxis] & self.valid[np.newaxis, :] &
+                sn2Compatible & seeingCompatible & pluggingCompatible &
+                ditherCompatible & haCompatible)
+
+    def _calculateHALength(self, key):
+        """Calculates the HA span of a set, as `Set.getHA` does."""
+
+        haRange = intervals.getMinMaxIntervalSequence(
+            self.haRanges[list(key)])
+
+        return intervals.intervalLength(haRange)
+
+
+    def _getActivePlugging(self, index):
+        """Returns the pk of the active plugging for an exposure or None."""
+
+        if index not in self._activePluggings:
+            plugging = self.exposures[index].getActivePlugging()
+            self._activePluggings[index] = (plugging.pk if plugging is not None
+                                            else None)
+
+        return self._activePluggings[index]
+
+    def getKey(self, indices):
+        """Returns the key (sorted tuple of indices) of a set."""
+
+        return tuple(sorted(ii for ii in indices if ii is not None))
+
+    def getSet(self, indices):
+        """Returns the mock `Totoro.Set` for a tuple of indices."""
+
+        from Totoro.dbclasses import Set
+
+        key = self.getKey(indices)
+        if key not in self._sets:
+            self._sets[key] = Set.fromExposures(
+                [self.exposures[ii] for ii in key])
+
+        return self._sets[key]
+
+    def _checkSet(self, key):
+        """Returns the status of a set, following the logic in `checkSet`."""
+
+        nExp = len(key)
+
+        if nExp == 0:
+            return 'Incomplete'
+
+        indices = list(key)
+
+        if not np.all(self.valid[indices]):
+            return 'Bad'
+
+        if nExp > self.nDithers:
+            return 'Bad'
+
+        if not np.all(self.compatible[np.ix_(indices, indices)]):
+            return 'Bad'
+
+        if (nExp > 2 and
+                self._calculateHALength(key) > config['set']['maxHARange']):
+            return 'Bad'
+
+        if nExp < self.nDithers:
+
+            if not np.all(self.isMock[indices]):
+                activePlugging = None
+                for ii in indices:
+                    activePlugging = self._getActivePlugging(ii)
+                    if activePlugging is not None:
+                        break
+                if self.pluggings[indices[0]] != activePlugging:
+                    return 'Unplugged'
+
+            return 'Incomplete'
+
+        if np.mean(self.seeing[indices]) > config['set']['goodSeeing']:
+            return 'Bad'
+
+        return 'Good'
+
+    def getStatus(self, indices):
+        """Returns the status label of the set formed by `indices`."""
+
+        key = self.getKey(indices)
+        if key not in self._status:
+            self._status[key] = self._checkSet(key)
+
+        return self._status[key]
+
+    def iterGoodSets(self, indices, seed=()):
+        """Yields the keys of the good sets that can be formed.
+
+        Each set contains the exposures in `seed` and exposures from
+        `indices`. Sets are built by adding, one at a time, exposures that are
+        compatible with all the ones already in the set, so only the
+        combinations allowed by the pairwise constraints are tested.
+
+        """
+
+        seed = tuple(seed)
+        indices = list(indices)
+
+        if len(seed) == self.nDithers:
+            if self.getStatus(seed) in ['Good', 'Excellent']:
+                yield self.getKey(seed)
+            return
+
+        for nn, ii in enumerate(indices):
+            if ii in seed:
+                continue
+            if not all(self.compatible[ii, jj] for jj in seed + (ii, )):
+                continue
+            for key in self.iterGoodSets(indices[nn + 1:], seed + (ii, )):
+                yield key
+
+    def getSN2Array(self, indices):
+        """Returns the cumulated SN2 array of the exposures in a set."""
+
+        key = self.getKey(indices)
+        if len(key) == 0:
+            return np.zeros(4)
+
+        return np.nansum(self.sn2[list(key)], axis=0)
+
+    def getSN2(self, indices):
+        """Returns the SN2 array the set contributes to the plate."""
+
+        if self.getStatus(indices) in _validStatuses:
+            return np.nan_to_num(self.getSN2Array(indices))
+        else:
+            return np.zeros(4)
+
+    def getLST(self, indices):
+        """Returns the LST range of a set, as `Set.getLST` does."""
+
+        key = self.getKey(indices)
+        validIndices = [ii for ii in key if self.valid[ii]]
+
+        ra, dec = self.exposures[key[0]].getCoordinates()
+
+        if len(validIndices) == 0:
+            plateHALimit = mlhalimit(dec)
+            ha = np.array([-plateHALimit, plateHALimit])
+        else:
+            ha = np.array(intervals.getMinMaxIntervalSequence(
+                self.haRanges[validIndices]))
+
+        ha[ha > 180] -= 360
+
+        return (ha + ra) % 360. / 15
+
+    def getExposureSN2(self, index):
+        """Returns the SN2 array of a single exposure."""
+
+        return self.sn2[index]
+
+    def fixBadSets(self, arrangement):
+        """Splits bad sets into a series of valid, incomplete sets.
+
+        Equivalent to `plate_utils.fixBadSets` but working on a list of set
+        keys. Returns a new list of keys.
+
+        """
+
+        toKeep = []
+        toAdd = []
+
+        for indices in arrangement:
+
+            key = self.getKey(indices)
+
+            if self.getStatus(key) != 'Bad':
+                toKeep.append(key)
+                continue
+
+            if len(key) == 1:
+                raise exceptions.TotoroError(
+                    'found bad set with one exposure. This is probably a bug.')
+            elif len(key) == 2:
+                toAdd += [(ii, ) for ii in key]
+            else:
+                validPairs = [pair for pair in itertools.combinations(key, 2)
+                              if self.getStatus(pair) != 'Bad']
+
+                if len(validPairs) == 0:
+                    toAdd += [(ii, ) for ii in key]
+                else:
+                    signalToNoise = [np.nansum(self.getSN2Array(pair))
+                                     for pair in validPairs]
+                    maxPair = validPairs[np.argmax(signalToNoise)]
+                    toAdd.append(maxPair)
+                    toAdd.append(tuple(ii for ii in key
+                                       if ii not in maxPair))
+
+        return toKeep + toAdd
+
+
+class ArrangementSelector(object):
+    """Streaming selection of the optimal set arrangement.
+
+    Arrangements (lists of set keys, as returned by `SetEvaluator.getKey`) are
+    added in order using `add`. Only arrangements with completion within
+    `factor` of the running maximum are considered, as `rearrangeSets` does,
+    and of those the selector only keeps the ones that
+    `plate_utils.selectOptimalArrangement` could still choose: the one with
+    the maximum completion and fewest sets and, while no arrangement
+    completes the plate, a heap with the ones with completion per set within
+    `factor` of the maximum. The heap keeps at most `maxCandidates`
+    arrangements, those with the largest completion per set and, on ties,
+    the ones added first. `select` returns the same arrangement that
+    `selectOptimalArrangement` would return for the full list of candidates
+    as long as no more than `maxCandidates` arrangements are within `factor`
+    of the maximum completion per set.
+
+    Parameters
+    ----------
+    evaluator : `SetEvaluator`
+        The evaluator used to fix bad sets and to create the sets of the
+        selected arrangement.
+    offset : float
+        A completion to add to that of each arrangement before the selection
+        (e.g., the completion of the good sets that are not being rearranged).
+    extraSets : list or None
+        A list of `Totoro.Set` instances that are added to each arrangement
+        (e.g., the overridden sets).
+    factor : float or None
+        Defaults to `config.setArrangement.factor`.
+    maxCandidates : int or None
+        The maximum number of arrangements in the heap. Defaults to
+        `config.setArrangement.maxCandidates`.
+
+    """
+
+    def __init__(self, evaluator, offset=0., extraSets=None, factor=None,
+                 maxCandidates=None):
+
+        self.evaluator = evaluator
+        self.offset = offset
+        self.extraSets = [] if extraSets is None else list(extraSets)
+        self.factor = (config['setArrangement']['factor']
+                       if factor is None else factor)
+        self.maxCandidates = (config['setArrangement']['maxCandidates']
+                              if maxCandidates is None else maxCandidates)
+
+        self.nCandidates = 0
+
+        self._runningMax = None
+        self._maxCompletion = None
+        self._maxRatio = None
+        self._complete = None
+        self._heap = []
+
+    def add(self, completion, arrangement):
+        """Adds an arrangement. Returns True if it is a candidate."""
+
+        if (self._runningMax is not None and
+                completion < self.factor * self._runningMax):
+            return False
+
+        if self._runningMax is None or completion > self._runningMax:
+            self._runningMax = completion
+
+        keys = tuple(self.evaluator.fixBadSets(arrangement))
+        nSets = len(keys) + len(self.extraSets)
+        completion += self.offset
+
+        index = self.nCandidates
+        candidate = (index, completion, keys)
+        self.nCandidates += 1
+
+        # Of the arrangements with maximum completion, keeps the first one
+        # with the fewest sets.
+        if self._maxCompletion is None or completion > self._maxCompletion:
+            self._maxCompletion = completion
+            self._complete = candidate
+        elif (completion == self._maxCompletion and
+                len(keys) < len(self._complete[2])):
+            self._complete = candidate
+
+        if self._maxCompletion > 1:
+            # Once an arrangement completes the plate, only the ones with
+            # maximum completion can be selected.
+            self._heap = []
+            return True
+
+        ratio = completion / nSets
+        if self._maxRatio is None or ratio > self._maxRatio:
+            self._maxRatio = ratio
+
+        # The heap is sorted by ratio and, for equal ratios, pops the
+        # arrangements added last.
+        minRatio = self.factor * self._maxRatio
+        if ratio >= minRatio:
+            if len(self._heap) < self.maxCandidates:
+                heapq.heappush(self._heap, (ratio, -index, candidate))
+            else:
+                heapq.heappushpop(self._heap, (ratio, -index, candidate))
+
+        while len(self._heap) > 0 and self._heap[0][0] < minRatio:
+            heapq.heappop(self._heap)
+
+        return True
+
+    def _getLSTDiff(self, keys, LST):
+        """Returns the cumulated LST difference of an arrangement."""
+
+        LSTdiff = []
+        for key in keys:
+            setMeanLST = intervals.calculateMean(self.evaluator.getLST(key),
+                                                 wrapAt=24.)
+            LSTdiff.append((setMeanLST - LST) % 24.)
+        for ss in self.extraSets:
+            setMeanLST = intervals.calculateMean(ss.getLST(), wrapAt=24.)
+            LSTdiff.append((setMeanLST - LST) % 24.)
+
+        return np.sum(LSTdiff)
+
+    def select(self, LST=None):
+        """Returns the optimal arrangement as a list of `Totoro.Set`.
+
+        Follows the same criteria as `plate_utils.selectOptimalArrangement`.
+        Returns None if no arrangement has been added.
+
+        """
+
+        if self.nCandidates == 0:
+            return None
+
+        if self._maxCompletion > 1:
+            keys = self._complete[2]
+        else:
+            minRatio = self.factor * self._maxRatio
+            topCandidates = sorted(candidate
+                                   for ratio, __, candidate in self._heap
+                                   if ratio >= minRatio)
+
+            if len(topCandidates) == 1:
+                keys = topCandidates[0][2]
+            else:
+                if LST is None:
+                    LST = site.localSiderealTime()
+                cumulatedLSTdiffs = [self._getLSTDiff(candidate[2], LST)
+                                     for candidate in topCandidates]
+                keys = topCandidates[np.argmin(cumulatedLSTdiffs)][2]
+
+        return [self.evaluator.getSet(key) for key in keys] + self.extraSets
+
+
+def _getSkyline(candidates, maxCandidates):
+    """Returns the candidates that can be in a top list of `maxCandidates`.
+
+    ``candidates`` is a list of tuples ``(ratio, completion, candidate)``.
+    Returns the ones for which fewer than `maxCandidates` candidates with
+    equal or larger completion rank higher (larger ratio or, for equal
+    ratios, lower index).
+
+    """
+
+    ranked = sorted(candidates, key=lambda item: (-item[0], item[2][0]))
+
+    # The largest completions of the candidates already ranked.
+    largest = []
+    skyline = []
+
+    for item in ranked:
+        completion = item[1]
+        if len(largest) < maxCandidates:
+            skyline.append(item)
+            heapq.heappush(largest, completion)
+        elif largest[0] < completion:
+            skyline.append(item)
+            heapq.heappushpop(largest, completion)
+
+    return skyline
+
+
+def reduceCandidates(evaluator, candidates, offset=0., nExtraSets=0,
+                     maxCandidates=None):
+    """Returns the candidates that `ArrangementSelector` may select.
+
+    `candidates` is an iterable of tuples ``(index, completion,
+    arrangement)`` for a contiguous range of permutations, including those
+    with completion within `config.setArrangement.factor` of the running
+    maximum of the range. Only the candidates that the maximum completion of
+    the permutations before the range does not discard are added to the
+    selector, so, independently of its value, the selector only needs the
+    candidate with maximum completion and fewest sets and, for any minimum
+    completion, the `maxCandidates` with largest completion per set. Those
+    are returned, sorted by index. The memory used is proportional to the
+    number of candidates returned.
+
+    Parameters
+    ----------
+    evaluator : `SetEvaluator`
+        The evaluator used to fix bad sets.
+    candidates : iterable
+        The candidates, sorted by index.
+    offset : float
+        The completion to add to each arrangement, as in
+        `ArrangementSelector`.
+    nExtraSets : int
+        The number of extra sets added to each arrangement by the selector.
+    maxCandidates : int or None
+        The maximum number of arrangements in the heap of the selector.
+        Defaults to `config.setArrangement.maxCandidates`.
+
+    """
+
+    maxCandidates = (config['setArrangement']['maxCandidates']
+                     if maxCandidates is None else maxCandidates)
+
+    kept = []
+    complete = None
+    maxKept = 2 * maxCandidates
+
+    for candidate in candidates:
+
+        __, completion, arrangement = candidate
+
+        nKeys = len(evaluator.fixBadSets(arrangement))
+        ratio = (completion + offset) / (nKeys + nExtraSets)
+
+        # Same criteria as ArrangementSelector.add.
+        if (complete is None or completion > complete[1] or
+                (completion == complete[1] and nKeys < complete[0])):
+            complete = (nKeys, completion, candidate)
+
+        kept.append((ratio, completion, candidate))
+
+        if len(kept) >= maxKept:
+            kept = _getSkyline(kept, maxCandidates)
+            maxKept = 2 * max(len(kept), maxCandidates)
+
+    if complete is None:
+        return []
+
+    reduced = dict((item[2][0], item[2])
+                   for item in _getSkyline(kept, maxCandidates))
+    reduced[complete[2][0]] = complete[2]
+
+    return [reduced[index] for index in sorted(reduced)]
+
+
+class BranchAndBound(object):
+    """Finds the candidate set arrangements using branch and bound.
+
+    Explores the same arrangements as `calculatePermutations`, and in the same
+    order: the exposures of the most repeated dither position seed the sets,
+    and the exposures of each other dither position are distributed, at most
+    one per set. Instead of testing every permutation, each partial
+    arrangement is given an upper bound for the plate completion it can reach
+    (the SN2 of the sets that cannot change plus the SN2 of every exposure
+    that could still end up in a valid set). Branches whose bound is lower
+    than `factor` times the best completion found so far are discarded. As
+    `rearrangeSets` only keeps the permutations whose completion is within
+    `factor` of the running maximum, the candidates returned are the same as
+    those of the exhaustive search, with each permutation returned only once.
+
+    Parameters
+    ----------
+    ditherPositions : list
+        The dither position of each exposure.
+    evaluator : `SetEvaluator`
+        The object used to determine the status and SN2 of a set, from the
+        indices of its exposures.
+    baseSN2 : `numpy.ndarray` or None
+        SN2 to add to each arrangement (e.g., from overridden sets).
+    factor : float or None
+        Arrangements with completion >= `factor` times the running maximum
+        are returned. Defaults to `config.setArrangement.factor`.
+    maxNodes : int or None
+        If not None, the search is aborted after testing `maxNodes` partial
+        or complete arrangements and `aborted` is set to True.
+
+    """
+
+    def __init__(self, ditherPositions, evaluator, baseSN2=None, factor=None,
+                 maxNodes=None):
+
+        self.ditherPositions = list(ditherPositions)
+        self.evaluator = evaluator
+        self.baseSN2 = (np.zeros(4) if baseSN2 is None
+                        else np.array(baseSN2, np.float))
+        self.factor = (config['setArrangement']['factor']
+                       if factor is None else factor)
+        self.maxNodes = maxNodes
+        self.nDithers = len(config['set']['ditherPositions'])
+
+        self.nNodes = 0
+        self.aborted = False
+        self._best = None
+
+        groups = collections.defaultdict(list)
+        for ii, dither in enumerate(self.ditherPositions):
+            groups[dither].append(ii)
+
+        # Groups sorted as calculatePermutations does: by decreasing size
+        # and, for groups of the same size, by reverse order of dither.
+        self._groups = sorted([groups[dither] for dither in sorted(groups)],
+                              key=len)[::-1]
+        self._nSlots = len(self._groups[0]) if len(self._groups) > 0 else 0
+
+        self._expSN2 = [np.nan_to_num(evaluator.getExposureSN2(ii))
+                        for ii in range(len(self.ditherPositions))]
+
+    def _isAlive(self, slot, nGroupsLeft):
+        """Returns True if ``slot`` can still become a valid, complete set."""
+
+        if len(slot) + nGroupsLeft < self.nDithers:
+            return False
+        if len(slot) == 1:
+            return True
+
+        return self.evaluator.getStatus(slot) in ['Incomplete', 'Unplugged']
+
+    def _bound(self, slots, group, nn, remaining):
+        """Returns an upper bound for the completion of a partial solution.
+
+        ``group`` and ``nn`` are the group and slot for which the next
+        exposure will be selected, and ``remaining`` the exposures of
+        ``group`` not yet placed.
+
+        """
+
+        nGroupsLeft = len(self._groups) - group
+
+        sn2 = self.baseSN2.copy()
+        anyAlive = False
+
+        for mm, slot in enumerate(slots):
+            slotGroupsLeft = nGroupsLeft if mm >= nn else nGroupsLeft - 1
+            if slotGroupsLeft == 0 or len(slot) == self.nDithers:
+                sn2 += self.evaluator.getSN2(slot)
+            elif self._isAlive(slot, slotGroupsLeft):
+                anyAlive = True
+                for ii in slot:
+                    sn2 += self._expSN2[ii]
+
+        if anyAlive:
+            for ii in remaining:
+                sn2 += self._expSN2[ii]
+            for nextGroup in self._groups[group + 1:]:
+                for ii in nextGroup:
+                    sn2 += self._expSN2[ii]
+
+        return getCompletionFromSN2(sn2)
+
+    def _evaluate(self, slots):
+        """Returns the candidate for a complete arrangement or None."""
+
+        arrangement = [self.evaluator.getKey(slot) for slot in slots]
+
+        # Same calculation as in plate_utils._evaluatePermutations.
+        plateSN2 = self.baseSN2 + np.sum([self.evaluator.getSN2(key)
+                                          for key in arrangement], axis=0)
+        completion = getCompletionFromSN2(plateSN2)
+
+        candidate = None
+        if self._best is None or completion >= self.factor * self._best:
+            candidate = (completion, arrangement)
+
+        if self._best is None or completion > self._best:
+            self._best = completion
+
+        return candidate
+
+    def _branch(self, slots, group, nn, remaining):
+        """Yields the candidates that complete a partial arrangement.
+
+        The exposures of each group are assigned to the slots in order, as
+        `itertools.permutations` does in `calculatePermutations`: slot ``nn``
+        receives each of the ``remaining`` exposures of ``group``, in order,
+        and finally no exposure if there are more slots than exposures left.
+
+        """
+
+        if self.maxNodes is not None and self.nNodes >= self.maxNodes:
+            self.aborted = True
+            return
+
+        self.nNodes += 1
+
+        if nn == self._nSlots:
+            group += 1
+            nn = 0
+            remaining = (self._groups[group]
+                         if group < len(self._groups) else [])
+
+        if group == len(self._groups):
+            candidate = self._evaluate(slots)
+            if candidate is not None:
+                yield candidate
+            return
+
+        if (self._best is not None and
+                self._bound(slots, group, nn, remaining) <
+                self.factor * self._best - _boundTolerance):
+            return
+
+        options = list(remaining)
+        if len(remaining) < self._nSlots - nn:
+            options.append(None)
+
+        for index in options:
+            newSlots = list(slots)
+            if index is not None:
+                newSlots[nn] = slots[nn] + (index, )
+            newRemaining = [ii for ii in remaining if ii != index]
+            for candidate in self._branch(newSlots, group, nn + 1,
+                                          newRemaining):
+                yield candidate
+            if self.aborted:
+                return
+
+    def run(self):
+        """Runs the search.
+
+        Yields
+        ------
+        candidate : tuple
+            Tuples ``(completion, arrangement)``, in which ``arrangement`` is
+            a list of set keys, for the arrangements with completion within
+            ``factor`` of the running maximum, in the order in which
+            `calculatePermutations` returns them.
+
+        """
+
+        self.nNodes = 0
+        self.aborted = False
+        self._best = None
+
+        if len(self._groups) == 0:
+            return
+
+        seedSlots = [(ii, ) for ii in self._groups[0]]
+        for candidate in self._branch(seedSlots, 0, self._nSlots, []):
+            yield candidate
@@ -16,14 +16,19 @@ from __future__ import division
 from __future__ import print_function
 from Totoro.exceptions import TotoroError, NoMangaExposure
 from Totoro.db import getConnectionFull
-from Totoro import log, config, site, dustMap
+from Totoro.dbclasses.flagging import getActiveBuffer
+from Totoro import log, config, getDustMap
 from Totoro import utils
+from Totoro.utils import astro
 import numpy as np
 from astropy import time
+import datetime
 from sqlalchemy.orm.exc import NoResultFound
+import collections
 import warnings
+import weakref
 
-__all__ = ['Exposure', 'checkExposure']
+__all__ = ['Exposure', 'MockExposure', 'checkExposure']
 
 
 class Exposure(object):
@@ -155,13 +160,16 @@ class Exposure(object):
     def createMockExposure(cls, startTime=None, expTime=None, plugging=None,
                            ditherPosition=None, ra=None, dec=None,
                            silent=False, sn2values=None, **kwargs):
-        """Creates a mock exposure instance."""
+        """Creates a mock exposure instance.
+
+        `startTime` is the JD (UTC) at which the exposure starts.
+
+        """
 
         if ra is None or dec is None:
             raise TotoroError('ra and dec must be specified')
 
-        newExposure = Exposure(None, mock=True, ra=ra, dec=dec, **kwargs)
-        newExposure.pk = None if 'pk' not in kwargs else kwargs['pk']
+        newExposure = MockExposure(ra=ra, dec=dec, pk=kwargs.get('pk', None))
 
         if startTime is None:
             startTime = time.Time.now().jd
@@ -171,11 +179,8 @@ class Exposure(object):
 
         newExposure.ditherPosition = ditherPosition
 
-        tt = time.Time(startTime, format='jd', scale='tai')
-        t0 = time.Time(0, format='mjd', scale='tai')
-        startTimePlateDB = (tt - t0).sec
-
-        newExposure.start_time = startTimePlateDB
+        newExposure.start_time = astro.jdToTAISeconds(
+            astro.utcToTAI(startTime))
         newExposure.exposure_time = expTime
         newExposure._plugging = plugging
 
@@ -206,6 +211,7 @@ class Exposure(object):
         if dust is not None:
             self._dust = dust
         else:
+            dustMap = getDustMap()
             if dustMap is not None:
                 self._dust = dustMap(self.ra, self.dec)
             else:
@@ -262,10 +268,9 @@ class Exposure(object):
         startTime = float(self.start_time)
         expTime = float(self.exposure_time)
 
-        t0 = time.Time(0, format='mjd', scale='tai')
-        tStart = t0 + time.TimeDelta(startTime, format='sec', scale='tai')
-
-        lst = site.localSiderealTime(tStart.jd)
+        # The start time is in TAI, while the LST is calculated from UTC.
+        lst = astro.localSiderealTime(
+            astro.taiToUTC(astro.taiSecondsToJD(startTime)))
         ha0 = (lst * 15. - self.ra) % 360.
 
         ha = np.array([ha0, ha0 + expTime / 3600. * 15]) % 360.
@@ -370,15 +375,8 @@ class Exposure(object):
         format is 'str', it returns a tuple with the UT0 and UT1 strings. If
         None or 'datetime', a tuple with datetime instances is returned."""
 
-        startTime = float(self.start_time)
-        t0 = time.Time(0, format='mjd', scale='tai')
-
-        tStart = t0 + time.TimeDelta(startTime, format='sec', scale='tai')
-        tEnd = tStart + time.TimeDelta(float(self.exposure_time), format='sec',
-                                       scale='tai')
-
-        ut0 = tStart.datetime
-        ut1 = tEnd.datetime
+        ut0 = astro.jdToDatetime(self.getJD()[0])
+        ut1 = ut0 + datetime.timedelta(seconds=float(self.exposure_time))
 
         if format == 'str':
             return ('{0:%H:%M}'.format(ut0), '{0:%H:%M}'.format(ut1))
@@ -388,16 +386,12 @@ class Exposure(object):
         return (ut0, ut1)
 
     def getJD(self):
-        """Returns the JD interval in which this exposure was taken."""
-
-        startTime = float(self.start_time)
-        t0 = time.Time(0, format='mjd', scale='tai')
+        """Returns the JD (UTC) interval in which this exposure was taken."""
 
-        tStart = t0 + time.TimeDelta(startTime, format='sec', scale='tai')
-        tEnd = tStart + time.TimeDelta(
-            float(self.exposure_time), format='sec', scale='tai')
+        jd0 = astro.taiToUTC(astro.taiSecondsToJD(float(self.start_time)))
+        jd1 = jd0 + float(self.exposure_time) / 86400.
 
-        return (tStart.jd, tEnd.jd)
+        return (jd0, jd1)
 
     def getPlatePK(self):
         """Returns the pk of the plate associated to this plate."""
@@ -469,6 +463,297 @@ class Exposure(object):
         return utils.computeAirmass(self.dec, midHA)
 
 
+# Stands in for the mangaDB.Exposure of a mock exposure.
+_MockMangaExposure = collections.namedtuple(
+    '_MockMangaExposure', ['pk', 'transparency', 'status'])
+
+
+class MockExposureTable(object):
+    """A columnar store for the data of mock exposures.
+
+    The values of each `MockExposure` are kept in a row of a structured
+    array, so that simulations with many mock exposures do not allocate a
+    NumPy array and a dictionary per exposure, and the SN2 of many exposures
+    can be retrieved with a single indexing operation. The rows of deleted
+    exposures are recycled and the array doubles its size when it is full.
+
+    The row of an exposure is released by a weak reference callback when the
+    exposure is garbage collected. A `__del__` method would prevent exposures
+    in reference cycles (e.g., with their sets) from being collected.
+
+    """
+
+    dtype = np.dtype([('start_time', np.float64),
+                      ('exposure_time', np.float64),
+                      ('ra', np.float64),
+                      ('dec', np.float64),
+                      ('seeing', np.float64),
+                      ('airmass', np.float64),
+                      ('mlhalimit', np.float64),
+                      ('valid', np.int8),
+                      ('sn2', np.float64, (4, )),
+                      ('haRange', np.float64, (2, )),
+                      ('dust', np.float64, (2, )),
+                      ('hasSN2', np.bool_),
+                      ('hasHARange', np.bool_),
+                      ('hasDust', np.bool_)])
+
+    def __init__(self, size=1024):
+
+        emptyRow = np.zeros(1, dtype=self.dtype)
+        for name in ['start_time', 'exposure_time', 'ra', 'dec', 'seeing',
+                     'airmass', 'mlhalimit', 'sn2', 'haRange', 'dust']:
+            emptyRow[name] = np.nan
+        emptyRow['valid'] = -1
+        self._emptyRow = emptyRow[0]
+
+        self.data = np.empty(size, dtype=self.dtype)
+        self.data[:] = self._emptyRow
+        self.nRows = 0
+
+        self._free = []
+        self._refs = {}
+        self._updateColumns()
+
+    def __len__(self):
+        return self.nRows - len(self._free)
+
+    def _updateColumns(self):
+        """Caches a view of each column of the table."""
+
+        self.columns = dict((name, self.data[name])
+                            for name in self.dtype.names)
+
+    def allocate(self, owner=None):
+        """Returns the index of an empty row.
+
+        If ``owner`` is defined, the row is released when ``owner`` is
+        garbage collected.
+
+        """
+
+        if len(self._free) > 0:
+            index = self._free.pop()
+        else:
+            if self.nRows == len(self.data):
+                newData = np.empty(2 * len(self.data), dtype=self.dtype)
+                newData[:self.nRows] = self.data
+                newData[self.nRows:] = self._emptyRow
+                self.data = newData
+                self._updateColumns()
+
+            self.nRows += 1
+            index = self.nRows - 1
+
+        if owner is not None:
+            self._refs[index] = weakref.ref(owner,
+                                            self._getReleaseCallback(index))
+
+        return index
+
+    def _getReleaseCallback(self, index):
+        """Returns a weak reference callback that releases a row."""
+
+        def callback(ref):
+            if self._refs.get(index) is ref:
+                self.release(index)
+
+        return callback
+
+    def release(self, index):
+        """Empties a row and makes it available for new exposures."""
+
+        self._refs.pop(index, None)
+        self.data[index] = self._emptyRow
+        self._free.append(index)
+
+    def getSN2Array(self, indices):
+        """Returns an array with the SN2 of the rows in ``indices``."""
+
+        return self.columns['sn2'][indices]
+
+
+def _tableColumn(column, flag=None):
+    """Returns a property that reads and writes a column of the mock exposure
+    table. None values are stored as NaN or, if ``flag`` is defined, setting
+    the boolean column ``flag`` to False."""
+
+    def getter(self):
+        columns = mockExposureTable.columns
+        if flag is None:
+            value = columns[column][self._index]
+            return None if np.isnan(value) else value
+        elif columns[flag][self._index]:
+            return columns[column][self._index].copy()
+        else:
+            return None
+
+    def setter(self, value):
+        columns = mockExposureTable.columns
+        if flag is None:
+            columns[column][self._index] = np.nan if value is None else value
+        else:
+            columns[flag][self._index] = value is not None
+            if value is not None:
+                columns[column][self._index] = value
+
+    return property(getter, setter)
+
+
+class MockExposure(object):
+    """A lightweight mock exposure that never touches the database.
+
+    Implements the same public API as a mock `Exposure` but uses `__slots__`
+    and plain attribute access instead of opening a session and proxying
+    attributes through the SQLAlchemy mapper. Instances are created by
+    `Exposure.createMockExposure`.
+
+    The numerical values of the exposure are stored in a row of
+    `mockExposureTable`, so the instance is only a view of that row. Copies
+    and unpickled instances get a new row. The row is released when the
+    instance is garbage collected.
+
+    """
+
+    __slots__ = ('_index', 'pk', 'exposure_no', '_ditherPosition',
+                 '_plugging', '__weakref__')
+
+    # The slots saved by __getstate__
+    _stateSlots = ('pk', 'exposure_no', '_ditherPosition', '_plugging')
+
+    _mangaExposure = _MockMangaExposure(None, None, None)
+    mangadbExposure = ()
+    status = None
+    isMock = True
+
+    start_time = _tableColumn('start_time')
+    exposure_time = _tableColumn('exposure_time')
+    _ra = _tableColumn('ra')
+    _dec = _tableColumn('dec')
+    _seeing = _tableColumn('seeing')
+    _airmass = _tableColumn('airmass')
+    _mlhalimit = _tableColumn('mlhalimit')
+    _sn2Array = _tableColumn('sn2', flag='hasSN2')
+    _haRange = _tableColumn('haRange', flag='hasHARange')
+
+    def __init__(self, ra=None, dec=None, pk=None):
+
+        self._index = mockExposureTable.allocate(owner=self)
+
+        self.pk = pk
+        self.exposure_no = None
+
+        self._ditherPosition = None
+        self._plugging = None
+
+        self._ra = ra
+        self._dec = dec
+
+    def __getstate__(self):
+
+        slots = dict((name, getattr(self, name))
+                     for name in self._stateSlots if hasattr(self, name))
+
+        return (slots, mockExposureTable.data[self._index].copy())
+
+    def __setstate__(self, state):
+
+        slots, row = state
+
+        self._index = mockExposureTable.allocate(owner=self)
+        mockExposureTable.data[self._index] = row
+
+        for name in slots:
+            setattr(self, name, slots[name])
+
+    @property
+    def _valid(self):
+        valid = mockExposureTable.columns['valid'][self._index]
+        return None if valid < 0 else bool(valid)
+
+    @_valid.setter
+    def _valid(self, value):
+        mockExposureTable.columns['valid'][self._index] = (
+            -1 if value is None else int(value))
+
+    @property
+    def _dust(self):
+        """The dust extinction, in the format returned by dustMap."""
+
+        if not mockExposureTable.columns['hasDust'][self._index]:
+            return None
+
+        gIncrease, iIncrease = mockExposureTable.columns['dust'][self._index]
+
+        return {'gIncrease': [gIncrease], 'iIncrease': [iIncrease]}
+
+    @_dust.setter
+    def _dust(self, value):
+
+        mockExposureTable.columns['hasDust'][self._index] = value is not None
+
+        if value is not None:
+            mockExposureTable.columns['dust'][self._index] = (
+                value['gIncrease'][0], value['iIncrease'][0])
+
+    def getCoordinates(self):
+        """Returns an array with the coordinates of the plate centre."""
+
+        return np.array([self._ra, self._dec], np.float)
+
+    # The rest of the API is shared with Exposure. None of these methods
+    # access the database for a mock exposure.
+    __repr__ = Exposure.__dict__['__repr__']
+    createMockExposure = Exposure.__dict__['createMockExposure']
+    simulateObservedParamters = Exposure.__dict__['simulateObservedParamters']
+    ra = Exposure.__dict__['ra']
+    dec = Exposure.__dict__['dec']
+    getHA = Exposure.__dict__['getHA']
+    getSN2Array = Exposure.__dict__['getSN2Array']
+    valid = Exposure.__dict__['valid']
+    isValid = Exposure.__dict__['isValid']
+    checkExposure = Exposure.__dict__['checkExposure']
+    ditherPosition = Exposure.__dict__['ditherPosition']
+    seeing = Exposure.__dict__['seeing']
+    getLST = Exposure.__dict__['getLST']
+    getUT = Exposure.__dict__['getUT']
+    getJD = Exposure.__dict__['getJD']
+    getMJD = Exposure.__dict__['getMJD']
+    mjd = Exposure.__dict__['mjd']
+    getPlugging = Exposure.__dict__['getPlugging']
+    getActivePlugging = Exposure.__dict__['getActivePlugging']
+    mlhalimit = Exposure.__dict__['mlhalimit']
+    getMeanAirmass = Exposure.__dict__['getMeanAirmass']
+
+
+mockExposureTable = MockExposureTable()
+
+
+def getExposuresSN2(exposures):
+    """Returns an array with the SN2 arrays of a list of exposures.
+
+    The SN2 of the mock exposures in the list are read from
+    `mockExposureTable` using a single indexing operation.
+
+    """
+
+    sn2 = np.zeros((len(exposures), 4))
+
+    mockRows = []
+    mockIndices = []
+    for ii, exp in enumerate(exposures):
+        if isinstance(exp, MockExposure):
+            mockRows.append(ii)
+            mockIndices.append(exp._index)
+        else:
+            sn2[ii] = exp.getSN2Array()
+
+    if len(mockRows) > 0:
+        sn2[mockRows] = mockExposureTable.getSN2Array(mockIndices)
+
+    return sn2
+
+
 def flagExposure(exposure, status, errorCode, flag=True, message=None):
     """Helper function to log and flag exposures."""
 
@@ -502,6 +787,9 @@ def setExposureStatus(exposure, status):
         mangaDB.ExposureStatus.label. If `status=None`, the status of the
         exposure is removed
 
+    If called within a `batchFlagging` block, the change is recorded and
+    applied when the block exits.
+
     Returns
     -------
     result : bool
@@ -518,27 +806,46 @@ def setExposureStatus(exposure, status):
     session = db.Session()
 
     if isinstance(exposure, Exposure):
-        pk = exposure._mangaExposure.pk
+        mangaExposure = exposure._mangaExposure
     elif isinstance(exposure, db.plateDB.Exposure):
-        pk = exposure.mangadbExposure[0].pk
+        mangaExposure = exposure.mangadbExposure[0]
     elif isinstance(exposure, db.mangaDB.Exposure):
-        pk = exposure.pk
+        mangaExposure = exposure
     else:
-        pk = exposure
+        mangaExposure = None
 
-    # Gets the status_pk for the desired status and flags the exposure.
-    with session.begin():
+    pk = exposure if mangaExposure is None else mangaExposure.pk
 
-        try:
-            if status is None:
-                statusPK = None
-            else:
-                queryStatus = session.query(db.mangaDB.ExposureStatus).filter(
-                    db.mangaDB.ExposureStatus.label == status).one()
-                statusPK = queryStatus.pk
-        except:
-            raise TotoroError('status {0} not found in mangaDB.ExposureStatus'
-                              .format(status))
+    # Gets the status_pk for the desired status.
+    try:
+        if status is None:
+            statusPK = None
+        else:
+            statusPK = db.lookupTables.getPK(db.mangaDB.ExposureStatus,
+                                             status)
+    except:
+        raise TotoroError('status {0} not found in mangaDB.ExposureStatus'
+                          .format(status))
+
+    buffer = getActiveBuffer()
+
+    if buffer is not None:
+        # Records the change, and the set from which the exposure must be
+        # removed if its status is Totoro Bad.
+        setPK = None
+        if status == 'Totoro Bad':
+            if mangaExposure is None:
+                mangaExposure = session.query(db.mangaDB.Exposure).get(pk)
+            setPK = mangaExposure.set_pk
+
+        buffer.addExposureStatus(pk, statusPK, setPK=setPK)
+        log.debug('mangaDB.Exposure.pk={0} will be set to {1}'
+                  .format(pk, status))
+
+        return True
+
+    # Flags the exposure.
+    with session.begin():
 
         try:
             exp = session.query(db.mangaDB.Exposure).get(pk)
@@ -609,7 +916,8 @@ def checkExposure(exposure, flag=True, force=False, **kwargs):
     """
 
     # Checks that exposure is a Totoro exposure.
-    assert isinstance(exposure, Exposure), 'input is not a Totoro exposure.'
+    assert isinstance(exposure, (Exposure, MockExposure)), \
+        'input is not a Totoro exposure.'
 
     pk = exposure._mangaExposure.pk
 
@@ -709,9 +1017,9 @@ def checkExposure(exposure, flag=True, force=False, **kwargs):
     # Checks altitude of the object. Skipped if exposure is mock.
     if config['exposure']['checkTwilight'] is True and not exposure.isMock:
         # Avoids this check for mock exposures as it slows down simulations.
+        from Totoro.scheduler.ephemeris import getEphemeris
         maxSunAltitude = config['exposure']['maxSunAltitude']
-        exposureDate = time.Time(exposure.getJD(), format='jd', scale='tai')
-        sunAltitude = site.getSunAltitude(exposureDate)
+        sunAltitude = getEphemeris().getSunAltitude(exposure.getJD())
 
         if np.any(sunAltitude > maxSunAltitude):
             message = ('Invalid exposure. plateDB.Exposure.pk={0}: '
@@ -97,14 +97,11 @@ class Fields(list):
 
         """
 
-        __, Session, plateDB, __ = getConnectionFull()
+        db, Session, plateDB, __ = getConnectionFull()
         session = Session()
 
         with session.begin():
-            plates = session.query(plateDB.Plate).join(
-                plateDB.PlateToSurvey, plateDB.Survey, plateDB.SurveyMode
-            ).filter(plateDB.Survey.label == 'MaNGA',
-                     plateDB.SurveyMode.label == 'MaNGA dither')
+            plates = TotoroPlate.queryMaNGAPlates(session, db)
 
             if acceptPriority1:
                 plates.join(plateDB.PlatePointing).filter(
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+flagging.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro.db import getConnection
+from Totoro import log
+from Totoro.exceptions import TotoroUserWarning
+from sqlalchemy import inspect, tuple_
+import collections
+import contextlib
+import functools
+import warnings
+
+
+__all__ = ['StatusBuffer', 'batchFlagging', 'flagInBatch', 'getActiveBuffer',
+           'flushActiveBuffer']
+
+
+# The buffer in which setExposureStatus and setSetStatus record the changes
+# while a batchFlagging block is running.
+_activeBuffer = None
+
+
+def _groupByValue(statuses):
+    """Returns a dictionary of lists of pks keyed by status pk."""
+
+    groups = collections.defaultdict(list)
+    for pk, statusPK in statuses.items():
+        groups[statusPK].append(pk)
+
+    return groups
+
+
+class StatusBuffer(object):
+    """Accumulates exposure and set status changes and applies them at once.
+
+    Only the last status recorded for each exposure or set is applied. If an
+    exposure is flagged `Totoro Bad`, the set it belonged to when it was
+    flagged is recorded, and the exposure is removed from that set when the
+    buffer is flushed (unless it has been assigned to a different set in the
+    meantime). Sets left without exposures are then deleted. This reproduces
+    what `setExposureStatus` does when no buffer is active.
+
+    """
+
+    def __init__(self):
+
+        self.exposureStatuses = collections.OrderedDict()
+        self.setStatuses = collections.OrderedDict()
+        self.removeFromSet = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.exposureStatuses) + len(self.setStatuses)
+
+    def addExposureStatus(self, pk, statusPK, setPK=None):
+        """Records the status of a mangaDB.Exposure.
+
+        If `setPK` is not None, the exposure will be removed from that set.
+
+        """
+
+        self.exposureStatuses[pk] = statusPK
+
+        if setPK is not None:
+            self.removeFromSet[pk] = setPK
+
+    def addSetStatus(self, pk, statusPK):
+        """Records the status of a mangaDB.Set."""
+
+        self.setStatuses[pk] = statusPK
+
+    def hasSetStatus(self, pk):
+        """Returns True if a status has been recorded for the set."""
+
+        return pk in self.setStatuses
+
+    def _warnRemovedStatuses(self, session, mangaDB):
+        """Warns about sets whose status will be removed."""
+
+        pks = [pk for pk, statusPK in self.setStatuses.items()
+               if statusPK is None]
+
+        if len(pks) == 0:
+            return
+
+        rows = session.query(mangaDB.Set.pk, mangaDB.SetStatus.label).join(
+            mangaDB.Set.status).filter(mangaDB.Set.pk.in_(pks)).all()
+
+        for pk, label in rows:
+            warnings.warn('changing set pk={0} from status {1} to None'
+                          .format(pk, label), TotoroUserWarning)
+
+    def _expireChanged(self, session, mangaDB):
+        """Expires the instances in the session changed by the buffer."""
+
+        exposurePKs = set(self.exposureStatuses)
+        setPKs = set(self.setStatuses) | set(self.removeFromSet.values())
+
+        # Uses the identity of the instances, which does not trigger a refresh
+        # if the instances have been expired.
+        for instance in list(session.identity_map.values()):
+            if isinstance(instance, mangaDB.Exposure):
+                pks = exposurePKs
+            elif isinstance(instance, mangaDB.Set):
+                pks = setPKs
+            else:
+                continue
+            if inspect(instance).identity[0] in pks:
+                session.expire(instance)
+
+    def flush(self):
+        """Applies all the recorded changes in a single transaction.
+
+        The statuses are set with one UPDATE per status value. Exposures
+        flagged `Totoro Bad` are removed from their sets with a single UPDATE,
+        and the sets left empty are deleted with a single DELETE.
+
+        """
+
+        if len(self) == 0:
+            return
+
+        db = getConnection()
+        session = db.Session()
+        mangaDB = db.mangaDB
+
+        with session.begin():
+
+            self._warnRemovedStatuses(session, mangaDB)
+
+            for statusPK, pks in _groupByValue(self.setStatuses).items():
+                session.query(mangaDB.Set).filter(
+                    mangaDB.Set.pk.in_(pks)).update(
+                        {'set_status_pk': statusPK}, synchronize_session=False)
+
+            for statusPK, pks in _groupByValue(self.exposureStatuses).items():
+                session.query(mangaDB.Exposure).filter(
+                    mangaDB.Exposure.pk.in_(pks)).update(
+                        {'exposure_status_pk': statusPK},
+                        synchronize_session=False)
+
+            if len(self.removeFromSet) > 0:
+                session.query(mangaDB.Exposure).filter(
+                    tuple_(mangaDB.Exposure.pk, mangaDB.Exposure.set_pk).in_(
+                        list(self.removeFromSet.items()))).update(
+                            {'set_pk': None}, synchronize_session=False)
+
+                session.query(mangaDB.Set).filter(
+                    mangaDB.Set.pk.in_(set(self.removeFromSet.values())),
+                    ~mangaDB.Set.exposures.any()).delete(
+                        synchronize_session=False)
+
+        # The updates do not modify the instances in the session. If the
+        # commit has not expired them, expires the ones that have changed.
+        if not session.expire_on_commit:
+            self._expireChanged(session, mangaDB)
+
+        log.debug('flagged {0} exposures and {1} sets'
+                  .format(len(self.exposureStatuses), len(self.setStatuses)))
+
+        self.exposureStatuses.clear()
+        self.setStatuses.clear()
+        self.removeFromSet.clear()
+
+
+def getActiveBuffer():
+    """Returns the active `StatusBuffer` or None."""
+
+    return _activeBuffer
+
+
+def flushActiveBuffer():
+    """Applies the changes in the active `StatusBuffer`, if any.
+
+    Must be called before deleting sets within a `batchFlagging` block. The
+    statuses in the buffer are keyed by set pk, and the pks of deleted sets
+    can be reused for new sets before the buffer is flushed.
+
+    """
+
+    if _activeBuffer is not None:
+        _activeBuffer.flush()
+
+
+@contextlib.contextmanager
+def batchFlagging():
+    """Context manager that batches the flagging of exposures and sets.
+
+    Within the block, `setExposureStatus` and `setSetStatus` (and, thus,
+    `checkExposure` and `checkSet`) record the changes in a `StatusBuffer`
+    instead of updating the DB. The changes are applied in a single
+    transaction when the block exits. If the block raises an exception, the
+    changes are discarded. Nested blocks use the buffer of the outermost one.
+
+    Note that the statuses read from the DB within the block are those
+    before the block started.
+
+    Example
+    -------
+    ::
+      >> with batchFlagging():
+      ..     for ss in plate.sets:
+      ..         checkSet(ss, force=True)
+
+    """
+
+    global _activeBuffer
+
+    if _activeBuffer is not None:
+        yield _activeBuffer
+        return
+
+    buffer = StatusBuffer()
+    _activeBuffer = buffer
+
+    try:
+        yield buffer
+    finally:
+        _activeBuffer = None
+
+    buffer.flush()
+
+
+def flagInBatch(func):
+    """Decorator that runs a function within a `batchFlagging` block."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with batchFlagging():
+            return func(*args, **kwargs)
+
+    return wrapper
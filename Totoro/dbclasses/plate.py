@@ -16,11 +16,16 @@ from __future__ import division
 from __future__ import print_function
 from Totoro.db import getConnectionFull
 from Totoro import exceptions as TotoroExceptions
-from Totoro import log, config, dustMap, site
+from Totoro import log, config, getDustMap, site
 from Totoro import utils
+from Totoro.utils import astro
 from Totoro.scheduler import observingPlan
 from Totoro.dbclasses import Set as TotoroSet
 from Totoro.dbclasses import Exposure as TotoroExposure
+from Totoro.dbclasses import MockSet
+from Totoro.dbclasses.exposure import getExposuresSN2
+from Totoro.dbclasses.plate_loader import loadPlateData
+from Totoro.dbclasses.flagging import batchFlagging
 from Totoro.dbclasses import plate_utils as plateUtils
 from Totoro.scheduler.footprint import getPlatesInFootprint
 import warnings
@@ -28,6 +33,7 @@ from astropy import time
 import numpy as np
 from copy import deepcopy
 from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 
 
@@ -35,12 +41,36 @@ __all__ = ['getPlugged', 'getAtAPO', 'getAll', 'getComplete', 'Plate',
            'fromPlateID']
 
 
+def _getMaNGASurveyFilter(db):
+    """Returns a filter selecting the plates in the MaNGA survey.
+
+    The filter uses the pk of the MaNGA survey from the lookup tables of the
+    connection and must be applied to a query joined with
+    plateDB.PlateToSurvey.
+
+    """
+
+    plateDB = db.plateDB
+    mangaSurveyPK = db.lookupTables.getPK(plateDB.Survey, 'MaNGA')
+
+    return plateDB.PlateToSurvey.survey_pk == mangaSurveyPK
+
+
+def queryMaNGAPlates(session, db):
+    """Returns a query with the plateDB.Plate plates in the MaNGA survey."""
+
+    plateDB = db.plateDB
+
+    return session.query(plateDB.Plate).join(plateDB.PlateToSurvey).filter(
+        _getMaNGASurveyFilter(db))
+
+
 def getPlugged(**kwargs):
 
     kwargs.setdefault('fullCheck', False)
     kwargs.setdefault('updateSets', False)
 
-    __, Session, plateDB, __ = getConnectionFull()
+    db, Session, plateDB, __ = getConnectionFull()
     session = Session()
 
     with session.begin():
@@ -48,14 +78,13 @@ def getPlugged(**kwargs):
             plateDB.ActivePlugging).join(
                 plateDB.Plugging,
                 plateDB.Plate,
-                plateDB.PlateToSurvey,
-                plateDB.Survey,
-                plateDB.SurveyMode).filter(
-                    plateDB.Survey.label == 'MaNGA',
-                    plateDB.SurveyMode.label.ilike('MaNGA%')).order_by(
-                        plateDB.Plate.plate_id).all()
+                plateDB.PlateToSurvey).filter(
+                    _getMaNGASurveyFilter(db)).order_by(
+                        plateDB.Plate.plate_id).options(
+                            joinedload(plateDB.ActivePlugging.plugging)
+                            .joinedload(plateDB.Plugging.plate)).all()
 
-    plates = [actPlug.plugging.plate for actPlug in activePluggings]
+        plates = [actPlug.plugging.plate for actPlug in activePluggings]
 
     return Plates(plates, **kwargs)
 
@@ -86,22 +115,85 @@ def _getValidPlates(plates, rejectLowPriority=False,
     return validPlates
 
 
+def _getPlateFilters(db, rejectLowPriority=False,
+                     rejectSpecial=False, onlyIncomplete=False,
+                     rejectStatuses=None, location=None, **kwargs):
+    """Returns SQL filters for plateDB.Plate queries.
+
+    The filters reject the plates that `_getValidPlates` and `_getIncomplete`
+    would reject, so that they do not need to be wrapped. Plates with a
+    plugging marked as complete are rejected if `onlyIncomplete=True`. The
+    completion of the rest of the plates must still be calculated. If
+    `rejectStatuses` is a list of plate status labels, plates with any of
+    those statuses are rejected. If `location` is defined, only plates at
+    that location are selected.
+
+    """
+
+    plateDB = db.plateDB
+    mangaDB = db.mangaDB
+
+    filters = []
+
+    if rejectLowPriority:
+        minimumPriority = config['plugger']['noPlugPriority']
+        filters.append(plateDB.Plate.plate_pointings.any(
+            plateDB.PlatePointing.priority > minimumPriority))
+
+    if rejectSpecial:
+        filters.append(plateDB.Plate.mangadbPlate.has(
+            and_(mangaDB.Plate.all_sky_plate.isnot(True),
+                 mangaDB.Plate.commissioning_plate.isnot(True),
+                 mangaDB.Plate.neverobserve.isnot(True))))
+
+    if onlyIncomplete:
+        filters.append(~plateDB.Plate.pluggings.any(
+            db.lookupTables.filterBy(plateDB.Plugging.status,
+                                     ['Good', 'Overridden Good'])))
+
+    if rejectStatuses:
+        filters.append(~plateDB.Plate.statuses.any(
+            plateDB.PlateStatus.label.in_(rejectStatuses)))
+
+    if location is not None:
+        filters.append(db.lookupTables.filterBy(plateDB.Plate.location,
+                                                location))
+
+    return filters
+
+
+def _wrapPlates(plates, onlyIncomplete=False, **kwargs):
+    """Returns a list of plateDB plates as Totoro plates.
+
+    The plates are bulk-loaded and then rejected using `_getValidPlates` and,
+    if `onlyIncomplete=True`, `_getIncomplete`. Because the plates have
+    already been selected by the filters in `_getPlateFilters`, these checks
+    do not usually reject any plate and do not query the DB.
+
+    """
+
+    plateData = loadPlateData(plates)
+
+    validPlates = _getValidPlates(plates, **kwargs)
+
+    if onlyIncomplete:
+        return _getIncomplete(validPlates, plateData=plateData, **kwargs)
+    else:
+        return Plates(validPlates, plateData=plateData, **kwargs)
+
+
 def getAtAPO(onlyIncomplete=False, onlyMarked=False, raRange=None, **kwargs):
     """Gets plates at APO with various conditions."""
 
     kwargs.setdefault('fullCheck', False)
     kwargs.setdefault('updateSets', False)
 
-    __, Session, plateDB, __ = getConnectionFull()
+    db, Session, plateDB, __ = getConnectionFull()
     session = Session()
 
     with session.begin():
-        plates = session.query(plateDB.Plate).join(
-            plateDB.PlateToSurvey, plateDB.Survey, plateDB.SurveyMode).filter(
-                plateDB.Survey.label == 'MaNGA',
-                plateDB.SurveyMode.label == 'MaNGA dither'
-        ).join(plateDB.PlateLocation).filter(
-            plateDB.PlateLocation.label == 'APO').join(
+        plates = queryMaNGAPlates(session, db).filter(
+            db.lookupTables.filterBy(plateDB.Plate.location, 'APO')).join(
                 plateDB.PlatePointing, plateDB.Pointing)
 
         _checkNumberPlatesAtAPO(plates)
@@ -128,43 +220,42 @@ def getAtAPO(onlyIncomplete=False, onlyMarked=False, raRange=None, **kwargs):
                 warnings.warn('unrecognised format for raRange',
                               TotoroExceptions.TotoroUserWarning)
 
-        plates = plates.order_by(plateDB.Plate.plate_id).all()
+        plates = plates.filter(
+            *_getPlateFilters(db, onlyIncomplete=onlyIncomplete,
+                              **kwargs)).order_by(plateDB.Plate.plate_id).all()
 
-    validPlates = _getValidPlates(plates, **kwargs)
+    return _wrapPlates(plates, onlyIncomplete=onlyIncomplete, **kwargs)
 
-    if onlyIncomplete:
-        return _getIncomplete(validPlates, **kwargs)
-    else:
-        return Plates(validPlates, **kwargs)
 
+def getAll(onlyIncomplete=False, rejectStatuses=None, location=None,
+           **kwargs):
+    """Gets all the MaNGA plates.
+
+    The plates can be selected using the same criteria as `getAtAPO` and, in
+    addition, by status and location. See `_getPlateFilters`.
 
-def getAll(onlyIncomplete=False, **kwargs):
+    """
 
     kwargs.setdefault('fullCheck', False)
     kwargs.setdefault('updateSets', False)
 
-    __, Session, plateDB, __ = getConnectionFull()
+    db, Session, plateDB, __ = getConnectionFull()
     session = Session()
 
     with session.begin():
-        plates = session.query(plateDB.Plate).join(
-            plateDB.PlateToSurvey, plateDB.Survey, plateDB.SurveyMode
-        ).filter(plateDB.Survey.label == 'MaNGA',
-                 plateDB.SurveyMode.label == 'MaNGA dither').order_by(
-                     plateDB.Plate.plate_id)
-
-    platesAtAPO = plates.join(plateDB.PlateLocation).filter(
-        plateDB.PlateLocation.label == 'APO')
-    _checkNumberPlatesAtAPO(platesAtAPO)
+        plates = queryMaNGAPlates(session, db).order_by(
+            plateDB.Plate.plate_id)
 
-    plates = plates.order_by(plateDB.Plate.plate_id).all()
+    platesAtAPO = plates.filter(
+        db.lookupTables.filterBy(plateDB.Plate.location, 'APO'))
+    _checkNumberPlatesAtAPO(platesAtAPO)
 
-    plates = _getValidPlates(plates, **kwargs)
+    plates = plates.filter(
+        *_getPlateFilters(db, onlyIncomplete=onlyIncomplete,
+                          rejectStatuses=rejectStatuses, location=location,
+                          **kwargs)).order_by(plateDB.Plate.plate_id).all()
 
-    if onlyIncomplete:
-        return _getIncomplete(plates, **kwargs)
-    else:
-        return Plates(plates, **kwargs)
+    return _wrapPlates(plates, onlyIncomplete=onlyIncomplete, **kwargs)
 
 
 def _getIncomplete(plates, **kwargs):
@@ -190,12 +281,9 @@ def getComplete(**kwargs):
     session = Session()
 
     with session.begin():
-        plates = session.query(plateDB.Plate).join(
-            plateDB.PlateToSurvey, plateDB.Survey, plateDB.SurveyMode,
-            plateDB.Plugging, plateDB.PluggingStatus).filter(
-                plateDB.Survey.label == 'MaNGA',
-                plateDB.SurveyMode.label == 'MaNGA dither',
-                plateDB.PluggingStatus.label.in_(['Good', 'Overridden Good'])
+        plates = queryMaNGAPlates(session, db).join(plateDB.Plugging).filter(
+            db.lookupTables.filterBy(plateDB.Plugging.status,
+                                     ['Good', 'Overridden Good'])
         ).order_by(plateDB.Plate.plate_id).all()
 
     return Plates(plates, **kwargs)
@@ -215,16 +303,46 @@ def _checkNumberPlatesAtAPO(plates):
     return
 
 
+def _createPreloadedPlates(plates, plateData, **kwargs):
+    """Creates Totoro plates from plateDB plates and their `PlateData`.
+
+    A commit would expire the preloaded instances, which would then be
+    loaded again one by one. So, the flagging of all the plates is applied
+    in a single transaction once they have been created, and the other
+    transactions while the plates are created (e.g., to assign new
+    exposures to sets) do not expire the instances.
+
+    """
+
+    session = getConnectionFull()[1]()
+    expireOnCommit = session.expire_on_commit
+
+    with batchFlagging():
+        session.expire_on_commit = False
+        try:
+            totoroPlates = [Plate(plate, preloaded=plateData.get(plate.pk),
+                                  **kwargs) for plate in plates]
+        finally:
+            session.expire_on_commit = expireOnCommit
+
+    return totoroPlates
+
+
 class Plates(list):
 
-    def __init__(self, inp, format='pk', **kwargs):
+    def __init__(self, inp, format='pk', plateData=None, **kwargs):
 
         __, __, plateDB, __ = getConnectionFull()
 
         if all([isinstance(ii, Plate) for ii in inp]):
             list.__init__(self, inp)
         elif all([isinstance(ii, plateDB.Plate) for ii in inp]):
-            list.__init__(self, [Plate(ii, **kwargs) for ii in inp])
+            # Loads the information of all the plates at once, unless it has
+            # already been loaded.
+            if plateData is None:
+                plateData = loadPlateData(inp)
+            list.__init__(self, _createPreloadedPlates(inp, plateData,
+                                                       **kwargs))
         else:
             list.__init__(self, [Plate(ii, format=format, **kwargs)
                                  for ii in inp])
@@ -262,6 +380,11 @@ class Plate(object):
 
     _instances = {}
 
+    # Increased every time mock exposures are added to the plate, its list of
+    # sets is replaced or a fork is committed. Used to identify the state of
+    # the plate in simulation memos.
+    _stateVersion = 0
+
     def __new__(cls, input=None, format='pk', **kwargs):
 
         # Checks if an open transaction already exists.
@@ -293,8 +416,14 @@ class Plate(object):
 
     def __init__(self, input=None, format='pk', mock=False,
                  updateSets=True, mjd=None, fullCheck=True,
-                 manga_tileid=None, **kwargs):
-        """A custom class based on plateDB.Plate."""
+                 manga_tileid=None, preloaded=None, **kwargs):
+        """A custom class based on plateDB.Plate.
+
+        `preloaded` can be a `PlateData` record, as returned by
+        `loadPlateData`, with the sets and exposures of the plate. In that
+        case, the plate is created without querying the DB for them.
+
+        """
 
         self.__dbAttributes__ = self._dbObject.__mapper__.attrs
 
@@ -317,15 +446,28 @@ class Plate(object):
         else:
             self._dust = None
 
+        # The preloaded science exposures are only used while the plate is
+        # initialised, as new exposures may be taken afterwards.
+        self._scienceExposures = None
+
         if not self.isMock:
-            self.sets = [TotoroSet(set, **kwargs)
-                         for set in self.getMangaDBSets()]
+            if preloaded is not None:
+                self._scienceExposures = preloaded.scienceExposures
+                self.sets = [
+                    TotoroSet(set, dbExposures=preloaded.setExposures[set.pk],
+                              **kwargs)
+                    for set in preloaded.sets]
+            else:
+                self.sets = [TotoroSet(set, **kwargs)
+                             for set in self.getMangaDBSets()]
 
             self.checkPlate(full=fullCheck)
 
             if updateSets:
                 self.updatePlate(**kwargs)
 
+            self._scienceExposures = None
+
         else:
             self.sets = []
 
@@ -359,12 +501,20 @@ class Plate(object):
             return object.__getattribute__(self, name)
 
     def __setattr__(self, name, value):
-        """Custom setattr method that first looks into the DB object."""
+        """Custom setattr method that first looks into the DB object.
+
+        Replacing the list of sets changes the state of the plate (see
+        `_stateVersion`).
+
+        """
 
         if hasattr(self, '_dbObject') and hasattr(self._dbObject, name):
             setattr(self._dbObject, name, value)
         else:
             super(Plate, self).__setattr__(name, value)
+            if name == 'sets':
+                super(Plate, self).__setattr__('_stateVersion',
+                                               self._stateVersion + 1)
 
     @classmethod
     def fromSets(cls, sets, **kwargs):
@@ -544,6 +694,42 @@ class Plate(object):
     def copy(self):
         return deepcopy(self)
 
+    def fork(self):
+        """Returns a copy-on-write fork of the plate.
+
+        The fork shares the DB object and the exposures with the plate but has
+        its own list of sets, each one with its own list of exposures. Mock
+        exposures can be added to the fork and its sets rearranged without
+        modifying the original plate. Use `Plate.commit` to apply the changes
+        to the original plate, or simply discard the fork.
+
+        """
+
+        fork = object.__new__(self.__class__)
+        fork.__dict__.update(self.__dict__)
+        fork.__dict__['sets'] = [ss.fork() for ss in self.sets]
+        fork.__dict__['_parent'] = self
+
+        return fork
+
+    def commit(self):
+        """Applies the changes in a fork to the original plate.
+
+        Returns the original plate. The fork should not be used after it has
+        been committed.
+
+        """
+
+        if '_parent' not in self.__dict__:
+            raise TotoroExceptions.TotoroError('plate is not a fork.')
+
+        parent = self.__dict__['_parent']
+        parent.__dict__['sets'] = self.sets
+        parent.__dict__['_complete'] = self._complete
+        parent.__dict__['_stateVersion'] = parent._stateVersion + 1
+
+        return parent
+
     def getPlateCompletion(self, includeIncompleteSets=False, useMock=True):
 
         # totalSN = self.getCumulatedSN2(
@@ -560,8 +746,8 @@ class Plate(object):
             if ss.getStatus()[0] in validStatuses:
                 sets.append(ss)
 
-        exposureSN2 = np.array([exp.getSN2Array() for ss in sets
-                                for exp in ss.totoroExposures])
+        exposureSN2 = getExposuresSN2([exp for ss in sets
+                                       for exp in ss.totoroExposures])
 
         if exposureSN2.shape[0] == 0:
             return 0
@@ -653,16 +839,30 @@ class Plate(object):
         """Returns a list of all plateDB.Exposure science exposures for
         the plate."""
 
-        scienceExps = []
+        if self._scienceExposures is not None:
+            return list(self._scienceExposures)
 
         plateDB = self.db.plateDB
 
-        for plugging in self.pluggings:
-            exposures = self.session.query(plateDB.Exposure).join(
-                plateDB.Observation, plateDB.ExposureFlavor).filter(
-                    plateDB.Observation.plugging_pk == plugging.pk).filter(
-                        plateDB.ExposureFlavor.label == 'Science').all()
-            scienceExps += exposures
+        pluggingPKs = [plugging.pk for plugging in self.pluggings]
+
+        if len(pluggingPKs) == 0:
+            return []
+
+        # Queries the exposures of all the pluggings at once and returns them
+        # in the order of the pluggings.
+        rows = self.session.query(
+            plateDB.Exposure, plateDB.Observation.plugging_pk).join(
+                plateDB.Observation).filter(
+                    plateDB.Observation.plugging_pk.in_(pluggingPKs)).filter(
+                        self.db.lookupTables.filterBy(plateDB.Exposure.flavor,
+                                                      'Science')).order_by(
+                            plateDB.Exposure.pk).all()
+
+        scienceExps = []
+        for pluggingPK in pluggingPKs:
+            scienceExps += [exposure for exposure, expPluggingPK in rows
+                            if expPluggingPK == pluggingPK]
 
         return scienceExps
 
@@ -834,7 +1034,7 @@ class Plate(object):
         else:
             # This is a new set. We give the exposure a random dither position.
             exposure.ditherPosition = 'N'
-            validSet = TotoroSet(mock=True, **kwargs)
+            validSet = MockSet(**kwargs)
             newSet = True
 
         if exposure.isValid()[0] is False:
@@ -845,12 +1045,16 @@ class Plate(object):
         if newSet:
             self.sets.append(validSet)
         validSet.totoroExposures.append(exposure)
+        self._stateVersion += 1
 
         if rearrange:
-            # We only run this rearrangement if the list of exposures in
+            # We only run this rearrangement if the placement of the new
+            # exposure may not be optimal and the list of exposures in
             # incomplete sets is small
             nExpIncompleteSets = len(self.getExposuresInIncompleteSets())
-            if nExpIncompleteSets <= 5:
+            if plateUtils.isInsertionOptimal(self, exposure, validSet):
+                pass
+            elif nExpIncompleteSets <= 5:
                 self.rearrangeSets(mode='optimal', scope='incomplete',
                                    silent=True)
             else:
@@ -978,13 +1182,7 @@ class Plate(object):
 
         HA = (LST * 15. - self.ra) % 360.
 
-        sinAlt = (np.sin(np.deg2rad(self.dec)) *
-                  np.sin(np.deg2rad(site.latitude)) +
-                  np.cos(np.deg2rad(self.dec)) *
-                  np.cos(np.deg2rad(site.latitude)) *
-                  np.cos(np.deg2rad(HA)))
-
-        return np.rad2deg(np.arcsin(sinAlt))
+        return astro.altitude(HA, self.dec, latitude=site.latitude)
 
     def getLSTRangeAboveAltitude(self, altitude):
         """Returns the LST range in which the plate is above ``altitude`` [deg]
@@ -1136,6 +1334,8 @@ class Plate(object):
         if self._dust is not None:
             return self._dust
 
+        dustMap = getDustMap()
+
         if dustMap is None:
             return None
         else:
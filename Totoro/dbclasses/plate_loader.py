@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+plate_loader.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro.db import getConnectionFull
+from Totoro import log
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, subqueryload
+import collections
+
+
+__all__ = ['PlateData', 'loadPlateData']
+
+
+# The DB information needed to create a Totoro Plate without further queries:
+# the mangaDB.Set instances of the plate, sorted by pk, a dictionary of the
+# plateDB.Exposure instances of each set, keyed by set pk, and the list of
+# plateDB.Exposure science exposures, in the order of the pluggings.
+PlateData = collections.namedtuple(
+    'PlateData', ['sets', 'setExposures', 'scienceExposures'])
+
+
+def _getPlateOptions(plateDB):
+    """Returns the loader options for the relationships of plateDB.Plate."""
+
+    Plate = plateDB.Plate
+    Plugging = plateDB.Plugging
+
+    return [
+        subqueryload(Plate.plate_pointings).joinedload(
+            plateDB.PlatePointing.pointing),
+        subqueryload(Plate.statuses),
+        subqueryload(Plate.surveys),
+        joinedload(Plate.location),
+        joinedload(Plate.currentSurveyMode),
+        joinedload(Plate.mangadbPlate),
+        subqueryload(Plate.pluggings).joinedload(Plugging.cartridge),
+        subqueryload(Plate.pluggings).joinedload(Plugging.status),
+        subqueryload(Plate.pluggings).subqueryload(Plugging.activePlugging)]
+
+
+def _getExposureOptions(plateDB, mangaDB):
+    """Returns the loader options for the relationships of plateDB.Exposure.
+    """
+
+    Exposure = plateDB.Exposure
+
+    return [
+        joinedload(Exposure.status),
+        joinedload(Exposure.observation),
+        subqueryload(Exposure.mangadbExposure).joinedload(
+            mangaDB.Exposure.status),
+        subqueryload(Exposure.mangadbExposure).subqueryload(
+            mangaDB.Exposure.sn2values)]
+
+
+def loadPlateData(plates):
+    """Loads the DB information of a list of plates in a few queries.
+
+    Loads the pointings, statuses, location, surveys and pluggings of the
+    plates, their mangaDB sets, and the exposures of each set and plugging,
+    including their mangaDB counterparts, statuses and SN2 values. The
+    number of queries does not depend on the number of plates.
+
+    The queries are not run within a transaction so that the instances are
+    not expired when it is committed. `Plates` creates the plates with
+    `expire_on_commit=False` so that the instances are not expired by the
+    transactions run during their construction either.
+
+    Parameters
+    ----------
+    plates : list
+        A list of plateDB.Plate instances.
+
+    Returns
+    -------
+    plateData : dict
+        A dictionary of `PlateData` records keyed by plate pk.
+
+    """
+
+    db, Session, plateDB, mangaDB = getConnectionFull()
+    session = Session()
+
+    # Uses the identity of the instances, which does not trigger a refresh if
+    # the instances have been expired.
+    platePKs = [inspect(plate).identity[0] for plate in plates]
+
+    if len(platePKs) == 0:
+        return {}
+
+    dbPlates = session.query(plateDB.Plate).filter(
+        plateDB.Plate.pk.in_(platePKs)).options(
+            *_getPlateOptions(plateDB)).all()
+
+    # The sets of each plate.
+    setRows = session.query(mangaDB.Set, plateDB.Plate.pk).join(
+        mangaDB.Exposure, plateDB.Exposure, plateDB.Observation,
+        plateDB.PlatePointing, plateDB.Plate).filter(
+            plateDB.Plate.pk.in_(platePKs)).options(
+                joinedload(mangaDB.Set.status)).all()
+
+    plateSets = collections.defaultdict(dict)
+    for set, platePK in setRows:
+        plateSets[platePK][set.pk] = set
+
+    setPKs = [setPK for sets in plateSets.values() for setPK in sets]
+
+    # The exposures of each set.
+    setExposures = collections.defaultdict(list)
+
+    if len(setPKs) > 0:
+        exposureRows = session.query(
+            plateDB.Exposure, mangaDB.Exposure.set_pk).join(
+                mangaDB.Exposure).filter(
+                    mangaDB.Exposure.set_pk.in_(setPKs)).order_by(
+                        plateDB.Exposure.pk).options(
+                            *_getExposureOptions(plateDB, mangaDB)).all()
+
+        for exposure, setPK in exposureRows:
+            setExposures[setPK].append(exposure)
+
+    # The science exposures of each plugging.
+    pluggingPKs = [plugging.pk for plate in dbPlates
+                   for plugging in plate.pluggings]
+
+    pluggingExposures = collections.defaultdict(list)
+
+    if len(pluggingPKs) > 0:
+        scienceRows = session.query(
+            plateDB.Exposure, plateDB.Observation.plugging_pk).join(
+                plateDB.Observation).filter(
+                    plateDB.Observation.plugging_pk.in_(pluggingPKs),
+                    db.lookupTables.filterBy(plateDB.Exposure.flavor,
+                                             'Science')).order_by(
+                        plateDB.Exposure.pk).options(
+                            *_getExposureOptions(plateDB, mangaDB)).all()
+
+        for exposure, pluggingPK in scienceRows:
+            pluggingExposures[pluggingPK].append(exposure)
+
+    plateData = {}
+    for plate in dbPlates:
+        sets = [plateSets[plate.pk][setPK]
+                for setPK in sorted(plateSets[plate.pk])]
+        plateData[plate.pk] = PlateData(
+            sets=sets,
+            setExposures=dict((set.pk, setExposures[set.pk]) for set in sets),
+            scienceExposures=[exposure for plugging in plate.pluggings
+                              for exposure in pluggingExposures[plugging.pk]])
+
+    log.debug('bulk-loaded the data of {0} plates'.format(len(plateData)))
+
+    return plateData
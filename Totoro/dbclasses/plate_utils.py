@@ -20,17 +20,22 @@ from Totoro import log, config, site
 from Totoro.db import getConnection
 from Totoro import exceptions
 from Totoro.utils import intervals, checkOpenSession
+from Totoro.dbclasses.arrangement import getCompletionFromSN2
+from Totoro.dbclasses.flagging import flagInBatch, flushActiveBuffer
 from scipy.misc import factorial
+from sqlalchemy import text
 import numpy as np
 import collections
 import itertools
 
 
+@flagInBatch
 def updatePlate(plate, rearrangeIncomplete=False, **kwargs):
     """Finds new exposures and assigns them a new set.
 
     If `rearrangeIncomplete=True`, exposures in incomplete sets are then
-    arranged in the best possible mode.
+    arranged in the best possible mode. The exposures and sets are flagged in
+    a single transaction when the function finishes (see `batchFlagging`).
 
     """
 
@@ -93,27 +98,21 @@ def assignExposureToOptimalSet(plate, exposure):
     optimalSet = getOptimalSet(plate, exposure)
 
     if optimalSet is None:
-        setPK = getConsecutiveSets(1)[0]
         with session.begin():
-            if session.query(db.mangaDB.Set).get(setPK) is None:
-                newSet = db.mangaDB.Set(pk=setPK)
-                session.add(newSet)
-                session.flush()
-                assert newSet.pk is not None, \
-                    'something failed while creating a new set'
-                exposure.mangadbExposure[0].set_pk = newSet.pk
-
-                log.debug('plate_id={0}: exposure_no={1} assigned to '
-                          'new set pk={2}'
-                          .format(plate.plate_id, exposure.exposure_no,
-                                  newSet.pk))
-                totoroNewSet = TotoroSet(newSet)
-                plate.sets.append(totoroNewSet)
-            else:
-                log.debug('plate_id={0}: something failed while assigning new '
-                          'set_pk to exposure_no={1}'
-                          .format(plate.plate_id, exposure.exposure_no))
-                return
+            setPK = allocateSetPKs(session, 1)[0]
+            newSet = db.mangaDB.Set(pk=setPK)
+            session.add(newSet)
+            session.flush()
+            assert newSet.pk is not None, \
+                'something failed while creating a new set'
+            exposure.mangadbExposure[0].set_pk = newSet.pk
+
+            log.debug('plate_id={0}: exposure_no={1} assigned to '
+                      'new set pk={2}'
+                      .format(plate.plate_id, exposure.exposure_no,
+                              newSet.pk))
+            totoroNewSet = TotoroSet(newSet)
+            plate.sets.append(totoroNewSet)
     else:
         with session.begin():
             exposure.mangadbExposure[0].set_pk = optimalSet.pk
@@ -130,7 +129,7 @@ def assignExposureToOptimalSet(plate, exposure):
 def getOptimalSet(plate, exposure):
     """Returns the best set in `plate` for an `exposure` or None."""
 
-    from Totoro.dbclasses import Set as TotoroSet
+    from Totoro.dbclasses.arrangement import SetEvaluator
 
     dither = exposure.ditherPosition
 
@@ -141,32 +140,25 @@ def getOptimalSet(plate, exposure):
     signalNoise = []
     for ss in incompleteSets:
 
-        setDithers = ss.getDitherPositions()
-
-        if dither in setDithers:
-            # If the dither exists, skips this set
+        # If the dither exists, skips this set. If the exposure has not a
+        # dither position (usually for mock exposures), SetEvaluator will
+        # consider it compatible with the dithers in the set.
+        if dither is not None and dither in ss.getDitherPositions():
             continue
-        elif dither is None:
-            # If the exposure has not a dither position (usually for mock
-            # mock exposures), selects one of the unused dithers in the set.
-            tmpDither = getValidDither(ss)
-            assert tmpDither is not None, 'failed getting valid dither'
-            exposure.ditherPosition = tmpDither
 
-        exposures = ss.totoroExposures + [exposure]
-        mockSet = TotoroSet.fromExposures(exposures)
-        status = mockSet.getStatus(silent=True)[0]
+        # The evaluator only contains the exposures of this set and the new
+        # exposure, so its cost does not depend on the size of the plate.
+        evaluator = SetEvaluator(list(ss.totoroExposures) + [exposure])
+        mockIndices = range(evaluator.nExposures)
+        status = evaluator.getStatus(mockIndices)
 
         if status in ['Good', 'Excellent']:
             validSets.append(ss)
             # Adds 100 to SN2 array to make sure complete set are always chosen
-            signalNoise.append(mockSet.getSN2Array() + 100)
+            signalNoise.append(evaluator.getSN2Array(mockIndices) + 100)
         elif status in ['Incomplete', 'Unplugged']:
             validSets.append(ss)
-            signalNoise.append(mockSet.getSN2Array())
-
-    # Restore original dither position, in case we have changed it
-    exposure.ditherPosition = dither
+            signalNoise.append(evaluator.getSN2Array(mockIndices))
 
     if len(validSets) == 0:
         return None
@@ -199,6 +191,75 @@ def getValidDither(ss):
     return remainingDithers[0]
 
 
+def isInsertionOptimal(plate, exposure, exposureSet):
+    """Returns True if rearranging the incomplete sets cannot improve `plate`.
+
+    Checks whether, after adding `exposure` to `exposureSet` (already done
+    in `plate`), a rearrangement with `scope='incomplete'` may select a
+    different arrangement. Only the placements of the new exposure are
+    considered, assuming that the arrangement before the insertion was
+    optimal. Returns False if that assumption cannot be guaranteed or if a
+    rearrangement may change the plate, in which case a full rearrangement is
+    needed.
+
+    If no valid complete set can be formed with the exposures that were in
+    incomplete sets before the insertion, any good set formed by a
+    rearrangement must contain `exposure`. Only the exposures compatible with
+    `exposure` can be in those sets, so only those are tested. If `exposure`
+    completed `exposureSet`, the insertion is optimal if any other good set
+    that contains `exposure` has completion lower than
+    `config.setArrangement.factor` times that of `exposureSet`. Otherwise,
+    `rearrangeSets` could select any of them depending on their LST, so that
+    is considered a tie. If `exposure` cannot be part of any good set, the
+    insertion is optimal if `exposure` is not compatible with any exposure
+    outside `exposureSet`, as moving it to a different set would produce an
+    arrangement with the same completion that `rearrangeSets` may prefer
+    because of its LST.
+
+    """
+
+    from Totoro.dbclasses.arrangement import SetEvaluator
+
+    incompleteSets = [ss for ss in plate.sets
+                      if ss is not exposureSet and
+                      ss.getStatus(silent=True)[0] in ['Incomplete',
+                                                       'Unplugged']]
+
+    exposures = []
+    for ss in incompleteSets + [exposureSet]:
+        exposures += [exp for exp in ss.totoroExposures if exp is not exposure]
+
+    evaluator = SetEvaluator(exposures + [exposure])
+    exposureIndex = len(exposures)
+
+    # The arrangement before the insertion was not optimal.
+    for __ in evaluator.iterGoodSets(range(exposureIndex)):
+        return False
+
+    # The exposures of exposureSet are the last ones in the evaluator.
+    nOtherExposures = len(exposureSet.totoroExposures) - 1
+    exposureSetKey = evaluator.getKey(range(exposureIndex - nOtherExposures,
+                                            exposureIndex + 1))
+
+    # Good sets that can be formed with exposure, other than exposureSet.
+    goodSets = [key for key in evaluator.iterGoodSets(range(exposureIndex),
+                                                      seed=(exposureIndex, ))
+                if key != exposureSetKey]
+
+    if evaluator.getStatus(exposureSetKey) in ['Good', 'Excellent']:
+        factor = config['setArrangement']['factor']
+        exposureSetCompletion = getCompletionFromSN2(
+            evaluator.getSN2(exposureSetKey))
+        return all([getCompletionFromSN2(evaluator.getSN2(key)) <
+                    factor * exposureSetCompletion for key in goodSets])
+    elif len(goodSets) > 0:
+        return False
+
+    otherIndices = range(exposureIndex - nOtherExposures)
+
+    return not np.any(evaluator.compatible[exposureIndex, otherIndices])
+
+
 def _getSetStatusLabel(exposure):
     """Returns the set status for an exposure or None."""
 
@@ -208,14 +269,19 @@ def _getSetStatusLabel(exposure):
         return None
 
 
+@flagInBatch
 def rearrangeSets(plate, mode='complete', scope='all', force=False,
-                  LST=None, silent=False):
+                  LST=None, silent=False, nWorkers=None):
     """Rearranges exposures in a plate.
 
     If `mode='complete'`, uses a brute-force approach to obtain the best
     possible arrangement for exposures into sets. If `mode='sequential'`,
     removes the set allocation for the exposures in the plate and adds them
-    back in the order in which they were observed.
+    back in the order in which they were observed. `mode='branchAndBound'`
+    returns the same optimal arrangements as `mode='complete'` but discards
+    partial arrangements whose maximum possible completion is too low, so it
+    is limited by the number of partial arrangements tested instead of by the
+    number of permutations.
 
     In `mode='complete'`, the function determines all the possible combinations
     of exposures in sets and chooses the one that maximises the SN2. Of all the
@@ -223,14 +289,17 @@ def rearrangeSets(plate, mode='complete', scope='all', force=False,
     `maxSN2`, selects the one that leaves most of the incomplete sets at the
     beginning of the visibility window of the plate or to `LST`.
 
-    Sets overridden good or bad are not affected by the rearrangement.
+    Sets overridden good or bad are not affected by the rearrangement. The
+    exposures and sets are flagged in a single transaction when the function
+    finishes (see `batchFlagging`).
 
     Parameters
     ----------
     plate : `Totoro.Plate` instance
         The plate to rearrange.
     mode : str
-        The mode of the rearrangement, either `'complete'` or `'sequential'`.
+        The mode of the rearrangement, either `'complete'`, `'sequential'` or
+        `'branchAndBound'`.
     scope : str
         If `'all'`, all the exposures in the plate are rearranged. If
         `'incomplete'`, only exposures in incomplete sets are used.
@@ -239,14 +308,21 @@ def rearrangeSets(plate, mode='complete', scope='all', force=False,
         and can be calculated using `getNumberPermutations`.
         config.setArrangement.permutationLimitPlate and
         config.setArrangement.permutationLimitIncomplete determine the maximum
-        number of permutations to test. If `force` is True, those limits are
-        ignored.
+        number of permutations to test. In `mode='branchAndBound'`,
+        config.setArrangement.nodeLimitPlate and
+        config.setArrangement.nodeLimitIncomplete limit the number of partial
+        arrangements tested. If `force` is True, those limits are ignored.
     LST : None or float
         If multiple permutations have optimal SN2, the one that moves the
         average of the medium points of the incomplete sets closer to this LST
         is selected. If `LST=None`, the current LST is used.
     silent : bool
         Determines the verbosity of the function
+    nWorkers : int or None
+        The number of processes used to test the permutations in
+        `mode='complete'`. If None, `config.setArrangement.nWorkers` is used.
+        With more than one worker, the permutations are distributed among a
+        pool of processes; the result is identical to that with one worker.
 
     Returns
     -------
@@ -255,8 +331,10 @@ def rearrangeSets(plate, mode='complete', scope='all', force=False,
 
     """
 
-    from Totoro.dbclasses import Exposure
-    from Totoro.dbclasses import Set
+    from Totoro.dbclasses import Exposure, MockExposure
+    from Totoro.dbclasses.arrangement import (SetEvaluator,
+                                              ArrangementSelector,
+                                              BranchAndBound)
 
     # Sets logging level
     if silent:
@@ -267,15 +345,17 @@ def rearrangeSets(plate, mode='complete', scope='all', force=False,
     # Selects exposures to consider
     if scope.lower() == 'all':
         permutationLimit = config['setArrangement']['permutationLimitPlate']
+        nodeLimit = config['setArrangement']['nodeLimitPlate']
         exposures = [Exposure(exp) for exp in plate.getScienceExposures()]
     elif scope.lower() == 'incomplete':
         permutationLimit = config['setArrangement'][
             'permutationLimitIncomplete']
+        nodeLimit = config['setArrangement']['nodeLimitIncomplete']
         exposures = []
         for ss in plate.sets:
             if ss.getStatus()[0] in ['Incomplete', 'Unplugged']:
                 for exposure in ss.totoroExposures:
-                    if not isinstance(exposure, Exposure):
+                    if not isinstance(exposure, (Exposure, MockExposure)):
                         exposure = Exposure(exposure)
                     exposures.append(exposure)
     else:
@@ -313,7 +393,9 @@ def rearrangeSets(plate, mode='complete', scope='all', force=False,
 
     if mode.lower() == 'sequential':
         # If mode is sequential, removes set_pk from all selected exposures
-        # and triggers a plate update.
+        # and triggers a plate update. The pending statuses are applied
+        # before the sets are deleted, as their pks may be reused.
+        flushActiveBuffer()
         with session.begin():
             for exposure in validExposures:
                 if exposure.mangadbExposure[0].set_pk is not None:
@@ -326,6 +408,48 @@ def rearrangeSets(plate, mode='complete', scope='all', force=False,
 
         return True
 
+    # The status and SN2 of each candidate set are determined by the
+    # evaluator from the indices of its exposures, without creating mock sets.
+    # Arrangements are compared using an ArrangementSelector, so that only the
+    # ones that can still be selected are kept in memory.
+
+    # If the scope is 'incomplete', adds the completion of the good sets.
+    if scope.lower() == 'incomplete':
+        offset = plate.getPlateCompletion(includeIncompleteSets=False)
+    else:
+        offset = 0.
+
+    # Adds the SN2 of the overridden sets
+    baseSN2 = _getOverridenSN2(overridenSets)
+
+    # The overridden sets added to each arrangement, with the bad ones split.
+    extraSets = fixBadSets(list(overridenSets))
+
+    if mode.lower() == 'branchandbound':
+
+        evaluator = SetEvaluator(validExposures)
+        selector = ArrangementSelector(evaluator, offset=offset,
+                                       extraSets=extraSets)
+
+        branchAndBound = BranchAndBound(
+            evaluator.ditherPositions, evaluator, baseSN2=baseSN2,
+            maxNodes=None if force else nodeLimit)
+
+        for completion, arrangement in branchAndBound.run():
+            selector.add(completion, arrangement)
+
+        logMode('plate_id={0}: {1} nodes tested using branch and bound.'
+                .format(plate.plate_id, branchAndBound.nNodes))
+
+        if branchAndBound.aborted:
+            logMode('plate_id={0}: hard limit for number of nodes in '
+                    'rearrangement ({1}) reached. Not rearranging.'.format(
+                        plate.plate_id, nodeLimit))
+            return False
+
+        return _applyOptimalArrangement(plate, selector.select(LST=LST),
+                                        scope=scope)
+
     # The remainder of the function assumes that the mode is optimal.
 
     ditherPositions = [exp.ditherPosition for exp in validExposures]
@@ -345,89 +469,189 @@ def rearrangeSets(plate, mode='complete', scope='all', force=False,
                     'in rearrangement reached but ignoring because '
                     'force=True.'.format(plate.plate_id))
 
-    permutations = calculatePermutations(ditherPositions)
+    evaluator = SetEvaluator(validExposures)
+    selector = ArrangementSelector(evaluator, offset=offset,
+                                   extraSets=extraSets)
 
-    def getSetId(ss):
-        """Returns unique identifier for a set from the ids of its exposures"""
-        return np.sum([id(exp) for exp in ss.totoroExposures])
+    if nWorkers is None:
+        nWorkers = config['setArrangement']['nWorkers']
 
-    zeroSN2 = np.array([0.0, 0.0, 0.0, 0.0])
+    if nWorkers > 1 and nPermutations > 1:
+        logMode('plate_id={0}: testing permutations using {1} workers'
+                .format(plate.plate_id, nWorkers))
+        candidates = _evaluatePermutationsParallel(
+            evaluator, ditherPositions, baseSN2, nWorkers, selector)
+    else:
+        candidates = _evaluatePermutations(
+            evaluator, ditherPositions, baseSN2, nPermutations=nPermutations,
+            logMode=logMode)
 
-    goodArrangements = []
-    setStatus = {}
-    setSN2 = {}
-    completions = []
+    for __, plateCompletion, arrangement in candidates:
+        selector.add(plateCompletion, arrangement)
 
-    # Adds the SN2 of the overridden sets
-    for ss in overridenSets:
-        setId = getSetId(ss)
-        setStatus[setId] = ss.getStatus(silent=True)[0]
-        if 'Good' in setStatus[setId]:
-            setSN2[setId] = ss.getSN2Array()
-        else:
-            setSN2[setId] = zeroSN2
+    logMode('{0} permutations tested.'.format(nPermutations))
 
-    setRearrFactor = config['setArrangement']['factor']
+    return _applyOptimalArrangement(plate, selector.select(LST=LST),
+                                    scope=scope)
 
-    for nn, permutation in enumerate(permutations):
 
-        sets = []
+def _evaluatePermutations(evaluator, ditherPositions, baseSN2, prefix=(),
+                          nPermutations=None, logMode=None):
+    """Yields the candidate arrangements from a list of permutations.
+
+    Evaluates the permutations returned by `calculatePermutations` for
+    `prefix`. Yields tuples ``(index, completion, arrangement)``, where
+    ``index`` is the position of the permutation in `calculatePermutations`
+    and ``arrangement`` a list of set keys, for the permutations with
+    completion within `config.setArrangement.factor` of the running maximum.
 
-        for setIndices in permutation:
+    """
 
-            setExposures = [validExposures[ii] for ii in setIndices
-                            if ii is not None]
+    setRearrFactor = config['setArrangement']['factor']
 
-            ss = Set.fromExposures(setExposures)
-            sets.append(ss)
+    permutations = calculatePermutations(ditherPositions, prefix=prefix)
 
-            # To avoid calculating the state of a set more than one, creates
-            # a dictionary with the quality of the set
-            setId = getSetId(ss)
-            if setId not in setStatus:
-                setStatus[setId] = ss.getStatus(silent=True)[0]
-                setSN2[setId] = ss.getSN2Array() \
-                    if setStatus[setId] in ['Excellent', 'Good',
-                                            'Override Good'] else zeroSN2
+    maxCompletion = None
 
-            del ss
+    for nn, permutation in enumerate(permutations):
 
-        sets += overridenSets
+        arrangement = [evaluator.getKey(setIndices)
+                       for setIndices in permutation]
 
         # Instead of using Plate.getPlateCompletion, we calculate the plate
-        # completion here using the setStatus dictionary. Way faster this way.
-        plateSN2 = np.nansum([setSN2[getSetId(ss)] for ss in sets], axis=0)
-
-        blueSN2 = np.nanmean(plateSN2[0:2])
-        blueCompletion = blueSN2 / config['SN2thresholds']['plateBlue']
-        redSN2 = np.nanmean(plateSN2[2:])
-        redCompletion = redSN2 / config['SN2thresholds']['plateRed']
-        plateCompletion = np.min([blueCompletion, redCompletion])
+        # completion here using the evaluator. Way faster this way.
+        plateSN2 = baseSN2 + np.sum([evaluator.getSN2(key)
+                                     for key in arrangement], axis=0)
+        plateCompletion = getCompletionFromSN2(plateSN2)
 
         # If the plate completion is lower than setRearrFactor times the
         # current maximum completion, we don't bother storing this permutation.
-        if (len(completions) == 0 or
-                plateCompletion >= setRearrFactor * np.max(completions)):
-            completions.append(plateCompletion)
-            goodArrangements.append(fixBadSets(sets))
+        if (maxCompletion is None or
+                plateCompletion >= setRearrFactor * maxCompletion):
+            yield (nn, plateCompletion, arrangement)
+
+        if maxCompletion is None or plateCompletion > maxCompletion:
+            maxCompletion = plateCompletion
 
         # Every 10% of the permutations.
-        if (nn + 1) * 100. / nPermutations % 10 == 0:
+        if (logMode is not None and
+                (nn + 1) * 100. / nPermutations % 10 == 0):
             logMode('{0:d}% completed'
                     .format(int((nn + 1) * 100. / nPermutations)))
 
-    logMode('{0} permutations tested.'.format(nPermutations))
 
-    completions = np.array(completions)
+def _evaluatePermutationsTask(args):
+    """Evaluates the permutations with a prefix in a process pool.
+
+    Returns the task number and the candidates of the task that
+    `reduceCandidates` keeps.
+
+    """
+
+    from Totoro.dbclasses.arrangement import reduceCandidates
+
+    (task, evaluator, ditherPositions, baseSN2, prefix, offset, nExtraSets,
+     maxCandidates) = args
+
+    candidates = _evaluatePermutations(evaluator, ditherPositions, baseSN2,
+                                       prefix=prefix)
+
+    return task, reduceCandidates(evaluator, candidates, offset=offset,
+                                  nExtraSets=nExtraSets,
+                                  maxCandidates=maxCandidates)
 
-    # If the scope is 'incomplete', adds the completion of the good sets.
-    if scope.lower() == 'incomplete':
-        plateCompletion = plate.getPlateCompletion(includeIncompleteSets=False)
-        completions += plateCompletion
 
-    # From the good arrangements already selected, find the optimal one.
-    optimalArrangement = selectOptimalArrangement(goodArrangements,
-                                                  completions, LST=LST)
+def _evaluatePermutationsParallel(evaluator, ditherPositions, baseSN2,
+                                  nWorkers, selector):
+    """Evaluates the permutations using a pool of `nWorkers` processes.
+
+    The permutations are split in tasks by fixing the arrangement of the
+    first dithers, so that each task generates a contiguous range of the
+    permutations. Each task only returns the candidates that `selector` can
+    select, whatever the maximum completion of the previous tasks (see
+    `reduceCandidates`). Returns a list with the candidates of all the tasks
+    in permutation order, with those that have completion lower than the
+    factor times the maximum completion of the previous tasks removed.
+    Applying the running maximum criterium to them (as `ArrangementSelector`
+    does) gives the same result as testing all the permutations serially.
+
+    """
+
+    import multiprocessing
+
+    setRearrFactor = config['setArrangement']['factor']
+
+    # Fixes the arrangement of as many dithers as needed to have at least
+    # one task per worker.
+    groups = _getPermutationGroups(ditherPositions)
+    prefixes = [()]
+    for group in groups[1:]:
+        if len(prefixes) >= nWorkers:
+            break
+        prefixes = [prefix + (perm, ) for prefix in prefixes
+                    for perm in group]
+
+    nPermutationsTask = int(np.prod([len(group) for group in
+                                     groups[len(prefixes[0]) + 1:]]))
+
+    taskArgs = [(task, evaluator, ditherPositions, baseSN2, prefix,
+                 selector.offset, len(selector.extraSets),
+                 selector.maxCandidates)
+                for task, prefix in enumerate(prefixes)]
+
+    candidates = []
+    maxCompletion = None
+
+    # Candidates of the tasks that finished before the previous ones.
+    pending = {}
+    nextTask = 0
+
+    pool = multiprocessing.Pool(nWorkers)
+    try:
+        for task, taskCandidates in pool.imap_unordered(
+                _evaluatePermutationsTask, taskArgs):
+
+            pending[task] = taskCandidates
+
+            while nextTask in pending:
+
+                taskCandidates = pending.pop(nextTask)
+
+                for index, completion, arrangement in taskCandidates:
+                    if (maxCompletion is None or
+                            completion >= setRearrFactor * maxCompletion):
+                        candidates.append(
+                            (nextTask * nPermutationsTask + index,
+                             completion, arrangement))
+
+                # The permutation with maximum completion of a task is always
+                # returned.
+                taskMax = max(candidate[1] for candidate in taskCandidates)
+                if maxCompletion is None or taskMax > maxCompletion:
+                    maxCompletion = taskMax
+
+                nextTask += 1
+
+    finally:
+        pool.close()
+        pool.join()
+
+    return candidates
+
+
+def _getOverridenSN2(overridenSets):
+    """Returns the cumulated SN2 of the overridden good sets."""
+
+    baseSN2 = np.zeros(4)
+    for ss in overridenSets:
+        if 'Good' in ss.getStatus(silent=True)[0]:
+            baseSN2 += np.nan_to_num(ss.getSN2Array())
+
+    return baseSN2
+
+
+def _applyOptimalArrangement(plate, optimalArrangement, scope='all'):
+    """Applies the optimal arrangement to the plate."""
 
     # If the scope is 'incomplete', adds the good sets to the optimal
     # arrangement.
@@ -509,6 +733,10 @@ def applyArrangement(plate, arrangement):
     expMock = [exp.isMock for ss in arrangement for exp in ss.totoroExposures]
 
     if not any(expMock):
+        # Applies the pending statuses before the sets are deleted, as their
+        # pks may be reused for the new sets.
+        flushActiveBuffer()
+
         # Removes sets and exposure-set assignment from the DB
         with session.begin():
             for ss in plate.sets:
@@ -525,11 +753,10 @@ def applyArrangement(plate, arrangement):
 
                 session.flush()
 
-        # Gets the pks to use
-        pks = getConsecutiveSets(len(arrangement))
-
-        # Now creates the new sets and assigns the exposures
+        # Now creates the new sets, using a block of consecutive pks, and
+        # assigns the exposures
         with session.begin():
+            pks = allocateSetPKs(session, len(arrangement))
             for ii, ss in enumerate(arrangement):
                 newSet = db.mangaDB.Set(pk=pks[ii])
                 session.add(newSet)
@@ -557,8 +784,14 @@ def applyArrangement(plate, arrangement):
     return True
 
 
-def calculatePermutations(inputList):
-    """Calculates all the possible permutations of a list of dithers."""
+def _getPermutationGroups(inputList):
+    """Returns the permutations of each dither used by calculatePermutations.
+
+    The first element is a list with a single tuple, the indices of the most
+    repeated dither. The rest are lists with all the permutations of the
+    indices of the other dithers, padded with None.
+
+    """
 
     pairs = [(nn, inputList[nn]) for nn in range(len(inputList))]
     pairs = sorted(pairs, key=lambda value: value[1])
@@ -580,6 +813,23 @@ def calculatePermutations(inputList):
     else:
         indices = []
 
+    return indices
+
+
+def calculatePermutations(inputList, prefix=()):
+    """Calculates all the possible permutations of a list of dithers.
+
+    If `prefix` is not empty, only the permutations in which the first dithers
+    are arranged as in `prefix` are returned. Those are a contiguous range of
+    the permutations returned without prefix.
+
+    """
+
+    indices = _getPermutationGroups(inputList)
+    if len(prefix) > 0:
+        indices = (indices[:1] + [[perm] for perm in prefix] +
+                   indices[len(prefix) + 1:])
+
     cartesianProduct = itertools.product(*indices)
     for prod in cartesianProduct:
         yield list(itertools.izip_longest(*prod))
@@ -660,36 +910,66 @@ def fixBadSets(sets):
     return sets
 
 
+# The key of the transaction-level advisory lock that serialises the
+# allocation of set pks between Totoro processes.
+_setPKLockKey = 7495001
+
+# Returns the first pk of the lowest gap of at least :nSets unused set pks or,
+# if there is none, the pk following the largest one. The gaps are found
+# using the index on pk, without reading the pks into memory.
+_setPKGapQuery = """
+    SELECT coalesce(
+        (SELECT start FROM (
+            SELECT 1 AS start, min(pk) - 1 AS size FROM {0}
+            UNION ALL
+            SELECT pk + 1 AS start,
+                   lead(pk) OVER (ORDER BY pk) - pk - 1 AS size
+            FROM {0}) AS gaps
+         WHERE size >= :nSets ORDER BY start LIMIT 1),
+        (SELECT coalesce(max(pk), 0) + 1 FROM {0}))
+    """
+
+
+def allocateSetPKs(session, nSets=1):
+    """Returns a list of `nSets` consecutive set pks that are not assigned.
+
+    Must be called within a transaction of `session` (i.e., inside a
+    ``with session.begin()`` block) in which the new sets are then created.
+    An advisory lock is held until the transaction finishes, so that other
+    Totoro processes cannot be given the same pks before the new sets have
+    been committed. The pks are found with a single query.
+
+    """
+
+    if session.transaction is None:
+        raise exceptions.TotoroError('allocateSetPKs must be called within a '
+                                     'transaction.')
+
+    db = getConnection()
+    setTable = db.mangaDB.Set.__table__.fullname
+
+    session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                    {'key': _setPKLockKey})
+
+    firstPK = session.execute(text(_setPKGapQuery.format(setTable)),
+                              {'nSets': nSets}).scalar()
+
+    return range(firstPK, firstPK + nSets)
+
+
 def getConsecutiveSets(nSets=1):
-    """Returns a list of consecutive set pks that are not assigned."""
+    """Returns a list of consecutive set pks that are not assigned.
+
+    The pks are not reserved. To create new sets, use `allocateSetPKs` within
+    the transaction that creates them.
+
+    """
 
     db = getConnection()
     session = db.Session()
 
-    # Finds already used set pks
     with session.begin():
-        setPKs = session.query(db.mangaDB.Set.pk).all()
-
-    # Creates a list of unused set pks
-    setPKs = np.array(setPKs).squeeze().tolist()
-    setPKs = sorted(setPKs)
-    candidatePKs = np.array([ii for ii in range(1, setPKs[-1] + 1)
-                             if ii not in setPKs])
-
-    # Splits the pks into groups of consecutive values
-    candidatePKsSplit = np.split(
-        candidatePKs, np.where(np.diff(candidatePKs) != 1)[0] + 1)
-
-    # If there is a groups with at least as many values as nSets, uses it.
-    pks = None
-    for split in candidatePKsSplit:
-        if len(split) >= nSets:
-            pks = split[0:nSets]
-            break
-
-    # If no consecutive range of pks exists, just continues from the last pk
-    if pks is None:
-        pks = range(setPKs[-1] + 1, setPKs[-1] + 1 + nSets)
+        pks = allocateSetPKs(session, nSets)
 
     return pks
 
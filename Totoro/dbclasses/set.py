@@ -14,8 +14,9 @@ Revision history:
 
 from __future__ import division
 from __future__ import print_function
-from exposure import Exposure
+from exposure import Exposure, MockExposure, getExposuresSN2
 from Totoro.db import getConnectionFull
+from Totoro.dbclasses.flagging import getActiveBuffer
 from Totoro import log, config, site
 from Totoro import exceptions
 from Totoro import utils
@@ -25,7 +26,7 @@ from copy import copy
 from astropy import time
 
 
-__all__ = ['Set', 'checkSet']
+__all__ = ['Set', 'MockSet', 'checkSet']
 
 
 def getPlateSets(inp, format='plate_id', **kwargs):
@@ -76,8 +77,14 @@ class Set(object):
             cls._instances[me._dbObject] = me
             return me
 
-    def __init__(self, input=None, mock=False, mjd=None, *args, **kwargs):
-        """A custom class based on mangaDB.Set."""
+    def __init__(self, input=None, mock=False, mjd=None, dbExposures=None,
+                 *args, **kwargs):
+        """A custom class based on mangaDB.Set.
+
+        If `dbExposures` is a list of plateDB.Exposure instances, they are
+        used as the exposures of the set instead of querying the DB.
+
+        """
 
         self.__dbAttributes__ = self._dbObject.__mapper__.attrs
 
@@ -88,7 +95,10 @@ class Set(object):
         self.mjd = mjd
 
         if not self.isMock:
-            self.totoroExposures = self.loadExposures()
+            if dbExposures is not None:
+                self.totoroExposures = [Exposure(exp) for exp in dbExposures]
+            else:
+                self.totoroExposures = self.loadExposures()
         else:
             self.totoroExposures = []
 
@@ -141,18 +151,32 @@ class Set(object):
     def fromExposures(exposures, **kwargs):
         """Creates a mock set for a list of Totoro.Exposures."""
 
-        newSet = Set(mock=True, **kwargs)
+        newSet = MockSet(**kwargs)
 
-        if isinstance(exposures, Exposure):
+        if isinstance(exposures, (Exposure, MockExposure)):
             newSet.totoroExposures = [exposures]
         else:
             for exp in exposures:
-                assert isinstance(exp, Exposure), \
+                assert isinstance(exp, (Exposure, MockExposure)), \
                     '{0} not an instance of Totoro.Exposure'.format(exp)
             newSet.totoroExposures = list(exposures)
 
         return newSet
 
+    def fork(self):
+        """Returns a copy of the set with its own list of exposures.
+
+        The copy shares the DB object and the exposures with the original set.
+        Used by `Plate.fork`.
+
+        """
+
+        fork = object.__new__(self.__class__)
+        fork.__dict__.update(self.__dict__)
+        fork.__dict__['totoroExposures'] = list(self.totoroExposures)
+
+        return fork
+
     def loadExposures(self):
 
         exposures = self.session.query(self.db.plateDB.Exposure).join(
@@ -172,7 +196,7 @@ class Set(object):
         if ra is None or dec is None:
             raise exceptions.TotoroError('ra and dec must be specified')
 
-        newSet = Set(mock=True, ra=ra, dec=dec, **kwargs)
+        newSet = MockSet(ra=ra, dec=dec, **kwargs)
 
         return newSet
 
@@ -269,8 +293,7 @@ class Set(object):
         if len(self.totoroExposures) == 0:
             return np.array([0.0, 0.0, 0.0, 0.0])
         else:
-            return np.nansum([exp.getSN2Array()
-                              for exp in self.totoroExposures], axis=0)
+            return np.nansum(getExposuresSN2(self.totoroExposures), axis=0)
 
     def getSN2Range(self):
         """Returns the SN2 range in which new exposures may be taken."""
@@ -408,6 +431,75 @@ class Set(object):
             return False
 
 
+class MockSet(object):
+    """A lightweight mock set that never touches the database.
+
+    Implements the same public API as a mock `Set` using `__slots__` and
+    without opening a session. Instances are created by `Set.fromExposures`
+    and `Set.createMockSet`.
+
+    """
+
+    __slots__ = ('totoroExposures', 'isMock', 'mjd', '_status', '_ra', '_dec')
+
+    pk = None
+    status = None
+    set_status_pk = None
+
+    def __init__(self, ra=None, dec=None, mjd=None, **kwargs):
+
+        self.totoroExposures = []
+        self.isMock = True
+        self.mjd = mjd
+
+        self._status = None
+        self._ra = ra
+        self._dec = dec
+
+    def fork(self):
+        """Returns a copy of the set with its own list of exposures."""
+
+        fork = MockSet(ra=self._ra, dec=self._dec, mjd=self.mjd)
+        fork.totoroExposures = list(self.totoroExposures)
+        fork._status = self._status
+
+        return fork
+
+    def getCoordinates(self):
+
+        if self._ra is not None and self._dec is not None:
+            return np.array([self._ra, self._dec], np.float)
+        else:
+            self._checkHasExposures()
+            return self.totoroExposures[0].getCoordinates()
+
+    # The rest of the API is shared with Set. None of these methods access
+    # the database for a mock set.
+    __repr__ = Set.__dict__['__repr__']
+    fromExposures = Set.__dict__['fromExposures']
+    createMockSet = Set.__dict__['createMockSet']
+    addMockExposure = Set.__dict__['addMockExposure']
+    _checkHasExposures = Set.__dict__['_checkHasExposures']
+    ra = Set.__dict__['ra']
+    dec = Set.__dict__['dec']
+    getHA = Set.__dict__['getHA']
+    getHARange = Set.__dict__['getHARange']
+    getDitherPositions = Set.__dict__['getDitherPositions']
+    getMissingDitherPositions = Set.__dict__['getMissingDitherPositions']
+    getSN2Array = Set.__dict__['getSN2Array']
+    getSN2Range = Set.__dict__['getSN2Range']
+    getSeeingRange = Set.__dict__['getSeeingRange']
+    getQuality = Set.__dict__['getQuality']
+    getStatus = Set.__dict__['getStatus']
+    getValidExposures = Set.__dict__['getValidExposures']
+    getAverageSeeing = Set.__dict__['getAverageSeeing']
+    getLST = Set.__dict__['getLST']
+    getLSTRange = Set.__dict__['getLSTRange']
+    getUTVisibilityWindow = Set.__dict__['getUTVisibilityWindow']
+    getUTRange = Set.__dict__['getUTRange']
+    complete = Set.__dict__['complete']
+
+
 def flagSet(set, statusLabel, errorCode, flag=True, message=None,
             silent=False, **kwargs):
     """Helper function to log and flag sets."""
@@ -416,9 +508,13 @@ def flagSet(set, statusLabel, errorCode, flag=True, message=None,
         log.debug(message)
 
     if flag:
-        # Avoids calling setSetStatus if there is nothing to flag
+        # Avoids calling setSetStatus if there is nothing to flag. Within a
+        # batchFlagging block, set_status_pk does not include the changes
+        # recorded in the buffer, so these are also checked.
+        buffer = getActiveBuffer()
         if (statusLabel in ['Incomplete', 'Unplugged', 'Bad'] and
-                set.set_status_pk is None):
+                set.set_status_pk is None and
+                (buffer is None or not buffer.hasSetStatus(set.pk))):
             pass
         else:
             setSetStatus(set, statusLabel)
@@ -438,6 +534,9 @@ def setSetStatus(set, status):
         The status to be set. It must be one of the values in
         mangaDB.SetStatus.label.
 
+    If called within a `batchFlagging` block, the change is recorded and
+    applied when the block exits.
+
     Returns
     -------
     result : bool
@@ -453,14 +552,20 @@ def setSetStatus(set, status):
     else:
         pk = set
 
+    try:
+        statusPK = db.lookupTables.getPK(db.mangaDB.SetStatus, status)
+    except:
+        # If the status is not found, we remove the status.
+        statusPK = None
+
+    buffer = getActiveBuffer()
+
+    if buffer is not None:
+        buffer.addSetStatus(pk, statusPK)
+        log.debug('mangaDB.Set.pk={0} will be set to {1}'.format(pk, status))
+        return True
+
     with session.begin():
-        try:
-            queryStatus = session.query(db.mangaDB.SetStatus).filter(
-                db.mangaDB.SetStatus.label == status).one()
-            statusPK = queryStatus.pk
-        except:
-            # If the status is not found, we remove the status.
-            statusPK = None
 
         ss = session.query(db.mangaDB.Set).get(pk)
 
@@ -542,8 +647,8 @@ def checkSet(set, flag=True, flagExposures=None, force=False, silent=False,
 
     """
 
-    assert isinstance(set, Set), ('input set is not an instance of '
-                                  'Totoro.dbclasses.Set')
+    assert isinstance(set, (Set, MockSet)), ('input set is not an instance '
+                                             'of Totoro.dbclasses.Set')
 
     if set.isMock or any([exp.isMock for exp in set.totoroExposures]):
         flag = False
@@ -1,6 +1,8 @@
-
+from Totoro.core.lazy import LazyObject
 from observingPlan import ObservingPlan
-observingPlan = ObservingPlan()
+
+# The observing plan is read (or its optimised version loaded) on first use.
+observingPlan = LazyObject(ObservingPlan)
 
 from planner import Planner
 from plugger import Plugger
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+ephemeris.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import config, log, readPath, site
+from Totoro.exceptions import TotoroUserWarning
+from Totoro.utils import astro
+from astropy import time
+import hashlib
+import numpy as np
+import os
+import warnings
+
+
+__all__ = ['Ephemeris', 'getEphemeris']
+
+# Increase if the format of the cache file changes.
+_CACHE_VERSION = 1
+
+_ephemeris = None
+
+
+class Ephemeris(object):
+    """Per-night LST and Sun altitude for the nights in the observing plan.
+
+    The LST and Sun altitude are sampled every ``sampling`` seconds between
+    the JD0 and JD1 of a night in the observing plan the first time a JD
+    within that night is requested, and values for arbitrary JDs are
+    obtained by linear interpolation. The sampled nights are kept in memory.
+    JDs that do not fall within any night are computed directly.
+
+    If ``cacheDir`` is defined, the sampled nights are read from a file keyed
+    by the schedule file and its nights, the observatory configuration and
+    the sampling, and `save` writes the nights sampled so far to it. The
+    ephemeris is never saved unless `save` is called.
+
+    Parameters
+    ----------
+    plan : `ObservingPlan`, `astropy.table.Table` or None
+        The observing plan (or a table with ``JD0`` and ``JD1`` columns) from
+        which the nights are taken. If None, uses the default observing
+        plan.
+    sampling : float or None
+        The sampling of the ephemeris, in seconds. Defaults to
+        ``config['ephemeris']['sampling']``.
+    cacheDir : str or None
+        The directory where the sampled nights are saved. Defaults to
+        ``config['ephemeris']['cacheDir']``. If None or False, the ephemeris
+        is neither read from nor saved to disk.
+
+    """
+
+    def __init__(self, plan=None, sampling=None, cacheDir=None):
+
+        if plan is None:
+            from Totoro.scheduler import observingPlan as plan
+
+        self.sampling = sampling or config['ephemeris']['sampling']
+
+        if cacheDir is None:
+            cacheDir = config['ephemeris']['cacheDir']
+        self.cacheDir = readPath(cacheDir) if cacheDir else None
+
+        self.key = self._getKey(plan)
+
+        self.jd0 = np.asarray(plan['JD0'], dtype=float)
+        self.jd1 = np.asarray(plan['JD1'], dtype=float)
+
+        # Sampled nights, as (jd, lst, sunAltitude) tuples keyed by the index
+        # of the night in the plan.
+        self._nights = {}
+
+        self._read()
+
+    def _getKey(self, plan):
+        """Returns the hash identifying an ephemeris file.
+
+        The hash depends on the schedule file and nights of the plan, the
+        observatory configuration and the sampling.
+
+        """
+
+        md5 = hashlib.md5()
+
+        md5.update(str(getattr(plan, 'scheduleFile', '')).encode('utf-8'))
+        for column in ['JD0', 'JD1']:
+            md5.update(np.ascontiguousarray(plan[column],
+                                            dtype=float).tobytes())
+
+        observatory = config['observatory']
+        md5.update(repr([(key, observatory[key])
+                         for key in sorted(observatory)]).encode('utf-8'))
+        md5.update(repr((self.sampling, _CACHE_VERSION)).encode('utf-8'))
+
+        return md5.hexdigest()
+
+    @property
+    def cacheFile(self):
+        """The path of the cache file for this ephemeris."""
+
+        if self.cacheDir is None:
+            return None
+
+        return os.path.join(self.cacheDir,
+                            'ephemeris_{0}.npz'.format(self.key))
+
+    def _getNight(self, night):
+        """Returns the sampled arrays of a night, sampling it if needed."""
+
+        if night in self._nights:
+            return self._nights[night]
+
+        step = self.sampling / 86400.
+        jd = np.arange(self.jd0[night], self.jd1[night] + step, step)
+
+        # The LST is unwrapped so that it can be interpolated within a night.
+        lst = astro.localSiderealTime(jd)
+        lst = np.rad2deg(np.unwrap(np.deg2rad(lst * 15.))) / 15.
+
+        sunAltitude = np.asarray(
+            site.getSunAltitude(time.Time(jd, format='jd', scale='tai')),
+            dtype=float)
+
+        self._nights[night] = (jd, lst, sunAltitude)
+
+        log.debug('ephemeris sampled for night {0} ({1} samples).'
+                  .format(night, len(jd)))
+
+        return self._nights[night]
+
+    def _read(self):
+        """Reads the sampled nights from the cache file, if it exists."""
+
+        cacheFile = self.cacheFile
+
+        if cacheFile is None or not os.path.exists(cacheFile):
+            return False
+
+        try:
+            data = np.load(cacheFile)
+            night = data['night']
+            for nn in np.unique(night):
+                inNight = night == nn
+                self._nights[int(nn)] = (data['jd'][inNight],
+                                         data['lst'][inNight],
+                                         data['sunAltitude'][inNight])
+        except Exception as ee:
+            warnings.warn('failed reading ephemeris {0}: {1}'
+                          .format(cacheFile, ee), TotoroUserWarning)
+            self._nights = {}
+            return False
+
+        log.debug('ephemeris read from {0}'.format(cacheFile))
+
+        return True
+
+    def save(self):
+        """Saves the nights sampled so far to the cache file.
+
+        Does nothing if ``cacheDir`` is not defined.
+
+        """
+
+        cacheFile = self.cacheFile
+
+        if cacheFile is None or len(self._nights) == 0:
+            return
+
+        nights = sorted(self._nights)
+        arrays = [self._nights[nn] for nn in nights]
+
+        try:
+            if not os.path.exists(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            np.savez(cacheFile,
+                     jd=np.concatenate([jd for jd, __, __ in arrays]),
+                     night=np.concatenate(
+                         [np.zeros(len(arrays[ii][0]), dtype=int) + nn
+                          for ii, nn in enumerate(nights)]),
+                     lst=np.concatenate([lst for __, lst, __ in arrays]),
+                     sunAltitude=np.concatenate(
+                         [alt for __, __, alt in arrays]))
+        except (IOError, OSError) as ee:
+            warnings.warn('failed saving ephemeris to {0}: {1}'
+                          .format(cacheFile, ee), TotoroUserWarning)
+            return
+
+        log.debug('ephemeris saved to {0}'.format(cacheFile))
+
+    def _interpolate(self, jd, column):
+        """Interpolates the values in ``column`` of the nights at ``jd``.
+
+        ``column`` is 1 for the LST and 2 for the Sun altitude. Returns the
+        interpolated values and a boolean mask of the JDs that fall within a
+        night. Values for JDs outside the nights are undefined.
+
+        """
+
+        jd = np.atleast_1d(np.asarray(jd, dtype=float))
+
+        night = np.searchsorted(self.jd0, jd, side='right') - 1
+        inNight = (night >= 0)
+        inNight[inNight] &= jd[inNight] <= self.jd1[night[inNight]]
+
+        interpolated = np.zeros(len(jd))
+        for nn in np.unique(night[inNight]):
+            selected = inNight & (night == nn)
+            arrays = self._getNight(int(nn))
+            interpolated[selected] = np.interp(jd[selected], arrays[0],
+                                               arrays[column])
+
+        return interpolated, inNight
+
+    def getLST(self, jd):
+        """Returns the LST, in hours, for a JD or array of JDs."""
+
+        isScalar = np.isscalar(jd)
+        jd = np.atleast_1d(np.asarray(jd, dtype=float))
+
+        lst, inNight = self._interpolate(jd, 1)
+        lst = lst % 24.
+
+        if not np.all(inNight):
+            lst[~inNight] = astro.localSiderealTime(jd[~inNight])
+
+        return lst[0] if isScalar else lst
+
+    def getSunAltitude(self, jd):
+        """Returns the altitude of the Sun, in degrees, for a JD or array of
+        JDs."""
+
+        isScalar = np.isscalar(jd)
+        jd = np.atleast_1d(np.asarray(jd, dtype=float))
+
+        altitude, inNight = self._interpolate(jd, 2)
+
+        if not np.all(inNight):
+            altitude[~inNight] = site.getSunAltitude(
+                time.Time(jd[~inNight], format='jd', scale='tai'))
+
+        return altitude[0] if isScalar else altitude
+
+
+def getEphemeris():
+    """Returns the ephemeris for the default observing plan.
+
+    The ephemeris is created the first time this function is called. Nights
+    are only sampled when they are used.
+
+    """
+
+    global _ephemeris
+
+    if _ephemeris is None:
+        _ephemeris = Ephemeris()
+
+    return _ephemeris
@@ -17,12 +17,10 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-import matplotlib as mpl
-from matplotlib import pyplot as plt
-from matplotlib.patches import Ellipse
-from matplotlib.legend_handler import HandlerPatch
-from matplotlib import path
-from matplotlib.patches import PathPatch
+from Totoro.core.lazy import LazyObject
+
+# Matplotlib is only imported when a region is first used or when plotting,
+# so that importing this module (and Totoro) does not load it.
 
 
 __all__ = ['HSC', 'UKIDSS', 'ATLAS', 'ALFALFA', 'ApertifMedDeep', 'GAMA',
@@ -44,6 +42,8 @@ defaultLW = 1.5
 def getAxes(projection='rect'):
     """Returns axes for a particular projection."""
 
+    from matplotlib import pyplot as plt
+
     if projection == 'rect':
         fig = plt.figure(figsize=(10, 6))
         ax = fig.add_subplot(111)
@@ -81,6 +81,9 @@ def getAxes(projection='rect'):
 def addLegend(ax, handles, labels, **kwargs):
     """Add a legend using ellipses for the scatter plots."""
 
+    from matplotlib.legend_handler import HandlerPatch
+    from matplotlib.patches import Ellipse
+
     ax.legend(handles=handles, labels=labels,
               handler_map={Ellipse: HandlerPatch(
                            patch_func=make_legend_ellipse)}, **kwargs)
@@ -91,6 +94,8 @@ def addLegend(ax, handles, labels, **kwargs):
 def make_legend_ellipse(legend, orig_handle, xdescent, ydescent,
                         width, height, fontsize):
 
+    from matplotlib.patches import Ellipse
+
     pp = Ellipse(xy=(0.5 * width - 0.5 * xdescent,
                      0.5 * height - 0.5 * ydescent),
                  width=(height + ydescent),
@@ -102,6 +107,8 @@ def make_legend_ellipse(legend, orig_handle, xdescent, ydescent,
 def plotEllipse(ax, RA, Dec, org=None, size=3.0, bgcolor='b',
                 zorder=0, alpha=0.8):
 
+    from matplotlib.patches import Ellipse
+
     if org:
         RA = np.remainder(RA + 360 - org, 360)  # shift RA values
         ind = RA > 180.
@@ -136,6 +143,9 @@ def etalambda2radec(eta, lambd):
 def getSDSSRegion(vertices):
     """Returns a patch from SDSS coordinates."""
 
+    from matplotlib import path
+    from matplotlib.patches import PathPatch
+
     eta = np.linspace(vertices[0], vertices[1], 5e1)
     lambd = np.linspace(vertices[2], vertices[3], 5e1)
 
@@ -154,6 +164,9 @@ def getSDSSRegion(vertices):
 def getPolygon(vertices):
     """Returns a patch with polygonal shape based on the input vertices."""
 
+    from matplotlib import path
+    from matplotlib.patches import PathPatch
+
     regPath = path.Path(vertices, closed=True)
     regPatch = PathPatch(regPath)
 
@@ -163,6 +176,10 @@ def getPolygon(vertices):
 def getRectangle(vertices, angle=0.0):
     """Returns a rectangular patch."""
 
+    import matplotlib as mpl
+    from matplotlib import path
+    from matplotlib.patches import PathPatch
+
     ra0 = np.min(vertices[0:2])
     ra1 = np.max(vertices[0:2])
     dec0 = np.min(vertices[2:])
@@ -193,6 +210,9 @@ def getRectangle(vertices, angle=0.0):
 def plotPatch(ax, regPatch, zorder=100, projection='rect',
               useRadians=False, org=0, **kwargs):
 
+    from matplotlib import path
+    from matplotlib.patches import PathPatch
+
     vertices = regPatch.get_path().vertices
 
     if projection != 'rect':
@@ -222,6 +242,8 @@ def plotPatch(ax, regPatch, zorder=100, projection='rect',
 def addText(ax, xx, yy, text, ha='left', size=None, projection='rect',
             useRadians=False, org=0, **kwargs):
 
+    import matplotlib as mpl
+
     if projection != 'rect':
 
         if not size:
@@ -359,25 +381,25 @@ def plotGAMA(ax, **kwargs):
 
 
 # HSC regions
-HSC_1 = getRectangle((22 * 15, 360, -1, 7))
-HSC_2 = getPolygon(np.array([[0, -1],
-                             [1.83333 * 15, -1],
-                             [1.83333 * 15, -7],
-                             [2.66666 * 15, -7],
-                             [2.66666 * 15, 7],
-                             [0, 7],
-                             [0, -1]]))
-
-HSC_SGC_Mollweide = getPolygon(np.array([[22 * 15, -1],
+HSC_1 = LazyObject(getRectangle, (22 * 15, 360, -1, 7))
+HSC_2 = LazyObject(getPolygon, np.array([[0, -1],
                                          [1.83333 * 15, -1],
                                          [1.83333 * 15, -7],
                                          [2.66666 * 15, -7],
                                          [2.66666 * 15, 7],
-                                         [22 * 15, 7],
-                                         [22 * 15, -1]]))
-
-HSC_3 = getRectangle((8.5 * 15, 15 * 15, -2, 5))
-HSC_4 = getRectangle((13.3 * 15, 16.6666 * 15, 42.5, 44))
+                                         [0, 7],
+                                         [0, -1]]))
+
+HSC_SGC_Mollweide = LazyObject(getPolygon, np.array([[22 * 15, -1],
+                                                     [1.83333 * 15, -1],
+                                                     [1.83333 * 15, -7],
+                                                     [2.66666 * 15, -7],
+                                                     [2.66666 * 15, 7],
+                                                     [22 * 15, 7],
+                                                     [22 * 15, -1]]))
+
+HSC_3 = LazyObject(getRectangle, (8.5 * 15, 15 * 15, -2, 5))
+HSC_4 = LazyObject(getRectangle, (13.3 * 15, 16.6666 * 15, 42.5, 44))
 HSC = [HSC_1, HSC_2, HSC_3, HSC_4]
 
 HSC_S_Wide_vertices = np.array(
@@ -391,31 +413,33 @@ HSC_S_Wide_vertices = np.array(
      [225., -2.5],
      [127.5, -2.5]])
 
-HSC_S_Wide = getPolygon(HSC_S_Wide_vertices)
+HSC_S_Wide = LazyObject(getPolygon, HSC_S_Wide_vertices)
 
 # A special region which is the HSC-N regions a bit wider
-HSC_N_Wide = getRectangle((15. * 15, 16.6666 * 15, 41.5, 45))
+HSC_N_Wide = LazyObject(getRectangle, (15. * 15, 16.6666 * 15, 41.5, 45))
 
-Stripe82 = getRectangle((0, 360, -1, 1))
+Stripe82 = LazyObject(getRectangle, (0, 360, -1, 1))
 
-SGC = [getRectangle((0, 5 * 15, -20, 20)), getRectangle((300, 360, -20, 20))]
+SGC = [LazyObject(getRectangle, (0, 5 * 15, -20, 20)),
+       LazyObject(getRectangle, (300, 360, -20, 20))]
 
 # Herschel-ATLAS region
-ATLAS = getRectangle((199.5 - 7.5, 199.5 + 7.5, 29 - 5, 29 + 5), angle=-8)
+ATLAS = LazyObject(getRectangle, (199.5 - 7.5, 199.5 + 7.5, 29 - 5, 29 + 5),
+                   angle=-8)
 
 # GAMA fields
-GAMA_1 = getRectangle((129, 141, -1, 3))
-GAMA_2 = getRectangle((174, 186, -2, 2))
-GAMA_3 = getRectangle((211.5, 223.5, -2, 2))
+GAMA_1 = LazyObject(getRectangle, (129, 141, -1, 3))
+GAMA_2 = LazyObject(getRectangle, (174, 186, -2, 2))
+GAMA_3 = LazyObject(getRectangle, (211.5, 223.5, -2, 2))
 GAMA = [GAMA_1, GAMA_2, GAMA_3]
 
 # ALFALFA regions
-ALFALFA_1 = getRectangle((7.5 * 15, 16.5 * 15, 0, 36))
-ALFALFA_2 = getRectangle((0, 3. * 15, 0, 36))
-ALFALFA_3 = getRectangle((22 * 15, 24 * 15, 0, 36))
+ALFALFA_1 = LazyObject(getRectangle, (7.5 * 15, 16.5 * 15, 0, 36))
+ALFALFA_2 = LazyObject(getRectangle, (0, 3. * 15, 0, 36))
+ALFALFA_3 = LazyObject(getRectangle, (22 * 15, 24 * 15, 0, 36))
 ALFALFA = [ALFALFA_1, ALFALFA_2, ALFALFA_3]
 
-ALFALFA_Mollweide = getRectangle((22 * 15, 3 * 15, 0, 36))
+ALFALFA_Mollweide = LazyObject(getRectangle, (22 * 15, 3 * 15, 0, 36))
 
 # HETDEX field
 HETDEX_vertices = np.array(
@@ -438,9 +462,9 @@ CVn_vertices = np.array(
      [184.19, 46.30],
      [184.98, 31.55]])
 
-HETDEX = getPolygon(HETDEX_vertices)
-PerseusPisces = getRectangle((23.7, 33.3, 29.9, 37.9))
-CVn = getPolygon(CVn_vertices)
+HETDEX = LazyObject(getPolygon, HETDEX_vertices)
+PerseusPisces = LazyObject(getRectangle, (23.7, 33.3, 29.9, 37.9))
+CVn = LazyObject(getPolygon, CVn_vertices)
 
 # Apertif medium-depth fields
 ApertifMedDeep = [HETDEX, PerseusPisces, CVn]
@@ -550,12 +574,12 @@ UKIDSS_Region6 = np.array([
     [121.75807, +17.33957],
     [120.38225, +17.00487]])
 
-UKIDSS = [getPolygon(UKIDSS_Region1),
-          getPolygon(UKIDSS_Region2),
-          getPolygon(UKIDSS_Region3),
-          getPolygon(UKIDSS_Region4),
-          getPolygon(UKIDSS_Region5),
-          getPolygon(UKIDSS_Region6)]
+UKIDSS = [LazyObject(getPolygon, UKIDSS_Region1),
+          LazyObject(getPolygon, UKIDSS_Region2),
+          LazyObject(getPolygon, UKIDSS_Region3),
+          LazyObject(getPolygon, UKIDSS_Region4),
+          LazyObject(getPolygon, UKIDSS_Region5),
+          LazyObject(getPolygon, UKIDSS_Region6)]
 
 # Joined regs 1 and 2 for Mollweide projection
 UKIDSS_SGC_Mollweide_vertices = np.array([
@@ -585,7 +609,7 @@ UKIDSS_SGC_Mollweide_vertices = np.array([
     [359.89682, -02.32808],
     [360.00000, -02.32808]])
 
-UKIDSS_SGC_Mollweide = getPolygon(UKIDSS_SGC_Mollweide_vertices)
+UKIDSS_SGC_Mollweide = LazyObject(getPolygon, UKIDSS_SGC_Mollweide_vertices)
 
 
 # Some renaming, for convenience
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+lstIndex.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import config
+from Totoro import utils
+from Totoro.scheduler.ephemeris import getEphemeris
+from astropy import time
+import numpy as np
+
+
+__all__ = ['LSTIndex']
+
+expTime = config['exposure']['exposureTime']
+
+# Margin, in hours, to avoid losing candidates to rounding errors.
+_epsilon = 1e-9
+
+
+class LSTIndex(object):
+    """A wrap-aware index of the LST windows of a list of plates.
+
+    The LST windows (as returned by `Plate.getLSTRange`) are sorted by their
+    start. Because no window is longer than the longest one, the plates
+    whose window overlaps an LST range are those whose window starts in a
+    range that can be found with a binary search. The candidates are then
+    checked with the same criteria used by `scheduler_utils.isObservable`.
+
+    Parameters
+    ----------
+    plates : list
+        The list of plates or fields to index.
+
+    """
+
+    def __init__(self, plates):
+
+        self.plates = list(plates)
+
+        self.lstRanges = np.array([plate.getLSTRange()
+                                   for plate in self.plates],
+                                  dtype=float).reshape(-1, 2)
+
+        lengths = (self.lstRanges[:, 1] - self.lstRanges[:, 0]) % 24.
+        self._maxLength = np.max(lengths) if len(lengths) > 0 else 0.
+
+        self._order = np.argsort(self.lstRanges[:, 0], kind='mergesort')
+        self._starts = self.lstRanges[self._order, 0]
+
+    def __len__(self):
+        return len(self.plates)
+
+    def _getCandidates(self, lst0, lst1):
+        """Returns the indices of the plates that may overlap [lst0, lst1].
+
+        A window that overlaps the range must start between
+        ``lst0 - maxLength`` and ``lst1``.
+
+        """
+
+        length = (lst1 - lst0) % 24. + self._maxLength + 2 * _epsilon
+
+        if length >= 24.:
+            return np.arange(len(self.plates))
+
+        start = (lst0 - self._maxLength - _epsilon) % 24.
+        end = start + length
+
+        idx0 = np.searchsorted(self._starts, start, side='left')
+
+        if end < 24.:
+            idx1 = np.searchsorted(self._starts, end, side='right')
+            return self._order[idx0:idx1]
+        else:
+            idx1 = np.searchsorted(self._starts, end - 24., side='right')
+            return np.concatenate((self._order[idx0:], self._order[:idx1]))
+
+    def getContaining(self, lst):
+        """Returns the plates whose LST window contains `lst`."""
+
+        candidates = self._getCandidates(lst, lst)
+        lstRanges = self.lstRanges[candidates]
+
+        contains = ((lst - lstRanges[:, 0]) % 24. <=
+                    (lstRanges[:, 1] - lstRanges[:, 0]) % 24.)
+
+        return self._getPlates(candidates[contains])
+
+    def getTimeToNextOpening(self, lst):
+        """Returns the LST hours from `lst` until the next window opens.
+
+        Returns None if the index is empty.
+
+        """
+
+        if len(self.plates) == 0:
+            return None
+
+        idx = np.searchsorted(self._starts, lst, side='right')
+        nextStart = self._starts[idx % len(self._starts)]
+
+        return (nextStart - lst) % 24.
+
+    def getOverlapping(self, lstRange, minLength=None):
+        """Returns the plates whose LST window overlaps an LST range.
+
+        Only plates whose intersection with `lstRange` is at least
+        `minLength` hours (by default, the length of an exposure) are
+        returned, in the same order as in the index.
+
+        """
+
+        if minLength is None:
+            minLength = expTime / 3600.
+
+        candidates = self._getCandidates(lstRange[0], lstRange[1])
+
+        lengths = utils.getIntervalIntersectionLengths(
+            self.lstRanges[candidates], lstRange, wrapAt=24.)
+
+        return self._getPlates(candidates[lengths >= minLength])
+
+    def getObservable(self, jdRange):
+        """Returns the plates that are observable in a range of JDs.
+
+        Equivalent to ``[plate for plate in plates if isObservable(plate,
+        jdRange)]``, that is, the plates whose LST window contains the
+        beginning of `jdRange` and overlaps it for at least one exposure.
+
+        """
+
+        lstRange = getEphemeris().getLST(jdRange)
+
+        candidates = self._getCandidates(lstRange[0], lstRange[0])
+        lstRanges = self.lstRanges[candidates]
+
+        containsStart = ((lstRange[0] - lstRanges[:, 0]) % 24. <=
+                         (lstRanges[:, 1] - lstRanges[:, 0]) % 24.)
+
+        lengths = utils.getIntervalIntersectionLengths(
+            lstRanges, lstRange, wrapAt=24.)
+
+        return self._getPlates(
+            candidates[containsStart & (lengths >= expTime / 3600.)])
+
+    def getObservableNow(self, jd=None):
+        """Returns the plates that can be observed for a whole exposure
+        starting at `jd` (by default, now)."""
+
+        if jd is None:
+            jd = time.Time.now().jd
+
+        return self.getObservable([jd, jd + expTime / 86400.])
+
+    def _getPlates(self, indices):
+        """Returns the plates for a list of indices, sorted by index."""
+
+        return [self.plates[ii] for ii in np.sort(indices)]
@@ -15,10 +15,17 @@ from astropy import table, time
 from Totoro import exceptions
 import warnings
 from Totoro import config, log, readPath
+import hashlib
 import numpy as np
 import os
 
 
+# Increase if the format of the optimised plan file changes.
+_OPTIMISED_PLAN_VERSION = 2
+
+_planColumns = ['JD', 'JD0', 'JD1', 'Position', 'RUN', 'RUN_DAY']
+
+
 def getScheduleFile():
 
     try:
@@ -49,13 +56,18 @@ class ObservingPlan(object):
     format : str
         The input format of the plan. The options are 'autoscheduler',
         'autoscheduler.utc', 'autoscheduler.jd', 'sidereal', 'utc' or 'jd'.
-    useOptimisedPlan : bool
+    useOptimisedPlan : bool or None
         It True, tries to read the optimised file (in JD format) for the
-        input plan. This notably improves performance.
-    saveOptimisedPlan : bool
+        input plan. This notably improves performance. Defaults to
+        ``config['observingPlan']['useOptimisedPlan']``.
+    saveOptimisedPlan : bool or None
         If True, once the input observing plan has been converted to JD,
-        saves it to the configuration directory. This optimised file will
-        later be read if useOptimisedPlan is True.
+        saves it to ``cacheDir``. This optimised file will later be read if
+        useOptimisedPlan is True. Defaults to
+        ``config['observingPlan']['saveOptimisedPlan']``.
+    cacheDir : str or None
+        The directory for the optimised files. Defaults to
+        ``config['observingPlan']['cacheDir']``.
     survey : str
         If None, the observing plan for all plans will be kept, but survey
         will need to be defined for some methods.
@@ -63,7 +75,8 @@ class ObservingPlan(object):
     """
 
     def __init__(self, schedule=config['observingPlan']['schedule'],
-                 **kwargs):
+                 useOptimisedPlan=None, saveOptimisedPlan=None,
+                 cacheDir=None, **kwargs):
 
         if isinstance(schedule, basestring) and schedule.lower() == 'none':
             schedule = getScheduleFile()
@@ -79,6 +92,72 @@ class ObservingPlan(object):
             raise exceptions.TotoroError('schedule {0} not found'.format(
                                          scheduleToPrint))
 
+        if useOptimisedPlan is None:
+            useOptimisedPlan = config['observingPlan']['useOptimisedPlan']
+        if saveOptimisedPlan is None:
+            saveOptimisedPlan = config['observingPlan']['saveOptimisedPlan']
+        if cacheDir is None:
+            cacheDir = config['observingPlan']['cacheDir']
+
+        self.optimisedPlanFile = os.path.join(
+            readPath(cacheDir), 'observingPlan_{0}.npz'.format(
+                hashlib.md5(self.scheduleFile.encode('utf-8')).hexdigest()))
+
+        if not useOptimisedPlan or not self._readOptimisedPlan():
+
+            self._readSchedule()
+
+            if saveOptimisedPlan:
+                self._saveOptimisedPlan()
+
+        log.debug('observing plan {0} loaded.'.format(scheduleToPrint))
+
+        self._buildIndex()
+
+    def _buildIndex(self):
+        """Builds the arrays and dictionaries used to look up nights.
+
+        Lookups by JD use a dictionary of row indices. If the nights are
+        sorted and do not overlap, lookups by time use `numpy.searchsorted`
+        on the ``JD0`` and ``JD`` columns; otherwise, the columns are scanned.
+        This method must be called again if `plan` is modified.
+
+        """
+
+        self._JD = np.array(self.plan['JD'])
+        self._JD0 = np.array(self.plan['JD0'], dtype=float)
+        self._JD1 = np.array(self.plan['JD1'], dtype=float)
+
+        self._jdIndex = {}
+        for ii, jd in enumerate(self._JD):
+            self._jdIndex.setdefault(jd.item(), []).append(ii)
+
+        self._runLastIndex = {}
+        for ii, run in enumerate(self.plan['RUN']):
+            self._runLastIndex[run.item()] = ii
+
+        self._sorted = bool(np.all(np.diff(self._JD) >= 0) and
+                            np.all(np.diff(self._JD0) >= 0) and
+                            np.all(self._JD0[1:] >= self._JD1[:-1]))
+
+    def _getIndices(self, jd):
+        """Returns the indices of the rows for a JD."""
+
+        return self._jdIndex.get(jd, [])
+
+    def getRow(self, jd):
+        """Returns the row for the night ``int(jd)`` or None."""
+
+        indices = self._getIndices(int(jd))
+
+        if len(indices) == 0:
+            return None
+
+        return self.plan[indices[0]]
+
+    def _readSchedule(self):
+        """Reads and processes the schedule file."""
+
         plan = table.Table.read(self.scheduleFile,
                                 format='ascii.no_header')
 
@@ -88,43 +167,110 @@ class ObservingPlan(object):
         self.plan.rename_column('col11', 'JD0')
         self.plan.rename_column('col12', 'JD1')
 
+        position = np.where(
+            (plan['col11'] > plan['col5']) & (plan['col11'] > plan['col9']),
+            2, 1)
+        position[plan['col11'] == 0] = 0
         self.plan.add_column(
-            table.Column(np.zeros(len(self.plan)), name='Position', dtype=int))
-        for ii, row in enumerate(plan):
-            if row['col11'] == 0:
-                continue
-            if row['col11'] > row['col5'] and row['col11'] > row['col9']:
-                self.plan['Position'][ii] = 2
-            else:
-                self.plan['Position'][ii] = 1
-
-        log.debug('observing plan {0} loaded.'.format(scheduleToPrint))
+            table.Column(position, name='Position', dtype=int))
 
         self.addRunDayCol()
         self.plan = self.plan[(self.plan['JD0'] > 0) & (self.plan['JD1'] > 0)]
 
+    def _getScheduleHash(self):
+        """Returns the MD5 hash of the contents of the schedule file."""
+
+        md5 = hashlib.md5()
+        with open(self.scheduleFile, 'rb') as schedule:
+            md5.update(schedule.read())
+
+        return md5.hexdigest()
+
+    def _readOptimisedPlan(self):
+        """Reads the optimised plan, if it exists and is up to date.
+
+        The optimised plan is valid if it was saved with the same version of
+        the format and the hash of the schedule file matches the one recorded
+        when it was saved. The modification time and size of the file are
+        compared first, so that the hash is not calculated if they differ.
+
+        """
+
+        if not os.path.exists(self.optimisedPlanFile):
+            return False
+
+        try:
+            data = np.load(self.optimisedPlanFile)
+
+            if int(data['version']) != _OPTIMISED_PLAN_VERSION:
+                return False
+
+            if (float(data['mtime']) !=
+                    os.path.getmtime(self.scheduleFile) or
+                    int(data['size']) != os.path.getsize(self.scheduleFile)):
+                return False
+
+            if str(data['hash']) != self._getScheduleHash():
+                return False
+
+            self.plan = table.Table([data[column] for column in _planColumns],
+                                    names=_planColumns)
+
+        except Exception as ee:
+            warnings.warn('failed reading optimised plan {0}: {1}'
+                          .format(self.optimisedPlanFile, ee),
+                          exceptions.TotoroUserWarning)
+            return False
+
+        log.debug('optimised plan read from {0}'
+                  .format(self.optimisedPlanFile))
+
+        return True
+
+    def _saveOptimisedPlan(self):
+        """Saves the processed plan to the optimised plan file."""
+
+        cacheDir = os.path.dirname(self.optimisedPlanFile)
+
+        columns = dict((column, np.array(self.plan[column]))
+                       for column in _planColumns)
+
+        try:
+            if not os.path.exists(cacheDir):
+                os.makedirs(cacheDir)
+            np.savez(self.optimisedPlanFile,
+                     version=_OPTIMISED_PLAN_VERSION,
+                     mtime=os.path.getmtime(self.scheduleFile),
+                     size=os.path.getsize(self.scheduleFile),
+                     hash=self._getScheduleHash(), **columns)
+        except (IOError, OSError) as ee:
+            warnings.warn('failed saving optimised plan to {0}: {1}'
+                          .format(self.optimisedPlanFile, ee),
+                          exceptions.TotoroUserWarning)
+            return
+
+        log.debug('optimised plan saved to {0}'
+                  .format(self.optimisedPlanFile))
+
     def addRunDayCol(self):
-        """Adds a column with the night within the run."""
-
-        nDay = 1
-        nRun = 1
-        ll = []
-        run = []
-
-        for row in self.plan:
-            if row['JD0'] != 0.:
-                ll.append(nDay)
-                run.append(nRun)
-                nDay += 1
-            else:
-                ll.append(-1)
-                run.append(-1)
-                nDay = 1
-                nRun += 1
-
-        run = np.array(run)
-        for nn, value in enumerate(np.unique(run[run > 0])):
-            run[run == value] = nn + 1
+        """Adds a column with the night within the run.
+
+        Nights with ``JD0 == 0`` separate runs. The nights of each run are
+        numbered from 1, and runs are numbered consecutively.
+
+        """
+
+        valid = np.array(self.plan['JD0']) != 0.
+        indices = np.arange(len(self.plan))
+
+        # Index of the last night separating runs before each night.
+        lastSeparator = np.maximum.accumulate(np.where(valid, -1, indices))
+
+        ll = np.where(valid, indices - lastSeparator, -1)
+        run = np.where(valid, np.cumsum(~valid) + 1, -1)
+
+        if np.any(valid):
+            run[valid] = np.unique(run[valid], return_inverse=True)[1] + 1
 
         self.plan.add_column(table.Column(data=run, name='RUN', dtype=int))
         self.plan.add_column(table.Column(data=ll, name='RUN_DAY', dtype=int))
@@ -145,14 +291,22 @@ class ObservingPlan(object):
 
     def getClosest(self, dd):
 
-        tt = self.plan[(self.plan['JD0'] < dd) & (self.plan['JD1'] > dd)]
+        if not self._sorted:
+            tt = self.plan[(self.plan['JD0'] < dd) & (self.plan['JD1'] > dd)]
+            if len(tt) == 1:
+                return tt
+            return self.plan[self.plan['JD'] <= dd][-1]
 
-        if len(tt) == 1:
-            return tt
+        # The last night starting before dd, if dd is within it.
+        idx = np.searchsorted(self._JD0, dd, side='left') - 1
+        if idx >= 0 and self._JD1[idx] > dd:
+            return self.plan[[idx]]
 
-        tt = self.plan[self.plan['JD'] <= dd]
+        idx = np.searchsorted(self._JD, dd, side='right') - 1
+        if idx < 0:
+            raise IndexError('no nights found before JD={0}'.format(dd))
 
-        return tt[-1]
+        return self.plan[idx]
 
     def getJD(self, jd=None):
 
@@ -161,14 +315,42 @@ class ObservingPlan(object):
 
         jd = int(jd)
 
-        if jd not in self.plan['JD']:
+        indices = self._getIndices(jd)
+
+        if len(indices) == 0:
             warnings.warn('JD={0} not found in schedule'.format(jd),
                           exceptions.TotoroUserWarning)
             return (None, None)
 
-        night = self.plan[self.plan['JD'] == jd]
+        return (self._JD0[indices[0]], self._JD1[indices[0]])
+
+    def getNextNightRange(self, jdRange):
+        """Returns the JD range of the night after the one containing jdRange.
+
+        Returns None if `jdRange` is not contained in exactly one night or if
+        the next night (JD + 1) is not in the plan.
 
-        return (night['JD0'][0], night['JD1'][0])
+        """
+
+        if self._sorted:
+            # Only the last night starting before jdRange[0] and the one
+            # before it (if they share an edge) can contain jdRange.
+            idx = np.searchsorted(self._JD0, jdRange[0], side='right') - 1
+            candidates = [ii for ii in [idx - 1, idx]
+                          if ii >= 0 and self._JD1[ii] >= jdRange[1]]
+        else:
+            candidates = np.where((self._JD0 <= jdRange[0]) &
+                                  (self._JD1 >= jdRange[1]))[0]
+
+        if len(candidates) != 1:
+            return None
+
+        # Next night must be JD + 1 (i.e., be in the same run)
+        indices = self._getIndices(self._JD[candidates[0]].item() + 1)
+        if len(indices) == 0:
+            return None
+        else:
+            return (self._JD0[indices[0]], self._JD1[indices[0]])
 
     def getObservingBlocks(self, startDate, endDate):
         """Returns an astropy table with the observation dates
@@ -202,38 +384,41 @@ class ObservingPlan(object):
         """Creates an observing block from start and end dates. Mainly for the
         plugger."""
 
-        tmpPlan = self.plan.copy()
-        tmpPlan.add_row((int(startDate), startDate, endDate, -1, -1))
+        colnames = self.plan.colnames
+        row = ((int(startDate), startDate, endDate) +
+               (-1, ) * (len(colnames) - 3))
 
         totalTime = (endDate - startDate) * 24.
         log.info(('1 block (days) selected, '
                   'making a total of {0:.2f} hours').format(totalTime))
 
-        return table.Table(tmpPlan[len(tmpPlan) - 1])
+        return table.Table(rows=[row], names=colnames,
+                           dtype=[self.plan[col].dtype for col in colnames])
 
     def getRun(self, startDate=None):
 
         jd = int(startDate if startDate is not None else time.Time.now().jd)
 
-        if jd not in self.plan['JD']:
+        indices = self._getIndices(jd)
+
+        if len(indices) == 0:
             raise exceptions.TotoroError(
                 'JD={0} not found in schedule'.format(jd))
 
-        firstDay = self.plan[self.plan['JD'] == jd]
-        runNumber = firstDay['RUN']
-        lastDay = self.plan[self.plan['RUN'] == runNumber][-1]
+        runNumber = self.plan['RUN'][indices[0]]
+        lastDay = self._runLastIndex[runNumber.item()]
 
-        return (firstDay['JD0'], lastDay['JD1'])
+        return (self.plan['JD0'][indices], self.plan['JD1'][lastDay])
 
     def getMJD(self, mjd):
 
         mjd = int(mjd)
 
         jd = 2400000. + int(mjd)
-        row = self.plan[self.plan['JD'] == jd]
+        indices = self._getIndices(jd)
 
-        if len(row) == 1:
-            return (row['JD0'][0], row['JD1'][0])
+        if len(indices) == 1:
+            return (self._JD0[indices[0]], self._JD1[indices[0]])
         else:
             return None
 
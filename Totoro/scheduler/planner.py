@@ -14,9 +14,10 @@ Revision history:
 
 from __future__ import division
 from __future__ import print_function
-from Totoro import log, config, readPath, site
+from Totoro import log, config, readPath
 from Totoro.scheduler.timeline import Timelines
 from Totoro.scheduler import observingPlan
+from Totoro.scheduler.ephemeris import getEphemeris
 from Totoro.core.colourPrint import _color_text
 from Totoro import exceptions
 from astropy import table
@@ -224,19 +225,13 @@ class Planner(object):
 
         from Totoro.dbclasses import getAll
 
-        # Gets a list with all the plates
-        allPlates = getAll(rejectSpecial=True, updateSets=False, silent=True,
-                           fullCheck=False)
-
-        # Selects plates with valid statuses
-        validPlates = []
-        for plate in allPlates:
-            statuses = [status.label for status in plate.statuses]
-            if 'Rejected' in statuses or 'Unobservable' in statuses:
-                continue
-            if not usePlatesNotAtAPO and plate.getLocation() != 'APO':
-                continue
-            validPlates.append(plate)
+        # Gets a list with all the plates with valid statuses. The statuses
+        # and location are checked in the query, so that rejected plates are
+        # not loaded.
+        validPlates = getAll(
+            rejectSpecial=True, rejectStatuses=['Rejected', 'Unobservable'],
+            location=None if usePlatesNotAtAPO else 'APO', updateSets=False,
+            silent=True, fullCheck=False)
 
         # Adds information about when the plates will be at APO.
         if config['dateAtAPO'].lower() != 'none':
@@ -368,16 +363,19 @@ class Planner(object):
         # Gets the indices of the timelines with good weather.
         goodWeatherIdx = self.getGoodWeatherIndices(goodWeatherFraction)
 
+        ephemeris = getEphemeris()
+
         for nn, timeline in enumerate(self.timelines):
 
             startDate = time.Time(timeline.startDate, format='jd')
             totalTime = 24. * (timeline.endDate - timeline.startDate)
+            lstRange = ephemeris.getLST([timeline.startDate,
+                                         timeline.endDate])
 
             log.info('Scheduling timeline '
                      '{0:.3f}-{1:.3f} ({2:.2f}-{3:.2f}) [{4}] ({5:.1f}h). '
                      .format(timeline.startDate, timeline.endDate,
-                             site.localSiderealTime(timeline.startDate),
-                             site.localSiderealTime(timeline.endDate),
+                             lstRange[0], lstRange[1],
                              startDate.iso.split()[0], totalTime))
 
             if nn not in goodWeatherIdx:
@@ -418,6 +416,9 @@ class Planner(object):
 
         self.unallocatedJDs = np.array(self.unallocatedJDs)
 
+        # Saves the sampled nights if config.ephemeris.cacheDir is defined.
+        ephemeris.save()
+
     def getGoodWeatherIndices(self, goodWeatherFraction, seed=None):
         """Returns random indices with good weather."""
 
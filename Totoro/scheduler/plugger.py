@@ -16,10 +16,11 @@ Revision history:
 
 from __future__ import division
 from __future__ import print_function
-from Totoro import log, config, site
+from Totoro import log, config
 from Totoro.db import getConnection
 from Totoro.scheduler.timeline import Timeline
 from Totoro.scheduler import observingPlan
+from Totoro.scheduler.ephemeris import getEphemeris
 from Totoro.exceptions import TotoroPluggerWarning, TotoroPluggerError
 from Totoro.utils import intervals
 from collections import OrderedDict
@@ -42,7 +43,7 @@ replaceMsgs = {0: 'empty cart', 1: 'replacing non-MaNGA plate',
 def getForcePlugPlates():
     """Returns a list of plates with priority `forcePlugPriority`."""
 
-    from Totoro.dbclasses.plate import Plates
+    from Totoro.dbclasses.plate import Plates, queryMaNGAPlates
 
     forcePlugPriority = int(config['plugger']['forcePlugPriority'])
 
@@ -51,12 +52,9 @@ def getForcePlugPlates():
     plateDB = db.plateDB
 
     with session.begin():
-        plates = session.query(plateDB.Plate).join(
-            plateDB.PlateToSurvey, plateDB.Survey, plateDB.SurveyMode,
-            plateDB.PlatePointing, plateDB.PlateLocation).filter(
-                plateDB.Survey.label == 'MaNGA',
-                plateDB.SurveyMode.label == 'MaNGA dither',
-                plateDB.PlateLocation.label == 'APO',
+        plates = queryMaNGAPlates(session, db).join(
+            plateDB.PlatePointing).filter(
+                db.lookupTables.filterBy(plateDB.Plate.location, 'APO'),
                 plateDB.PlatePointing.priority == forcePlugPriority).order_by(
                     plateDB.Plate.plate_id).all()
 
@@ -332,7 +330,7 @@ class Plugger(object):
         # If we are only selecting plates observable that night, determines
         # the RA range of the plates to accept.
         if onlyVisiblePlates:
-            lstRange = site.localSiderealTime([self.startDate, self.endDate])
+            lstRange = getEphemeris().getLST([self.startDate, self.endDate])
             window = config['plateVisibilityMaxHalfWindowHours']
             raRange = np.array([(lstRange[0] - window) * 15.,
                                 (lstRange[1] + window) * 15.])
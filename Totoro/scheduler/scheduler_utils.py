@@ -18,11 +18,15 @@ from __future__ import division
 from __future__ import print_function
 import numpy as np
 from Totoro import utils
-from Totoro import config, site
+from Totoro import config
 from Totoro.scheduler import observingPlan
-from Totoro.exceptions import TotoroUserWarning
+from Totoro.scheduler.ephemeris import getEphemeris
+from Totoro.scheduler.visibility import getVisibilityMatrix
+from Totoro.exceptions import TotoroError, TotoroUserWarning
+from Totoro.db import getConnection
 from numbers import Number
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+import itertools
 import warnings
 
 
@@ -36,32 +40,33 @@ nextNightFactor = config['scheduling']['nextNightFactor']
 def _getNextNightRange(jdRange):
     """For a given jdRange, returns the JD range of the next night."""
 
-    currentNight = observingPlan[(observingPlan['JD0'] <= jdRange[0]) &
-                                 (observingPlan['JD1'] >= jdRange[1])]
+    return observingPlan.getNextNightRange(jdRange)
 
-    if len(currentNight) == 0 or len(currentNight) > 1:
-        return None
-
-    JD = currentNight['JD']
 
-    # Next night must be JD + 1 (i.e., be in the same run)
-    nextNight = observingPlan[observingPlan['JD'] == JD + 1]
-    if len(nextNight) == 0:
-        return None
-    else:
-        return (nextNight['JD0'][0], nextNight['JD1'][0])
+def _addBookkeepingAttrs(plates, memo=None):
+    """Stores some information about the plates before the simulation.
 
+    If `memo` is a `SimulationMemo`, the information is read from it if the
+    state of the plate has not changed since it was last calculated.
 
-def _addBookkeepingAttrs(plates):
-    """Stores some information about the plates before the simulation"""
+    """
 
     for plate in plates:
-        plate._before = {}
-        plate._before['completion'] = plate.getPlateCompletion(useMock=True)
-        plate._before['completion+'] = plate.getPlateCompletion(
-            useMock=True, includeIncompleteSets=True)
-        plate._before['nExposures'] = len(
-            plate.getTotoroExposures(onlySets=True))
+        plate._newExposures = []
+
+        before = memo.getBefore(plate) if memo is not None else None
+
+        if before is None:
+            before = {}
+            before['completion'] = plate.getPlateCompletion(useMock=True)
+            before['completion+'] = plate.getPlateCompletion(
+                useMock=True, includeIncompleteSets=True)
+            before['nExposures'] = len(
+                plate.getTotoroExposures(onlySets=True))
+            if memo is not None:
+                memo.setBefore(plate, before)
+
+        plate._before = dict(before)
 
 
 def getDictOfSchedulablePlates(plates, mode):
@@ -132,8 +137,20 @@ def getDictOfSchedulablePlates(plates, mode):
 
 
 def getOptimalPlate(plates, jdRange, mode='plugger', prioritiseAPO=None,
-                    **kwargs):
-    """Gets the optimal plate to observe in a range of JDs."""
+                    visibility=None, lstIndex=None, memo=None, **kwargs):
+    """Gets the optimal plate to observe in a range of JDs.
+
+    `visibility` can be a `VisibilityMatrix` for the plates, which is reused
+    by the simulation if it covers `jdRange`. If `lstIndex` is an `LSTIndex`
+    that includes the plates, it is used to select the observable plates.
+    `memo` is a `SimulationMemo` passed to `runSimulation`.
+
+    If `config.scheduling.pruneCandidates` is True and `mode='planner'`, the
+    upper bounds of the completion of the plates in each category (see
+    `getCompletionBounds`) are calculated once and shared by the calls to
+    `runSimulation` for the plates at APO and outside it.
+
+    """
 
     assert len(jdRange) == 2
 
@@ -147,8 +164,13 @@ def getOptimalPlate(plates, jdRange, mode='plugger', prioritiseAPO=None,
 
     # Selects plates that intersect with the observing window for at least
     # one exposure.
-    observablePlates = [plate for plate in incompletePlates
-                        if isObservable(plate, jdRange)]
+    if lstIndex is not None:
+        observable = set(lstIndex.getObservable(jdRange))
+        observablePlates = [plate for plate in incompletePlates
+                            if plate in observable]
+    else:
+        observablePlates = [plate for plate in incompletePlates
+                            if isObservable(plate, jdRange)]
 
     # If there are no plates that meet those requirements, uses all the
     # incomplete plates
@@ -179,11 +201,21 @@ def getOptimalPlate(plates, jdRange, mode='plugger', prioritiseAPO=None,
             normalise = True
             scope = 'all'
 
+        if (config['scheduling']['pruneCandidates'] and mode == 'planner' and
+                len(platesToSchedule) > 0):
+            visibility = getVisibilityMatrix(
+                platesToSchedule, jdRange, mode, visibility=visibility)[0]
+            bounds = getCompletionBounds(platesToSchedule, jdRange,
+                                         mode=mode, visibility=visibility)
+        else:
+            bounds = None
+
         if not prioritiseAPO:
 
             optimalPlate, newExposures = runSimulation(
                 platesToSchedule, jdRange, mode=mode,
-                scope=scope, normalise=normalise)
+                scope=scope, normalise=normalise, visibility=visibility,
+                memo=memo, bounds=bounds)
 
             if optimalPlate is not None:
                 return optimalPlate, newExposures
@@ -193,7 +225,8 @@ def getOptimalPlate(plates, jdRange, mode='plugger', prioritiseAPO=None,
             for locPlates in _getPlatesAtAPO(platesToSchedule):
                 optimalPlate, newExposures = runSimulation(
                     locPlates, jdRange, mode=mode,
-                    scope=scope, normalise=normalise)
+                    scope=scope, normalise=normalise,
+                    visibility=visibility, memo=memo, bounds=bounds)
 
                 if optimalPlate is not None:
                     return optimalPlate, newExposures
@@ -218,32 +251,673 @@ def _getPlatesAtAPO(plates):
 
 
 def runSimulation(plates, jdRange, mode='plugger', scope='all',
-                  normalise=True, **kwargs):
-    """Runs the simulation for a subset of plates."""
+                  normalise=True, nWorkers=None, visibility=None, memo=None,
+                  bounds=None, **kwargs):
+    """Runs the simulation for a subset of plates.
+
+    If `nWorkers > 1`, the plates are simulated in a pool of processes. The
+    number of workers defaults to `config.scheduling.nWorkers`. The
+    visibility of the plates is read from `visibility` if it covers the
+    plates and `jdRange`, or calculated otherwise. If `memo` is a
+    `SimulationMemo`, the completion of the plates whose state has not
+    changed is read from it instead of being calculated again. In planner
+    mode, the simulation of those plates continues from the part of their
+    previous simulation that is still valid (see `SimulationMemo.getTrace`),
+    and the new simulations are stored in the memo.
+
+    If `config.scheduling.pruneCandidates` is True and `mode='planner'`, the
+    plates are simulated in batches of `config.scheduling.pruneBatchSize`,
+    sorted by the upper bound of their completion increase. After each batch,
+    the plates that cannot be selected by `selectPlate` over the plates
+    already simulated are not simulated (see `_prunePlates`). `bounds` is the
+    output of `getCompletionBounds` for the plates; it is calculated if not
+    defined.
 
-    # Adss bookkeeping information
-    _addBookkeepingAttrs(plates)
+    """
+
+    if nWorkers is None:
+        nWorkers = config['scheduling']['nWorkers']
 
-    simulatePlates(plates, jdRange, mode, **kwargs)
-    optimalPlate = selectPlate(plates, jdRange,
-                               scope=scope, normalise=normalise)
+    visibility, offset = getVisibilityMatrix(
+        plates, jdRange, mode, visibility=visibility,
+        efficiency=kwargs.get('efficiency', None),
+        maxAltitude=kwargs.get('maxAltitude', None))
+    kwargs['visibility'] = visibility
 
-    if optimalPlate:
-        newExps = cleanupPlates(plates, optimalPlate, jdRange)
-        return optimalPlate, newExps
+    # Plates that cannot be observed in the first slot would not get any new
+    # exposure and would be rejected by selectPlate, so we do not simulate
+    # them.
+    plates = [plate for plate in plates
+              if offset < len(visibility.jd) and
+              visibility.observable[visibility.getRow(plate), offset]]
+
+    # The simulation is run on forks of the plates. Only the fork of the
+    # optimal plate is committed; the rest are simply discarded.
+    forks = [plate.fork() for plate in plates]
+
+    # Adss bookkeeping information
+    _addBookkeepingAttrs(forks, memo=memo)
+
+    # In plugger mode the incomplete sets are rearranged after each new
+    # exposure, so previous simulations cannot be reused.
+    reuse = memo is not None and mode == 'planner'
+    options = dict((key, value) for key, value in kwargs.items()
+                   if key != 'visibility')
+
+    # Forks that continue a previous simulation and the slot from which they
+    # must be simulated.
+    resumeSlots = {}
+    if reuse:
+        for fork in forks:
+            trace = memo.getTrace(fork, visibility, offset, options)
+            if trace is not None:
+                resumeSlots[fork] = _replayTrace(fork, trace)
+
+    toSimulate = list(forks)
+
+    prune = (config['scheduling']['pruneCandidates'] and mode == 'planner' and
+             len(toSimulate) > 0)
+
+    if prune:
+        if bounds is None:
+            bounds = getCompletionBounds(plates, jdRange, mode=mode, **kwargs)
+        forkBounds = dict((fork, bounds[plate])
+                          for plate, fork in zip(plates, forks))
+        toSimulate = sorted(
+            toSimulate, reverse=True,
+            key=lambda fork: _getScoreBound(fork, forkBounds[fork], normalise))
+        batchSize = max(config['scheduling']['pruneBatchSize'], nWorkers)
     else:
-        cleanupPlates(plates, None, jdRange)
+        batchSize = len(toSimulate)
+
+    # Plates for which only the outcome of the simulation is known.
+    outcomeOnly = set()
+    simulated = set()
+
+    while len(toSimulate) > 0:
+
+        batch = toSimulate[0:batchSize]
+        toSimulate = toSimulate[batchSize:]
+
+        newForks = [fork for fork in batch if fork not in resumeSlots]
+
+        if nWorkers > 1 and len(newForks) > 1:
+            _simulatePlatesParallel(newForks, jdRange, mode, nWorkers,
+                                    **kwargs)
+            outcomeOnly.update(newForks)
+        elif len(newForks) > 0:
+            simulatePlates(newForks, jdRange, mode, **kwargs)
+
+        for fork in batch:
+            if fork in resumeSlots:
+                simulatePlates([fork], _getSlotRange(visibility,
+                                                     resumeSlots[fork],
+                                                     jdRange),
+                               mode, **kwargs)
+
+        simulated.update(batch)
+
+        if prune and len(toSimulate) > 0:
+            toSimulate = _prunePlates(
+                toSimulate, [fork for fork in forks if fork in simulated],
+                forkBounds, jdRange, scope=scope, normalise=normalise,
+                visibility=visibility)
+
+    if reuse:
+        for fork in forks:
+            if fork in simulated and fork not in outcomeOnly:
+                memo.setTrace(fork, visibility, offset, options)
+
+    optimalFork = selectPlate([fork for fork in forks if fork in simulated],
+                              jdRange, scope=scope, normalise=normalise,
+                              visibility=visibility)
+
+    if not optimalFork:
         return None, []
 
+    if optimalFork in outcomeOnly:
+        # Only the outcome of the simulation is known, so we repeat it for the
+        # optimal plate.
+        optimalFork = _resimulatePlate(optimalFork, jdRange, mode, **kwargs)
+
+    newExps = _trimNewExposures(optimalFork, jdRange)
+
+    return optimalFork.commit(), newExps
+
+
+class SimulationMemo(object):
+    """A memo of the simulation of the plates in a timeline.
+
+    Two kinds of information are stored for each plate, along with the state
+    of the plate (see `Plate._stateVersion`) in which they were calculated:
+
+    - The bookkeeping information before the simulation. It only depends on
+      the state of the plate, so it is reused in any range until the plate
+      is modified.
+    - A `SimulationTrace` with the new exposures of the last simulation of
+      the plate in planner mode. If the plate has not been modified, the
+      part of the trace after a later slot is reused when the simulation
+      starts in that slot (see `getTrace`).
+
+    """
+
+    def __init__(self):
+
+        self._before = {}
+        self._traces = {}
+
+    @staticmethod
+    def _getStateKey(plate):
+        """Returns the plate (or parent of a fork) and its state."""
+
+        parent = plate.__dict__.get('_parent', plate)
+
+        return parent, parent._stateVersion
+
+    def getBefore(self, plate):
+        """Returns the bookkeeping information before the simulation, or None
+        if the state of the plate has changed."""
+
+        parent, state = self._getStateKey(plate)
+
+        if parent in self._before and self._before[parent][0] == state:
+            return self._before[parent][1]
+
+        return None
+
+    def setBefore(self, plate, before):
+        """Stores the bookkeeping information before the simulation."""
+
+        parent, state = self._getStateKey(plate)
+        self._before[parent] = (state, before)
+
+    def getTrace(self, plate, visibility, offset, options):
+        """Returns the part of the last simulation of a plate that can be
+        reused if the simulation starts in slot `offset`, or None.
+
+        The trace can be reused if the state of the plate has not changed,
+        the simulation used the same `visibility` matrix and `options`, and
+        the exposures simulated before slot `offset` formed new sets on their
+        own, none of which accepts more exposures. In planner mode the sets
+        are not rearranged, so the simulation starting in `offset` would
+        assign the following exposures to the same sets. It could only
+        continue after the end of the trace, as the completion of the plate
+        is lower without the skipped sets.
+
+        Returns a `SimulationTrace` that starts in `offset`.
+
+        """
+
+        parent, state = self._getStateKey(plate)
+
+        if parent not in self._traces or self._traces[parent][0] != state:
+            return None
+
+        trace = self._traces[parent][1]
+
+        if trace.visibility is not visibility or trace.options != options:
+            return None
+
+        nSkipped = offset - trace.offset
+        if nSkipped < 0 or nSkipped >= len(trace.exposures):
+            return None
+
+        skippedSets = set(trace.setIndices[0:nSkipped])
+        for setIndex in skippedSets:
+            if setIndex < trace.nSets or not trace.closedSets[setIndex]:
+                return None
+        if not skippedSets.isdisjoint(trace.setIndices[nSkipped:]):
+            return None
+
+        return trace._replace(offset=offset,
+                              exposures=trace.exposures[nSkipped:],
+                              setIndices=trace.setIndices[nSkipped:])
+
+    def setTrace(self, plate, visibility, offset, options):
+        """Stores the new exposures of a plate simulated from slot `offset`.
+
+        `plate` must be the fork in which the simulation was run.
+
+        """
+
+        parent, state = self._getStateKey(plate)
+
+        setIndices = {}
+        for setIndex, ss in enumerate(plate.sets):
+            for exp in ss.totoroExposures:
+                setIndices[exp] = setIndex
+
+        if not all([exp in setIndices for exp in plate._newExposures]):
+            return
+
+        closedSets = [ss.getStatus()[0] not in ['Incomplete', 'Unplugged']
+                      for ss in plate.sets]
+
+        self._traces[parent] = (state, SimulationTrace(
+            visibility, offset, options, len(parent.sets),
+            list(plate._newExposures),
+            [setIndices[exp] for exp in plate._newExposures], closedSets))
+
+    def prune(self):
+        """Removes the information of plates whose state has changed."""
+
+        for memo in [self._before, self._traces]:
+            for parent in list(memo):
+                if memo[parent][0] != self._getStateKey(parent)[1]:
+                    memo.pop(parent)
+
+
+# The new exposures of the simulation of a plate from slot `offset` of the
+# `visibility` matrix, in the order in which they were simulated (one per
+# slot), and the index in the list of sets of the plate of the set to which
+# each one was assigned. `nSets` is the number of sets before the simulation
+# and `closedSets` whether each set does not accept new exposures.
+SimulationTrace = namedtuple('SimulationTrace',
+                             ['visibility', 'offset', 'options', 'nSets',
+                              'exposures', 'setIndices', 'closedSets'])
+
+
+def _getSlotRange(visibility, slot, jdRange):
+    """Returns the part of `jdRange` that starts in a slot of `visibility`."""
+
+    if slot < len(visibility.jd):
+        return [visibility.jd[slot], jdRange[1]]
+    else:
+        return [visibility.jdRange[1], jdRange[1]]
+
+
+def _replayTrace(plate, trace):
+    """Adds the exposures of a `SimulationTrace` to a fork of a plate.
+
+    Returns the slot in which the simulation must continue.
+
+    """
+
+    from Totoro.dbclasses.set import MockSet
+
+    newSets = {}
+    for exp, setIndex in zip(trace.exposures, trace.setIndices):
+        if setIndex < trace.nSets:
+            ss = plate.sets[setIndex]
+        elif setIndex in newSets:
+            ss = newSets[setIndex]
+        else:
+            ss = newSets[setIndex] = MockSet()
+            plate.sets.append(ss)
+        ss.totoroExposures.append(exp)
+        plate._newExposures.append(exp)
+
+    return trace.offset + len(trace.exposures)
+
+
+# Compact record of the simulation of a plate returned by the workers.
+SimulationOutcome = namedtuple('SimulationOutcome',
+                               ['before', 'after', 'newExposureJDs'])
+
+# Plates to be simulated by a worker of the pool, set by
+# _initSimulationWorker.
+_simulationPlates = None
+
+
+def _initSimulationWorker(plates):
+    """Initialises a worker of the simulation pool.
+
+    Stores the plates to simulate and disposes of the DB connections
+    inherited from the parent process, so that the worker opens its own.
+
+    """
+
+    global _simulationPlates
+
+    _simulationPlates = plates
+    getConnection().engine.dispose()
+
+
+def _simulatePlatesParallel(plates, jdRange, mode, nWorkers, **kwargs):
+    """Simulates a list of plates using a pool of `nWorkers` processes.
+
+    Each worker simulates every `nWorkers`-th plate and returns a
+    `SimulationOutcome` per plate, which is used to update the bookkeeping
+    information of the plates. The new exposures are not added to `plates`.
+
+    """
+
+    import multiprocessing
+
+    shardArgs = [(shard, nWorkers, jdRange, mode, kwargs)
+                 for shard in range(nWorkers)]
+
+    pool = multiprocessing.Pool(nWorkers, initializer=_initSimulationWorker,
+                                initargs=(plates,))
+    try:
+        shardOutcomes = pool.map(_simulatePlatesShard, shardArgs)
+    finally:
+        pool.close()
+        pool.join()
+
+    for shard, outcomes in enumerate(shardOutcomes):
+        for plate, outcome in zip(plates[shard::nWorkers], outcomes):
+            plate._before = outcome.before
+            plate._after = outcome.after
+            plate._newExposureJDs = outcome.newExposureJDs
+
+
+def _simulatePlatesShard(args):
+    """Simulates a shard of `_simulationPlates` and returns the outcomes."""
+
+    shard, nShards, jdRange, mode, kwargs = args
+
+    outcomes = []
+    for plate in _simulationPlates[shard::nShards]:
+        simulatePlates([plate], jdRange, mode, **kwargs)
+        outcomes.append(SimulationOutcome(
+            plate._before, plate._after, _getNewExposureJDs(plate)))
+
+    return outcomes
+
 
-def _normaliseWindowLength(plates, jdRange, factor=1.0, apply=True):
-    """Calculates normalisation factors based on window lengths."""
+def _resimulatePlate(plate, jdRange, mode, **kwargs):
+    """Repeats the simulation of a plate simulated by a worker.
 
-    lstRange = site.localSiderealTime(jdRange)
-    plateWindowLength = np.array([
-        utils.getIntervalIntersectionLength(plate.getLSTRange(), lstRange,
-                                            wrapAt=24.)
-        for plate in plates])
+    Returns a new fork of the plate with the simulated exposures. Raises an
+    error if the simulation does not reproduce the outcome returned by the
+    worker, which was used to select the plate.
+
+    """
+
+    fork = plate._parent.fork()
+
+    _addBookkeepingAttrs([fork])
+    simulatePlates([fork], jdRange, mode, **kwargs)
+
+    if (fork._before != plate._before or fork._after != plate._after or
+            not np.array_equal(_getNewExposureJDs(fork),
+                               plate._newExposureJDs)):
+        raise TotoroError('plate_id={0}: the simulation of the optimal plate '
+                          'does not match the one run by the worker.'
+                          .format(plate.plate_id))
+
+    return fork
+
+
+def _getNewExposureJDs(plate):
+    """Returns an array with the JD ranges of the new exposures."""
+
+    return np.array([exp.getJD() for exp in _getNewExposures(plate)],
+                    ndmin=2).reshape(-1, 2)
+
+
+def _getNewExposures(plate):
+    """Returns the simulated exposures in the sets of a plate."""
+
+    newExposures = set(plate._newExposures)
+
+    return [exp for exp in plate.getTotoroExposures(onlySets=True)
+            if exp in newExposures]
+
+
+# Upper bounds of the outcome of the simulation of a plate. `completion` is
+# the maximum completion after the simulation; `patchFactor` and
+# `priorityFactor` the maximum absolute values of the factors applied by
+# selectPlate for patched sets and plate priority (including the ancillary
+# weight).
+CompletionBound = namedtuple('CompletionBound',
+                             ['completion', 'patchFactor', 'priorityFactor'])
+
+
+def getCompletionBounds(plates, jdRange, mode='plugger', visibility=None,
+                        efficiency=None, SN2Factor=None, maxAltitude=None,
+                        **kwargs):
+    """Returns upper bounds of the outcome of simulating a list of plates.
+
+    The number of exposures a plate can get is at most the number of
+    consecutive slots, starting at ``jdRange[0]``, in which the plate is
+    observable. The SN2 of each of those exposures is calculated with the
+    same model used by `Exposure.simulateObservedParamters`, using the
+    airmass at transit (the minimum airmass at which the plate can be
+    observed). Returns an `OrderedDict` with a `CompletionBound` per plate.
+
+    """
+
+    from Totoro.dbclasses.exposure import getExposuresSN2
+
+    mode = mode.lower()
+    SN2Factor = SN2Factor if SN2Factor else config[mode]['simulationFactor']
+
+    visibility, offset = getVisibilityMatrix(
+        plates, jdRange, mode, visibility=visibility,
+        efficiency=efficiency, maxAltitude=maxAltitude)
+
+    simulation = config['simulation']
+    plateBlue = config['SN2thresholds']['plateBlue']
+    plateRed = config['SN2thresholds']['plateRed']
+
+    bounds = OrderedDict()
+
+    for plate in plates:
+
+        observable = visibility.observable[visibility.getRow(plate), offset:]
+        nSlots = int(np.sum(np.cumprod(observable)))
+
+        # Airmasses for |HA| > 75 are set to 10 by computeAirmass.
+        airmass = min(utils.computeAirmass(plate.dec, 0.), 10.)
+
+        dust = plate.dust
+        if dust is None:
+            dust = {'iIncrease': [1], 'gIncrease': [1]}
+
+        sn2Blue = (simulation['blueSN2'] * SN2Factor /
+                   airmass ** simulation['alphaBlue'] /
+                   dust['gIncrease'][0] ** simulation['betaBlue'])
+        sn2Red = (simulation['redSN2'] * SN2Factor /
+                  airmass ** simulation['alphaRed'] /
+                  dust['iIncrease'][0] ** simulation['betaRed'])
+
+        # The completion after the simulation cannot be larger than that of
+        # all the exposures of the plate plus the new ones.
+        exposureSN2 = getExposuresSN2(plate.getTotoroExposures(onlySets=True))
+        if exposureSN2.shape[0] > 0:
+            blueSN2 = np.nansum(np.nanmean(exposureSN2[:, [0, 1]], axis=1))
+            redSN2 = np.nansum(np.nanmean(exposureSN2[:, [2, 3]], axis=1))
+        else:
+            blueSN2 = redSN2 = 0.
+
+        completion = min((blueSN2 + nSlots * sn2Blue) / plateBlue,
+                         (redSN2 + nSlots * sn2Red) / plateRed)
+
+        # In _getPatchedSetsFactor, each new exposure adds 2 and each real
+        # set that is completed doubles the factor, while each real set that
+        # is not patched subtracts 1. With up to five real incomplete sets
+        # the factor cannot be lower than minus their number.
+        nIncomplete = len([ss for ss in plate.sets if not ss.isMock and
+                           ss.getStatus()[0] not in ['Good', 'Excellent']])
+
+        if nIncomplete <= 5 and 1 - patchSetFactor * nIncomplete >= 0:
+            patchFactor = (1 + patchSetFactor *
+                           2 * nSlots * 2 ** nIncomplete)
+        else:
+            patchFactor = np.inf
+
+        priorityFactor = ((1 + platePriorityFactor * (plate.priority - 5.)) *
+                          getattr(plate, 'ancillary_weight', 1))
+
+        bounds[plate] = CompletionBound(completion, patchFactor,
+                                        priorityFactor)
+
+    return bounds
+
+
+def _getScoreBound(plate, bound, normalise):
+    """Returns the upper bound of the completion increase of a simulated
+    plate as scored by selectPlate, without the window length factors."""
+
+    if bound.priorityFactor < 0:
+        return np.inf
+
+    increase = max(bound.completion - plate._before['completion'], 0.)
+    patchFactor = bound.patchFactor if normalise else 1.
+
+    if increase == 0:
+        return 0.
+
+    return increase * patchFactor * bound.priorityFactor
+
+
+def _getSelectionTier(plate):
+    """Returns the preference of selectPlate for the location and status
+    of a plate."""
+
+    return (plate.getLocation() == 'APO',
+            'Accepted' in [status.label for status in plate.statuses])
+
+
+def _prunePlates(plates, simulated, bounds, jdRange, scope='all',
+                 normalise=False, visibility=None):
+    """Returns the plates that can still be selected over the simulated ones.
+
+    A plate is pruned if, whatever the outcome of its simulation and of that
+    of the rest of `plates`, including it does not change the plate returned
+    by `selectPlate`. That is the case if some of the `simulated` plates
+    increase their completion and either the location and status of the
+    plate are less preferred than those of the simulated plates, or the
+    plate cannot be completed, does not change the minimum window length
+    used for the normalisation, and the upper bound of its score is lower
+    than the score of one of the simulated plates. If `normalise=True`, the
+    scores are compared for the extremes of the range of values that the
+    minimum window length can take.
+
+    """
+
+    candidates = [plate for plate in simulated
+                  if plate._after['nNewExposures'] > 0]
+
+    if not any([plate._after['completion'] > plate._before['completion']
+                for plate in candidates]):
+        return plates
+
+    tier = max([_getSelectionTier(plate) for plate in candidates])
+    candidates = [plate for plate in candidates
+                  if _getSelectionTier(plate) == tier]
+
+    # If one of the simulated plates is complete, the optimal plate is one of
+    # the complete plates.
+    anyComplete = any([plate._after['completion'] > 1
+                       for plate in candidates])
+
+    # The scores of the candidates without the window length factors.
+    scores = np.array(
+        [(plate._after['completion'] - plate._before['completion']) *
+         ((1. + patchSetFactor * plate._after['nSetsFactor'])
+          if normalise else 1.) *
+         (1 + platePriorityFactor * (plate.priority - 5.)) *
+         getattr(plate, 'ancillary_weight', 1) for plate in candidates])
+
+    # For each night used for the normalisation, the window lengths of the
+    # candidates and the plates, and the range of values that the minimum
+    # window length can take once the rest of the plates are simulated.
+    windows = []
+    if normalise:
+        nextNightJDrange = _getNextNightRange(jdRange)
+        windowRanges = [(jdRange, 1.0)]
+        if nextNightJDrange is not None:
+            windowRanges.append((nextNightJDrange, nextNightFactor))
+
+        for windowJDrange, factor in windowRanges:
+            lstRange = getEphemeris().getLST(windowJDrange)
+            lengths = _getWindowLengths(candidates, lstRange, visibility)
+            plateLengths = _getWindowLengths(plates, lstRange, visibility)
+
+            allLengths = np.concatenate((lengths, plateLengths))
+            if np.all(allLengths == 0):
+                continue
+
+            minLengths = [np.min(allLengths[allLengths > 0])]
+            if np.any(lengths > 0):
+                minLengths.append(np.min(lengths[lengths > 0]))
+            else:
+                minLengths.append(np.max(allLengths))
+
+            windows.append((lengths, plateLengths, minLengths, factor))
+
+    remaining = []
+    for ii, plate in enumerate(plates):
+
+        bound = bounds[plate]
+        plateTier = _getSelectionTier(plate)
+
+        if plateTier < tier:
+            continue
+        elif plateTier > tier or bound.completion > 1 - 1e-9:
+            remaining.append(plate)
+            continue
+        elif anyComplete:
+            continue
+
+        # The plate must not change the minimum window length. That is
+        # guaranteed if its window is not shorter than that of any candidate.
+        if any([plateLengths[ii] > 0 and (np.all(lengths == 0) or
+                                          plateLengths[ii] < minLengths[1])
+                for lengths, plateLengths, minLengths, __ in windows]):
+            remaining.append(plate)
+            continue
+
+        # The bound of the score of the plate must be lower than the score of
+        # the same candidate for all the extremes of the minimum lengths.
+        scoreBound = _getScoreBound(plate, bound, normalise)
+        beaten = np.ones(len(candidates), dtype=bool)
+
+        for minLengths in itertools.product(
+                *[window[2] for window in windows]):
+
+            plateScore = scoreBound
+            candidateScores = scores.copy()
+
+            for window, minLength in zip(windows, minLengths):
+                lengths, plateLengths, __, factor = window
+                plateScore *= _getWindowFactor(plateLengths[ii], minLength,
+                                               factor)
+                candidateScores *= _getWindowFactor(lengths, minLength,
+                                                    factor)
+
+            beaten &= plateScore * (1 + 1e-9) < candidateScores
+
+        if not np.any(beaten):
+            remaining.append(plate)
+
+    return remaining
+
+
+def _getWindowFactor(lengths, minLength, factor):
+    """Returns the factor applied by `_normaliseWindowLength`."""
+
+    lengths = np.asarray(lengths, dtype=float)
+
+    return np.where(lengths > 0, factor * (lengths / minLength - 1.) + 1, 1.)
+
+
+def _getWindowLengths(plates, lstRange, visibility=None):
+    """Returns the intersection of the LST window of each plate with an LST
+    range, reading the windows from `visibility`, if defined."""
+
+    if visibility is not None:
+        return visibility.getWindowLengths(plates, lstRange)
+
+    return utils.getIntervalIntersectionLengths(
+        np.array([plate.getLSTRange() for plate in plates]).reshape(-1, 2),
+        lstRange, wrapAt=24.)
+
+
+def _normaliseWindowLength(plates, jdRange, factor=1.0, apply=True,
+                           visibility=None):
+    """Calculates normalisation factors based on window lengths.
+
+    If `visibility` is defined, the LST windows of the plates are read from
+    the `VisibilityMatrix`.
+
+    """
+
+    lstRange = getEphemeris().getLST(jdRange)
+    plateWindowLength = _getWindowLengths(plates, lstRange, visibility)
 
     if len(plateWindowLength[plateWindowLength > 0]) == 0:
         return
@@ -267,7 +941,8 @@ def _normaliseWindowLength(plates, jdRange, factor=1.0, apply=True):
     return plateWindowLenghtNormalisedFactor
 
 
-def selectPlate(plates, jdRange, normalise=False, scope='all'):
+def selectPlate(plates, jdRange, normalise=False, scope='all',
+                visibility=None):
     """From a list of simulated plates, returns the optimal one."""
 
     # Gets the JD range for the following night
@@ -279,7 +954,7 @@ def selectPlate(plates, jdRange, normalise=False, scope='all'):
 
     # Sorts plates by inverse plate completion.
     plates = sorted(plates, reverse=True,
-                    key=lambda plate: plate.getPlateCompletion())
+                    key=lambda plate: plate._after['completion'])
 
     if len(plates) == 0:
         return None
@@ -347,36 +1022,19 @@ def selectPlate(plates, jdRange, normalise=False, scope='all'):
 
     if normalise:
 
-        _normaliseWindowLength(plates, jdRange, factor=1.0, apply=True)
+        _normaliseWindowLength(plates, jdRange, factor=1.0, apply=True,
+                               visibility=visibility)
 
         # We also normalise using the following night, if possible.
         if nextNightJDrange is not None:
             _normaliseWindowLength(plates, nextNightJDrange,
-                                   factor=nextNightFactor, apply=True)
+                                   factor=nextNightFactor, apply=True,
+                                   visibility=visibility)
 
         # Now we normalise plate completion using a metric that gives higher
         # priority to plates for which we have patched incomplete sets.
-        patchedSetFactor = []
-        for plate in plates:
-            nSetsFactor = 0
-            for ss in plate.sets:
-                if not ss.isMock:
-                    nNewExps = 0
-                    for exp in ss.totoroExposures:
-                        if hasattr(exp, '_tmp') and exp._tmp:
-                            nNewExps += 1
-                    setComplete = ss.getStatus()[0] in ['Good', 'Excellent']
-                    if setComplete and nNewExps == 0:
-                        pass
-                    else:
-                        if nNewExps > 0:
-                            nSetsFactor += 2 * nNewExps
-                            if setComplete:
-                                nSetsFactor *= 2
-                        else:
-                            nSetsFactor -= 1
-
-            patchedSetFactor.append(1. + patchSetFactor * nSetsFactor)
+        patchedSetFactor = [1. + patchSetFactor * plate._after['nSetsFactor']
+                            for plate in plates]
 
         _completionFactor(plates, patchedSetFactor)
 
@@ -440,13 +1098,26 @@ def _completionFactor(plates, factor):
 
 
 def simulatePlates(plates, jdRange, mode, efficiency=None, SN2Factor=None,
-                   maxAltitude=None, **kwargs):
-    """Simulates exposures for a list of plates within a range of JDs."""
+                   maxAltitude=None, visibility=None, **kwargs):
+    """Simulates exposures for a list of plates within a range of JDs.
+
+    The slots in which exposures can be added, and whether each plate can be
+    observed in them, are read from a `VisibilityMatrix`. If `visibility`
+    does not cover the plates and `jdRange`, a new matrix is calculated. Each
+    exposure starts at the beginning of its slot, so the exposures simulated
+    in a slot do not depend on the slot in which the simulation started.
+
+    """
 
     mode = mode.lower()
-    efficiency = efficiency if efficiency else config[mode]['efficiency']
     SN2Factor = SN2Factor if SN2Factor else config[mode]['simulationFactor']
-    maxAltitude = maxAltitude if maxAltitude else config[mode]['maxAltitude']
+
+    visibility, offset = getVisibilityMatrix(
+        plates, jdRange, mode, visibility=visibility,
+        efficiency=efficiency, maxAltitude=maxAltitude)
+
+    slotJDs = visibility.jd[offset:]
+    expTimes = visibility.expTimes[offset:]
 
     # This flag let us know if at least one plate has been successfully
     # simulated.
@@ -458,41 +1129,27 @@ def simulatePlates(plates, jdRange, mode, efficiency=None, SN2Factor=None,
 
     for plate in plates:
 
-        plateLST = plate.getLSTRange()
         plugging = plate.getActivePlugging()
 
-        jd = jdRange[0]
-        while jd < jdRange[1]:
+        # Whether the plate is within its LST window at the beginning of each
+        # slot and below maxAltitude at the middle of it.
+        observable = visibility.observable[visibility.getRow(plate), offset:]
 
-            expTimeEff = expTime / efficiency
-
-            # If MaNGA is observing at the beginning of the night the cart is
-            # already loaded, so we can assume that the efficiency of the first
-            # exposure is 100%.
-            row = observingPlan[observingPlan['JD'] == int(jd)]
-            if len(row) > 0:
-                row = row[0]
-                if row['Position'] == 1 and jd == row['JD0']:
-                    expTimeEff = expTime
+        for jd, expTimeEff, slotObservable in zip(slotJDs, expTimes,
+                                                  observable):
 
             if plate.getPlateCompletion() >= 1:
                 break
 
-            lst = site.localSiderealTime(jd)
-            lstMean = site.localSiderealTime(jd + expTimeEff / 2. / 86400.)
-
             # Calculates how much time the exposure is observed above
             # max altitude minus 5 degrees.
-            # lstRange = site.localSiderealTime([jd, jd + expTimeEff / 86400.])
+            # lstRange = ephemeris.getLST([jd, jd + expTimeEff / 86400.])
             # highAltitudeRange = plate.getLSTRangeAboveAltitude(
             #     maxAltitude - 5)
             # highAltitudeIntersection = utils.getIntervalIntersectionLength(
             #     lstRange, highAltitudeRange, wrapAt=24.)
 
-            if (not utils.isPointInInterval(lst, plateLST, wrapAt=24)):
-                # if mode == 'planner':
-                break
-            elif plate.getAltitude(lstMean) > maxAltitude:
+            if not slotObservable:
                 break
             # elif highAltitudeIntersection * 3600 > expTimeEff * 0.9:
             #     # If the most part of the exposure happens at high altitude,
@@ -506,16 +1163,13 @@ def simulatePlates(plates, jdRange, mode, efficiency=None, SN2Factor=None,
                                                rearrange=rearrange,
                                                silent=True)
 
-                # If everything worked, we add a flag to mark this exposure
-                # as temporary.
+                # If everything worked, we record the new exposure.
                 if result is not False:
-                    result._tmp = True
+                    plate._newExposures.append(result)
                     success = True
                 else:
                     break
 
-            jd += expTimeEff / 86400.
-
     # Now loops over the plates again and updates the dictionary with
     # simulation information.
     for plate in plates:
@@ -523,19 +1177,50 @@ def simulatePlates(plates, jdRange, mode, efficiency=None, SN2Factor=None,
         plate._after['completion'] = plate.getPlateCompletion(useMock=True)
         plate._after['completion+'] = plate.getPlateCompletion(
             useMock=True, includeIncompleteSets=True)
-        plate._after['nNewExposures'] = len(
-            [exp for exp in plate.getTotoroExposures(onlySets=True)
-             if hasattr(exp, '_tmp') and exp._tmp])
+        plate._after['nNewExposures'] = len(_getNewExposures(plate))
+        plate._after['nSetsFactor'] = _getPatchedSetsFactor(plate)
 
     return success
 
 
+def _getPatchedSetsFactor(plate):
+    """Returns a metric of the number of real sets patched in the simulation.
+
+    New exposures added to real sets increase the factor, more so if they
+    complete the set, while real incomplete sets that have not been patched
+    decrease it.
+
+    """
+
+    nSetsFactor = 0
+    newExposures = set(plate._newExposures)
+
+    for ss in plate.sets:
+        if not ss.isMock:
+            nNewExps = 0
+            for exp in ss.totoroExposures:
+                if exp in newExposures:
+                    nNewExps += 1
+            setComplete = ss.getStatus()[0] in ['Good', 'Excellent']
+            if setComplete and nNewExps == 0:
+                pass
+            else:
+                if nNewExps > 0:
+                    nSetsFactor += 2 * nNewExps
+                    if setComplete:
+                        nSetsFactor *= 2
+                else:
+                    nSetsFactor -= 1
+
+    return nSetsFactor
+
+
 def isObservable(plate, jdRange):
     """Returns True if a plate overlaps with the first element of jdRange
     and can be observed for at least one exposure."""
 
     plateLSTRange = plate.getLSTRange()
-    lstRange = site.localSiderealTime(jdRange)
+    lstRange = getEphemeris().getLST(jdRange)
 
     if not utils.intervals.isPointInInterval(lstRange[0], plateLSTRange,
                                              wrapAt=24.):
@@ -548,48 +1233,26 @@ def isObservable(plate, jdRange):
     return True
 
 
-def cleanupPlates(plates, optimalPlate, jdRange):
-    """Clears exposures for plates that are not optimal. Returns new exposures.
+def _trimNewExposures(optimalPlate, jdRange):
+    """Removes unnecessary new exposures from the optimal plate.
 
-    For the optimal plate it removes exposures in incomplete sets
-    if jRange > 1 hour.
+    `optimalPlate` must be the fork of the plate in which the simulation was
+    run. If the new exposures in the last set of the plate do not complete it
+    and jdRange > 1 hour, they are removed. Returns the new exposures left in
+    the plate.
 
     """
 
-    # We start by removing everything from non-optimal plates
-    for plate in plates:
-
-        if plate is optimalPlate:
-            continue
-
-        for attr in ['_before', '_after', '_tmp']:
-            if hasattr(plate, attr):
-                delattr(plate, attr)
-
-        for ss in plate.sets:
-            ss.totoroExposures = [exp for exp in ss.totoroExposures
-                                  if not hasattr(exp, '_tmp') or not exp._tmp]
-            ss._status = None
-
-        plate.sets = [ss for ss in plate.sets
-                      if not ss.isMock or len(ss.totoroExposures) > 0]
-
-    if optimalPlate is None:
-        return
-
     # Calculates change in completion rate in the optimal plate
     completionChange = (optimalPlate._after['completion'] -
                         optimalPlate._before['completion'])
 
-    for attr in ['_before', '_after', '_tmp']:
-        if hasattr(optimalPlate, attr):
-            delattr(optimalPlate, attr)
+    newExposures = set(optimalPlate._newExposures)
 
     # Calculates how much time we have actually scheduled with the
     # optimal plate
     newExpJDs = np.array(
-        [exp.getJD() for exp in optimalPlate.getTotoroExposures()
-         if hasattr(exp, '_tmp') and exp._tmp])
+        [exp.getJD() for exp in _getNewExposures(optimalPlate)])
     timeJDRange = np.sum(newExpJDs[:, 1] - newExpJDs[:, 0])
 
     # If the plate has a change in completion, we may want to exclude the new
@@ -607,7 +1270,7 @@ def cleanupPlates(plates, optimalPlate, jdRange):
             # Finds new exposures in the last set and calculates the jd range
             # they cover.
             exposuresToRemove = [exp for exp in lastSet.totoroExposures
-                                 if hasattr(exp, '_tmp') and exp._tmp]
+                                 if exp in newExposures]
 
             if len(exposuresToRemove) > 0:
                 exposuresToRemoveJD = np.array(
@@ -626,18 +1289,8 @@ def cleanupPlates(plates, optimalPlate, jdRange):
                     for exp in exposuresToRemove:
                         lastSet.totoroExposures.remove(exp)
 
-    # For the remaining mock exposures, we remove the _simulationData and _tmp
-    # attributes.
-    newExps = []
-    for exp in optimalPlate.getTotoroExposures(onlySets=True):
-        for attr in ['_before', '_after', '_tmp']:
-            if hasattr(exp, attr):
-                delattr(exp, attr)
-                newExps.append(exp)
-
     # Makes sure there are no empty sets in the plate
-    for ss in optimalPlate.sets:
-        if ss.isMock and len(ss.totoroExposures) == 0:
-            optimalPlate.sets.remove(ss)
+    optimalPlate.sets = [ss for ss in optimalPlate.sets
+                         if not ss.isMock or len(ss.totoroExposures) > 0]
 
-    return newExps
+    return _getNewExposures(optimalPlate)
@@ -17,6 +17,10 @@ from __future__ import print_function
 from Totoro import log, config
 from Totoro import utils
 from Totoro.scheduler import scheduler_utils as logic
+from Totoro.scheduler.visibility import getVisibilityMatrix
+from Totoro.scheduler.lstIndex import LSTIndex
+from Totoro.scheduler.ephemeris import getEphemeris
+from Totoro.utils import astro
 from Totoro.core.colourPrint import _color_text
 from Totoro.exceptions import TotoroUserWarning
 import numpy as np
@@ -55,6 +59,9 @@ class Timeline(object):
         self.startDate = startDate
         self.endDate = endDate
         self.scheduled = []
+        self.visibility = None
+        self.lstIndex = None
+        self.memo = None
 
         self.unallocatedRange = np.array([self.startDate, self.endDate])
 
@@ -99,6 +106,28 @@ class Timeline(object):
 
         return np.sum(unallocatedRange[:, 1] - unallocatedRange[:, 0]) * 24.
 
+    def _getNextWindowOpening(self, jd):
+        """Returns the first JD after `jd` at which a plate may be scheduled.
+
+        Returns `jd` if the LST window of any of the plates in `lstIndex`
+        contains the LST at `jd`. Otherwise, returns the JD at which the next
+        window opens, or infinity if there are no plates.
+
+        """
+
+        lst = getEphemeris().getLST(jd)
+
+        if len(self.lstIndex.getContaining(lst)) > 0:
+            return jd
+
+        hours = self.lstIndex.getTimeToNextOpening(lst)
+        if hours is None:
+            return np.inf
+
+        # Subtracts a small margin so that rounding errors cannot make us skip
+        # the step at which the window opens.
+        return jd + hours / 24. * astro.SIDEREAL_DAY - 1e-6
+
     def schedule(self, plates, mode='plugger', useDateAtAPO=True, **kwargs):
         """Schedules a list of plates.
 
@@ -136,19 +165,39 @@ class Timeline(object):
         else:
             platesToSchedule = plates
 
+        # Index of the LST windows of the plates, used to find the plates
+        # that are observable at each step.
+        self.lstIndex = LSTIndex(platesToSchedule)
+
+        # Memo of the simulation outcomes of the plates in this timeline.
+        self.memo = logic.SimulationMemo()
+
         while jd0 <= self.endDate:
 
+            # Gets the visibility of the plates for the range. The matrix is
+            # only recalculated if jd0 does not match one of its slots.
+            self.visibility, __ = getVisibilityMatrix(
+                platesToSchedule, [jd0, self.endDate], mode,
+                visibility=self.visibility)
+
             # Finds the optimal plate for the range [jd0, self.endDate]
             optimalPlate, newExposures = logic.getOptimalPlate(
-                platesToSchedule, [jd0, self.endDate], mode=mode, **kwargs)
+                platesToSchedule, [jd0, self.endDate], mode=mode,
+                visibility=self.visibility, lstIndex=self.lstIndex,
+                memo=self.memo, **kwargs)
 
             if optimalPlate is None:
                 # If no optimal plate is found, moves jd0 by one exposure time.
-                if jd0 < self.endDate - 2 * expTimeJD:
+                # If no plate is within its LST window nothing can be
+                # scheduled until a window opens, so we skip those steps.
+                nextOpening = self._getNextWindowOpening(jd0)
+                while jd0 < self.endDate - 2 * expTimeJD:
                     jd0 += expTimeJD
-                    continue
+                    if jd0 >= nextOpening:
+                        break
                 else:
                     break
+                continue
             else:
 
                 if optimalPlate in self.scheduled:
@@ -163,6 +212,10 @@ class Timeline(object):
                 # Updates the current jd0
                 jd0 = np.max([exp.getJD()[1] for exp in newExposures])
 
+                # The information of the optimal plate before it was
+                # modified cannot be reused.
+                self.memo.prune()
+
                 # Logs the scheduled plate
                 self.log(optimalPlate, newExposures, mode)
 
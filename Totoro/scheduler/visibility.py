@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+visibility.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import config, site
+from Totoro import utils
+from Totoro.scheduler import observingPlan
+from Totoro.scheduler.ephemeris import getEphemeris
+from Totoro.utils import astro
+from collections import OrderedDict
+import numpy as np
+
+
+__all__ = ['VisibilityMatrix', 'getVisibilityMatrix']
+
+expTime = config['exposure']['exposureTime']
+
+# Tolerance, in days, when matching the start of a JD range with a slot.
+_slotTolerance = 1e-6
+
+
+def _getPlateKey(plate):
+    """Returns the geometry that defines the visibility of a plate.
+
+    Plates (and forks of plates) with the same key share a row of the matrix.
+
+    """
+
+    return (float(plate.ra), float(plate.dec), float(plate.mlhalimit))
+
+
+class VisibilityMatrix(object):
+    """The visibility of a list of plates in the exposure slots of a JD range.
+
+    Rows correspond to plates and columns to the consecutive slots in which
+    `simulatePlates` would add mock exposures between ``jdRange[0]`` and
+    ``jdRange[1]``. The whole matrix is calculated in a single pass from the
+    coordinates and HA limits of the plates.
+
+    Parameters
+    ----------
+    plates : list
+        The list of plates (or fields) to include in the matrix.
+    jdRange : list
+        The JD range covered by the slots.
+    mode : str
+        Either ``'plugger'`` or ``'planner'``. Used to get the default
+        values of `efficiency` and `maxAltitude`.
+    efficiency : float or None
+        The observing efficiency, which determines the length of each slot.
+    maxAltitude : float or None
+        The maximum altitude at which a plate can be observed.
+
+    Attributes
+    ----------
+    jd : `numpy.ndarray`
+        The JD at the beginning of each slot.
+    expTimes : `numpy.ndarray`
+        The effective exposure time of each slot, in seconds.
+    lstRange : `numpy.ndarray`
+        A Nx2 array with the LST window of each plate, as returned by
+        `Plate.getLSTRange`.
+    inWindow : `numpy.ndarray`
+        True where the LST at the beginning of the slot is within the LST
+        window of the plate.
+    belowMaxAltitude : `numpy.ndarray`
+        True where the altitude of the plate at the middle of the slot is
+        lower than `maxAltitude`.
+    airmass : `numpy.ndarray`
+        The airmass of the plate at the middle of the slot.
+    observable : `numpy.ndarray`
+        ``inWindow & belowMaxAltitude``.
+
+    """
+
+    def __init__(self, plates, jdRange, mode, efficiency=None,
+                 maxAltitude=None):
+
+        mode = mode.lower()
+
+        self.jdRange = np.array(jdRange, dtype=float)
+        self.efficiency = efficiency or config[mode]['efficiency']
+        self.maxAltitude = maxAltitude or config[mode]['maxAltitude']
+
+        self._rows = OrderedDict()
+        for plate in plates:
+            key = _getPlateKey(plate)
+            if key not in self._rows:
+                self._rows[key] = len(self._rows)
+
+        self.jd, self.expTimes = self._getSlots()
+        self._build()
+
+    def _getSlots(self):
+        """Returns the start JD and exposure time of each slot."""
+
+        slotJDs = []
+        slotExpTimes = []
+
+        jd = self.jdRange[0]
+        while jd < self.jdRange[1]:
+
+            expTimeEff = expTime / self.efficiency
+
+            # If MaNGA is observing at the beginning of the night the cart is
+            # already loaded, so we can assume that the efficiency of the first
+            # exposure is 100%.
+            row = observingPlan.getRow(jd)
+            if row is not None:
+                if row['Position'] == 1 and jd == row['JD0']:
+                    expTimeEff = expTime
+
+            slotJDs.append(jd)
+            slotExpTimes.append(expTimeEff)
+
+            jd += expTimeEff / 86400.
+
+        return np.array(slotJDs, dtype=float), np.array(slotExpTimes,
+                                                        dtype=float)
+
+    def _build(self):
+        """Calculates the visibility of all the plates in all the slots."""
+
+        geometry = np.array(list(self._rows.keys()),
+                            dtype=float).reshape(-1, 3)
+        ra, dec, mlhalimit = geometry.T
+
+        # Same as Plate.getLSTRange
+        haRange = np.array([-mlhalimit, mlhalimit]).T % 360.
+        haRange[haRange > 180.] -= 360.
+        self.lstRange = (haRange + ra[:, np.newaxis]) % 360. / 15.
+
+        ephemeris = getEphemeris()
+        lst = ephemeris.getLST(self.jd)
+        lstMean = ephemeris.getLST(self.jd + self.expTimes / 2. / 86400.)
+
+        lst0 = self.lstRange[:, 0:1]
+        lst1 = self.lstRange[:, 1:2]
+        self.inWindow = (lst - lst0) % 24. <= (lst1 - lst0) % 24.
+
+        haMean = (lstMean * 15. - ra[:, np.newaxis]) % 360.
+        altitude = astro.altitude(haMean, dec[:, np.newaxis],
+                                  latitude=site.latitude)
+        self.belowMaxAltitude = altitude <= self.maxAltitude
+        self.airmass = np.atleast_2d(
+            astro.airmass(haMean, dec[:, np.newaxis], latitude=site.latitude))
+
+        self.observable = self.inWindow & self.belowMaxAltitude
+
+    def getRow(self, plate):
+        """Returns the row of a plate or None if the plate is not included."""
+
+        return self._rows.get(_getPlateKey(plate), None)
+
+    def getSlotOffset(self, plates, jdRange, efficiency, maxAltitude):
+        """Returns the first slot for a JD range.
+
+        Returns the index of the slot that starts at ``jdRange[0]``, if the
+        matrix contains all the `plates` and was calculated for the same end
+        of the range, `efficiency` and `maxAltitude`. Otherwise, returns None.
+
+        """
+
+        if (jdRange[1] != self.jdRange[1] or
+                efficiency != self.efficiency or
+                maxAltitude != self.maxAltitude):
+            return None
+
+        for plate in plates:
+            if self.getRow(plate) is None:
+                return None
+
+        offset = np.searchsorted(self.jd, jdRange[0] - _slotTolerance)
+        if (offset < len(self.jd) and
+                abs(self.jd[offset] - jdRange[0]) < _slotTolerance):
+            return offset
+        elif offset == len(self.jd) and jdRange[0] >= self.jdRange[1]:
+            return offset
+
+        return None
+
+    def getWindowLengths(self, plates, lstRange):
+        """Returns the intersection of the LST window of each plate with an
+        LST range, in hours."""
+
+        rows = [self.getRow(plate) for plate in plates]
+
+        return utils.getIntervalIntersectionLengths(
+            self.lstRange[rows], lstRange, wrapAt=24.)
+
+
+def getVisibilityMatrix(plates, jdRange, mode, visibility=None,
+                        efficiency=None, maxAltitude=None):
+    """Returns a `VisibilityMatrix` for a list of plates and a JD range.
+
+    If `visibility` is defined and covers the plates and the JD range, it is
+    reused. Otherwise, a new matrix is calculated. Returns the matrix and the
+    index of the slot that starts at ``jdRange[0]``.
+
+    """
+
+    mode = mode.lower()
+    efficiency = efficiency if efficiency else config[mode]['efficiency']
+    maxAltitude = maxAltitude if maxAltitude else config[mode]['maxAltitude']
+
+    if visibility is not None:
+        offset = visibility.getSlotOffset(plates, jdRange, efficiency,
+                                          maxAltitude)
+        if offset is not None:
+            return visibility, offset
+
+    visibility = VisibilityMatrix(plates, jdRange, mode,
+                                  efficiency=efficiency,
+                                  maxAltitude=maxAltitude)
+
+    return visibility, 0
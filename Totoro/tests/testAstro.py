@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+testAstro.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import config, site
+from Totoro.utils import astro, computeAirmass
+from astropy import time
+import numpy as np
+import unittest
+
+
+class TestAstro(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Defines a grid of JDs spanning several years."""
+
+        cls.jds = np.linspace(2457000.6, 2459000.9, 101)
+
+    def testTAISeconds(self):
+        """Compares TAI seconds to JD conversions with astropy."""
+
+        t0 = time.Time(0, format='mjd', scale='tai')
+
+        for jd in self.jds[::10]:
+            tt = time.Time(jd, format='jd', scale='tai')
+            seconds = (tt - t0).sec
+
+            self.assertAlmostEqual(astro.jdToTAISeconds(jd), seconds,
+                                   places=3)
+            self.assertAlmostEqual(astro.taiSecondsToJD(seconds), jd,
+                                   places=8)
+
+            tStart = t0 + time.TimeDelta(seconds, format='sec', scale='tai')
+            dt = astro.taiSecondsToDatetime(seconds) - tStart.datetime
+            self.assertLess(abs(dt.total_seconds()), 1e-3)
+
+        np.testing.assert_allclose(
+            astro.taiSecondsToJD(astro.jdToTAISeconds(self.jds)), self.jds,
+            rtol=0, atol=1e-8)
+
+    def testLocalSiderealTime(self):
+        """Compares the LST with Site.localSiderealTime."""
+
+        lst = astro.localSiderealTime(self.jds)
+        lstSite = np.array([site.localSiderealTime(jd) for jd in self.jds])
+
+        # Difference in hours, accounting for the wrap at 24h.
+        diff = (lst - lstSite + 12.) % 24. - 12.
+        self.assertLess(np.max(np.abs(diff)), 1e-3)
+
+        self.assertAlmostEqual(astro.localSiderealTime(self.jds[0]), lst[0])
+
+    def testLeapSeconds(self):
+        """Compares the TAI to UTC conversions with astropy."""
+
+        utc = time.Time(self.jds, format='jd', scale='tai').utc.jd
+
+        np.testing.assert_allclose(astro.taiToUTC(self.jds), utc,
+                                   rtol=0, atol=1e-8)
+        np.testing.assert_allclose(astro.utcToTAI(utc), self.jds,
+                                   rtol=0, atol=1e-8)
+
+        self.assertEqual(astro.getTAIMinusUTC(2457204.4), 35.)
+        self.assertEqual(astro.getTAIMinusUTC(2457204.6), 36.)
+        self.assertEqual(astro.getTAIMinusUTC(2457754.5), 37.)
+
+    def testExposureLST(self):
+        """Compares the LST of a plateDB exposure with Site.localSiderealTime.
+        """
+
+        from Totoro.db import getConnection
+        from Totoro.dbclasses import fromPlateID
+
+        getConnection('test')
+        exposure = fromPlateID(8486).getTotoroExposures(onlySets=True)[0]
+
+        t0 = time.Time(0, format='mjd', scale='tai')
+        tStart = t0 + time.TimeDelta(float(exposure.start_time), format='sec',
+                                     scale='tai')
+
+        # The start time is in TAI, which is ~35 seconds (0.01 hours of LST)
+        # ahead of UTC.
+        lstSite = site.localSiderealTime(tStart.utc.jd)
+        diff = (exposure.getLST()[0] - lstSite + 12.) % 24. - 12.
+        self.assertLess(abs(diff), 1e-3)
+
+        self.assertAlmostEqual(exposure.getJD()[0], tStart.utc.jd, places=8)
+
+    def testHourAngle(self):
+        """Tests the HA range and the consistency with the LST."""
+
+        ra = np.linspace(0, 359, len(self.jds))
+        ha = astro.hourAngle(self.jds, ra)
+
+        self.assertTrue(np.all((ha > -180) & (ha <= 180)))
+
+        lst = astro.localSiderealTime(self.jds)
+        np.testing.assert_allclose((ha + ra) % 360., lst * 15., atol=1e-6)
+
+    def testAirmass(self):
+        """Compares the vectorised airmass with the scalar calculation."""
+
+        ha = np.linspace(-90, 90, 37)
+        dec = 20.
+
+        airmass = computeAirmass(dec, ha)
+        airmassScalar = np.array([computeAirmass(dec, hh) for hh in ha])
+
+        np.testing.assert_allclose(airmass, airmassScalar)
+        np.testing.assert_allclose(airmass[np.abs(ha) > 75.], 10.)
+
+        # At transit the airmass is 1 / cos(lat - dec)
+        latitude = config['observatory']['latitude']
+        self.assertAlmostEqual(
+            astro.airmass(0., dec),
+            1. / np.cos(np.deg2rad(latitude - dec)), places=6)
+        self.assertAlmostEqual(astro.altitude(0., dec),
+                               90. - abs(latitude - dec), places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+testEphemeris.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import site
+from Totoro.scheduler import observingPlan
+from Totoro.scheduler.ephemeris import Ephemeris
+from Totoro.utils import astro
+from astropy import time
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestEphemeris(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Creates an ephemeris for a few nights with a temporary cache
+        directory."""
+
+        cls.cacheDir = tempfile.mkdtemp()
+        cls.plan = observingPlan.plan[100:105]
+
+        cls.ephemeris = Ephemeris(plan=cls.plan, cacheDir=cls.cacheDir)
+
+        cls.jds = np.concatenate(
+            [np.linspace(row['JD0'], row['JD1'], 11) for row in cls.plan])
+
+    @classmethod
+    def tearDownClass(cls):
+        """Removes the cache directory."""
+
+        shutil.rmtree(cls.cacheDir)
+
+    def testLST(self):
+        """Compares the interpolated LST with the direct calculation."""
+
+        lst = self.ephemeris.getLST(self.jds)
+        diff = (lst - astro.localSiderealTime(self.jds) + 12.) % 24. - 12.
+        self.assertLess(np.max(np.abs(diff)), 1e-6)
+
+        # A JD outside the nights is calculated directly.
+        jd = self.plan['JD1'][0] + 0.1
+        self.assertAlmostEqual(self.ephemeris.getLST(jd),
+                               astro.localSiderealTime(jd))
+
+    def testSunAltitude(self):
+        """Compares the interpolated Sun altitude with Site."""
+
+        altitude = self.ephemeris.getSunAltitude(self.jds)
+        siteAltitude = site.getSunAltitude(
+            time.Time(self.jds, format='jd', scale='tai'))
+
+        np.testing.assert_allclose(altitude, siteAltitude, atol=0.05)
+
+    def testLazySampling(self):
+        """Checks that only the nights used are sampled."""
+
+        ephemeris = Ephemeris(plan=self.plan, cacheDir=False)
+        self.assertEqual(len(ephemeris._nights), 0)
+
+        ephemeris.getSunAltitude(self.plan['JD0'][2] + 0.01)
+        self.assertEqual(list(ephemeris._nights), [2])
+
+    def testCache(self):
+        """Checks that the ephemeris is only saved when requested."""
+
+        self.ephemeris.getLST(self.jds)
+        self.assertFalse(os.path.exists(self.ephemeris.cacheFile))
+
+        self.ephemeris.save()
+        self.assertTrue(os.path.exists(self.ephemeris.cacheFile))
+
+        ephemeris = Ephemeris(plan=self.plan, cacheDir=self.cacheDir)
+        self.assertEqual(ephemeris.key, self.ephemeris.key)
+        self.assertItemsEqual(ephemeris._nights, self.ephemeris._nights)
+        for night in ephemeris._nights:
+            for cached, sampled in zip(ephemeris._nights[night],
+                                       self.ephemeris._nights[night]):
+                np.testing.assert_array_equal(cached, sampled)
+
+
+if __name__ == '__main__':
+    unittest.main()
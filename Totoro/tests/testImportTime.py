@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+testImportTime.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import json
+import subprocess
+import sys
+import unittest
+
+
+# Maximum time, in seconds, that a cold import of Totoro may take. The
+# import is done in a new interpreter so that no module is cached.
+importTimeBudget = 5.
+
+# Number of imports to run. The fastest one is compared with the budget.
+nImports = 3
+
+importScript = """
+import json, sys, time
+t0 = time.time()
+import Totoro
+from Totoro.scheduler import observingPlan
+elapsed = time.time() - t0
+print(json.dumps({
+    'elapsed': elapsed,
+    'matplotlib': 'matplotlib' in sys.modules,
+    'site': Totoro.site._isLoaded(),
+    'dustMap': Totoro._dustMapLoaded,
+    'observingPlan': observingPlan._isLoaded()}))
+"""
+
+
+def coldImport():
+    """Imports Totoro in a new interpreter and returns the JSON report."""
+
+    output = subprocess.check_output([sys.executable, '-c', importScript])
+
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Runs the cold imports."""
+
+        cls.reports = [coldImport() for ii in range(nImports)]
+
+    def testColdStart(self):
+        """Fails if a cold import of Totoro exceeds the time budget."""
+
+        elapsed = min(report['elapsed'] for report in self.reports)
+        self.assertLess(elapsed, importTimeBudget)
+
+    def testLazySingletons(self):
+        """Checks that expensive singletons are not created on import."""
+
+        report = self.reports[0]
+
+        self.assertFalse(report['matplotlib'])
+        self.assertFalse(report['site'])
+        self.assertFalse(report['dustMap'])
+        self.assertFalse(report['observingPlan'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+testLSTIndex.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import utils
+from Totoro.dbclasses import Plate
+from Totoro.scheduler.ephemeris import getEphemeris
+from Totoro.scheduler.lstIndex import LSTIndex
+from Totoro.scheduler.scheduler_utils import isObservable
+from Totoro.scheduler.timeline import Timeline
+import numpy as np
+import unittest
+
+
+class TestLSTIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Creates an index for a few plates."""
+
+        cls.plates = [Plate(plateID, format='plate_id')
+                      for plateID in [7495, 7815, 8484, 8486, 8550, 8551]]
+        cls.index = LSTIndex(cls.plates)
+
+    def testGetObservable(self):
+        """Compares LSTIndex.getObservable with isObservable."""
+
+        for jd0 in np.linspace(2457135.6, 2457136.6, 49):
+            jdRange = [jd0, jd0 + 0.2]
+            observable = [plate for plate in self.plates
+                          if isObservable(plate, jdRange)]
+            self.assertEqual(self.index.getObservable(jdRange), observable)
+
+    def testGetOverlapping(self):
+        """Checks the plates overlapping LST ranges, including wrapping."""
+
+        for lstRange in [[22., 2.], [0., 6.], [10., 10.5], [18., 17.]]:
+            overlapping = [
+                plate for plate in self.plates
+                if utils.getIntervalIntersectionLength(
+                    plate.getLSTRange(), lstRange, wrapAt=24.) >= 0.25]
+            self.assertEqual(
+                self.index.getOverlapping(lstRange, minLength=0.25),
+                overlapping)
+
+    def testNextWindowOpening(self):
+        """Tests the skip-ahead of a timeline with no plates in window."""
+
+        timeline = Timeline(2457135.6, 2457136.6)
+        timeline.lstIndex = LSTIndex(self.plates[0:1])
+
+        lstRange = self.plates[0].getLSTRange()
+        ephemeris = getEphemeris()
+
+        for jd in np.linspace(2457135.6, 2457136.6, 25):
+            lst = ephemeris.getLST(jd)
+            nextOpening = timeline._getNextWindowOpening(jd)
+
+            if utils.isPointInInterval(lst, lstRange, wrapAt=24.):
+                self.assertEqual(nextOpening, jd)
+            else:
+                self.assertGreater(nextOpening, jd)
+                self.assertAlmostEqual(
+                    ephemeris.getLST(nextOpening + 1e-6), lstRange[0],
+                    places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+testObservingPlan.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro.scheduler import observingPlan
+from Totoro.scheduler.observingPlan import ObservingPlan
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestObservingPlan(unittest.TestCase):
+
+    def testGetJD(self):
+        """Compares the indexed lookups by JD with a scan of the plan."""
+
+        plan = observingPlan.plan
+
+        for row in plan[::50]:
+            night = plan[plan['JD'] == row['JD']]
+            self.assertEqual(observingPlan.getJD(row['JD'] + 0.5),
+                             (night['JD0'][0], night['JD1'][0]))
+            self.assertEqual(observingPlan.getMJD(row['JD'] - 2400000),
+                             (night['JD0'][0], night['JD1'][0]))
+            self.assertEqual(list(observingPlan.getRow(row['JD'])),
+                             list(night[0]))
+
+    def testGetClosest(self):
+        """Tests getClosest and getPosition within and between nights."""
+
+        plan = observingPlan.plan
+
+        for row in plan[::50]:
+            jdMiddle = (row['JD0'] + row['JD1']) / 2.
+            closest = observingPlan.getClosest(jdMiddle)
+            self.assertEqual(len(closest), 1)
+            self.assertEqual(closest['JD'][0], row['JD'])
+            self.assertEqual(closest['Position'][0], row['Position'])
+
+            # Between nights, the last night with JD <= jd is returned.
+            jdDay = row['JD1'] + 0.1
+            lastNight = plan[plan['JD'] <= jdDay][-1]
+            self.assertEqual(observingPlan.getClosest(jdDay)['JD'],
+                             lastNight['JD'])
+            self.assertEqual(observingPlan.getPosition(jdDay),
+                             lastNight['Position'])
+
+    def testGetNextNightRange(self):
+        """Tests the range of the next night."""
+
+        plan = observingPlan.plan
+
+        for row in plan[::50]:
+            jdRange = [row['JD0'], row['JD1']]
+            nextNight = plan[plan['JD'] == row['JD'] + 1]
+            if len(nextNight) == 0:
+                self.assertIsNone(observingPlan.getNextNightRange(jdRange))
+            else:
+                self.assertEqual(observingPlan.getNextNightRange(jdRange),
+                                 (nextNight['JD0'][0], nextNight['JD1'][0]))
+
+        self.assertIsNone(observingPlan.getNextNightRange(
+            [plan['JD1'][0] + 0.1, plan['JD1'][0] + 0.2]))
+        self.assertTrue(np.all(observingPlan._JD0 == plan['JD0']))
+
+    def testOptimisedPlan(self):
+        """Tests that the optimised plan matches the schedule file."""
+
+        cacheDir = tempfile.mkdtemp()
+
+        try:
+            plan = ObservingPlan(observingPlan.scheduleFile,
+                                 useOptimisedPlan=False,
+                                 saveOptimisedPlan=True, cacheDir=cacheDir)
+            self.assertTrue(os.path.exists(plan.optimisedPlanFile))
+
+            optimised = ObservingPlan(observingPlan.scheduleFile,
+                                      useOptimisedPlan=True,
+                                      saveOptimisedPlan=False,
+                                      cacheDir=cacheDir)
+
+            self.assertEqual(optimised.plan.colnames, plan.plan.colnames)
+            for column in plan.plan.colnames:
+                self.assertTrue(np.all(optimised.plan[column] ==
+                                       plan.plan[column]))
+        finally:
+            shutil.rmtree(cacheDir)
+
+    def testOptimisedPlanSameMtime(self):
+        """Tests that an edit that keeps the mtime invalidates the cache."""
+
+        cacheDir = tempfile.mkdtemp()
+
+        try:
+            scheduleFile = os.path.join(cacheDir, 'schedule.dat')
+            shutil.copy2(observingPlan.scheduleFile, scheduleFile)
+
+            plan = ObservingPlan(scheduleFile, useOptimisedPlan=False,
+                                 saveOptimisedPlan=True, cacheDir=cacheDir)
+            self.assertTrue(plan._readOptimisedPlan())
+
+            # Changes one digit, keeping the size and mtime of the file.
+            stat = os.stat(scheduleFile)
+            with open(scheduleFile, 'rb') as schedule:
+                contents = bytearray(schedule.read())
+            for ii in range(len(contents) - 1, -1, -1):
+                if chr(contents[ii]).isdigit():
+                    contents[ii] = ord('1' if chr(contents[ii]) != '1'
+                                       else '2')
+                    break
+            with open(scheduleFile, 'wb') as schedule:
+                schedule.write(contents)
+            os.utime(scheduleFile, (stat.st_atime, stat.st_mtime))
+
+            self.assertEqual(os.path.getmtime(scheduleFile), stat.st_mtime)
+            self.assertFalse(plan._readOptimisedPlan())
+        finally:
+            shutil.rmtree(cacheDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,9 +15,13 @@ Revision history:
 from __future__ import division
 from __future__ import print_function
 import unittest
-from Totoro.dbclasses import Plate, fromPlateID
+from Totoro.dbclasses import Plate, fromPlateID, getAll, getAtAPO
+from Totoro.dbclasses.plate import Plates
+from Totoro.dbclasses.plate_loader import loadPlateData
 from Totoro.db import getConnection
-from Totoro import exceptions
+from Totoro import exceptions, config
+from Totoro.scheduler import scheduler_utils
+from sqlalchemy import event
 
 db = getConnection('test')
 
@@ -65,6 +69,347 @@ class plateTestCase(unittest.TestCase):
         self.assertEqual(len(plate.getMangadbExposures()),
                          len(plate.getScienceExposures()))
 
+    def testPlateFork(self):
+        """Tests that changes in a fork only affect the plate if committed."""
+
+        plate = fromPlateID(8486)
+        nSets = len(plate.sets)
+        nExposures = len(plate.getTotoroExposures(onlySets=True))
+
+        fork = plate.fork()
+        fork.addMockExposure(startTime=2457137.9535648148,
+                             plugging=plate.getActivePlugging())
+
+        self.assertEqual(len(fork.getTotoroExposures(onlySets=True)),
+                         nExposures + 1)
+        self.assertEqual(len(plate.sets), nSets)
+        self.assertEqual(len(plate.getTotoroExposures(onlySets=True)),
+                         nExposures)
+
+        self.assertIs(fork.commit(), plate)
+        self.assertEqual(len(plate.getTotoroExposures(onlySets=True)),
+                         nExposures + 1)
+
+        with self.assertRaises(exceptions.TotoroError):
+            plate.commit()
+
+    def testSimulationMemo(self):
+        """Tests that the completion before the simulation is reused until the
+        plate changes."""
+
+        plate = fromPlateID(8486)
+        jdRange = [2457137.9535648148, 2457137.99]
+        memo = scheduler_utils.SimulationMemo()
+
+        fork = plate.fork()
+        scheduler_utils._addBookkeepingAttrs([fork], memo=memo)
+        before = memo.getBefore(fork)
+        self.assertIsNotNone(before)
+        scheduler_utils.simulatePlates([fork], jdRange, 'plugger')
+
+        # The memo is hit for a new fork in a later range, so the completion
+        # of the plate is not calculated again.
+        fork2 = plate.fork()
+        self.assertIs(memo.getBefore(fork2), before)
+
+        calls = []
+        origGetPlateCompletion = plate.getPlateCompletion
+
+        def getPlateCompletion(*args, **kwargs):
+            calls.append(args)
+            return origGetPlateCompletion(*args, **kwargs)
+
+        fork2.getPlateCompletion = getPlateCompletion
+        scheduler_utils._addBookkeepingAttrs([fork2], memo=memo)
+        self.assertEqual(len(calls), 0)
+        self.assertEqual(fork2._before, fork._before)
+        scheduler_utils.simulatePlates([fork2], [jdRange[0] + 0.01,
+                                                 jdRange[1]], 'plugger')
+
+        # The memo is not used once the plate has been modified.
+        plate.addMockExposure(startTime=jdRange[0],
+                              plugging=plate.getActivePlugging())
+        fork3 = plate.fork()
+        self.assertIsNone(memo.getBefore(fork3))
+
+        memo.prune()
+        self.assertEqual(len(memo._before), 0)
+
+    def testSimulationTraceReuse(self):
+        """Tests that reusing previous simulations does not change the
+        schedule of a timeline."""
+
+        from Totoro.scheduler.timeline import Timeline
+
+        plates = [fromPlateID(plateID)
+                  for plateID in [7495, 7815, 8484, 8486]]
+        jdRange = [2457135.7, 2457136.0]
+
+        SimulationMemo = scheduler_utils.SimulationMemo
+        origGetTrace = SimulationMemo.getTrace
+        traces = []
+
+        def getTrace(memo, *args):
+            trace = origGetTrace(memo, *args)
+            if trace is not None:
+                traces.append(trace)
+            return trace
+
+        def schedule():
+            timeline = Timeline(*jdRange)
+            timeline.schedule([plate.fork() for plate in plates],
+                              mode='planner', useDateAtAPO=False)
+            return [(plate.plate_id,
+                     [exp.getJD() for exp in plate.getMockExposures()])
+                    for plate in timeline.scheduled]
+
+        try:
+            SimulationMemo.getTrace = getTrace
+            withReuse = schedule()
+            SimulationMemo.getTrace = lambda memo, *args: None
+            withoutReuse = schedule()
+        finally:
+            SimulationMemo.getTrace = origGetTrace
+
+        self.assertGreater(len(traces), 0)
+        self.assertEqual(withReuse, withoutReuse)
+
+    def testParallelTimeline(self):
+        """Tests that simulating the plates in parallel does not change the
+        plates scheduled in a timeline."""
+
+        from Totoro.scheduler.timeline import Timeline
+
+        plates = [fromPlateID(plateID)
+                  for plateID in [7495, 7815, 8484, 8486]]
+        jdRange = [2457135.7, 2457136.0]
+
+        origNWorkers = config['scheduling']['nWorkers']
+
+        def schedule(mode, nWorkers):
+            config['scheduling']['nWorkers'] = nWorkers
+            timeline = Timeline(*jdRange)
+            timeline.schedule([plate.fork() for plate in plates], mode=mode,
+                              useDateAtAPO=False)
+            return [(plate.plate_id,
+                     [exp.getJD() for exp in plate.getMockExposures()])
+                    for plate in timeline.scheduled]
+
+        try:
+            for mode in ['plugger', 'planner']:
+                self.assertEqual(schedule(mode, 1), schedule(mode, 3))
+        finally:
+            config['scheduling']['nWorkers'] = origNWorkers
+
+    def testCompletionBounds(self):
+        """Tests that the simulation does not exceed the completion bounds."""
+
+        plates = [fromPlateID(plateID) for plateID in [7495, 7815, 8484]]
+        jdRange = [2457135.7, 2457136.0]
+
+        bounds = scheduler_utils.getCompletionBounds(plates, jdRange,
+                                                     mode='planner')
+
+        for plate in plates:
+            fork = plate.fork()
+            scheduler_utils._addBookkeepingAttrs([fork])
+            scheduler_utils.simulatePlates([fork], jdRange, 'planner')
+
+            self.assertLessEqual(fork._after['completion'],
+                                 bounds[plate].completion)
+            self.assertLessEqual(
+                1 + scheduler_utils.patchSetFactor *
+                fork._after['nSetsFactor'], bounds[plate].patchFactor)
+
+    def testPruningEquivalence(self):
+        """Tests that pruning candidates does not change the optimal plate."""
+
+        plateSets = [[7495, 7815, 8484], [8484, 8486],
+                     [7495, 7815, 8484, 8486]]
+        jdRanges = [[2457135.7, 2457136.0], [2457135.85, 2457135.95],
+                    [2457137.9535648148, 2457138.1]]
+
+        origPrune = config['scheduling']['pruneCandidates']
+        origBatchSize = config['scheduling']['pruneBatchSize']
+
+        def getOptimal(plates, jdRange, prune):
+            config['scheduling']['pruneCandidates'] = prune
+            forks = [plate.fork() for plate in plates]
+            optimal, newExposures = scheduler_utils.getOptimalPlate(
+                forks, jdRange, mode='planner')
+            index = forks.index(optimal) if optimal is not None else None
+            return index, [exp.getJD() for exp in newExposures]
+
+        try:
+            # Small batches so that the plates are actually pruned.
+            config['scheduling']['pruneBatchSize'] = 1
+            for plateIDs in plateSets:
+                plates = [fromPlateID(plateID) for plateID in plateIDs]
+                for jdRange in jdRanges:
+                    self.assertEqual(getOptimal(plates, jdRange, False),
+                                     getOptimal(plates, jdRange, True))
+        finally:
+            config['scheduling']['pruneCandidates'] = origPrune
+            config['scheduling']['pruneBatchSize'] = origBatchSize
+
+    def testPruningTimeline(self):
+        """Tests that pruning candidates does not change the plates scheduled
+        in a timeline, and that it is not used in plugger mode."""
+
+        from Totoro.scheduler.timeline import Timeline
+
+        plates = [fromPlateID(plateID)
+                  for plateID in [7495, 7815, 8484, 8486]]
+        jdRange = [2457135.7, 2457136.0]
+
+        origPrune = config['scheduling']['pruneCandidates']
+        origBatchSize = config['scheduling']['pruneBatchSize']
+        origSimulatePlates = scheduler_utils.simulatePlates
+        nSimulated = []
+
+        def simulatePlates(plates, *args, **kwargs):
+            nSimulated[-1] += len(plates)
+            return origSimulatePlates(plates, *args, **kwargs)
+
+        def schedule(mode, prune):
+            config['scheduling']['pruneCandidates'] = prune
+            nSimulated.append(0)
+            timeline = Timeline(*jdRange)
+            timeline.schedule([plate.fork() for plate in plates], mode=mode,
+                              useDateAtAPO=False)
+            return [(plate.plate_id,
+                     [exp.getJD() for exp in plate.getMockExposures()])
+                    for plate in timeline.scheduled]
+
+        try:
+            config['scheduling']['pruneBatchSize'] = 1
+            scheduler_utils.simulatePlates = simulatePlates
+            self.assertEqual(schedule('planner', False),
+                             schedule('planner', True))
+            self.assertLessEqual(nSimulated[1], nSimulated[0])
+            self.assertEqual(schedule('plugger', False),
+                             schedule('plugger', True))
+            self.assertEqual(nSimulated[2], nSimulated[3])
+        finally:
+            scheduler_utils.simulatePlates = origSimulatePlates
+            config['scheduling']['pruneCandidates'] = origPrune
+            config['scheduling']['pruneBatchSize'] = origBatchSize
+
+    def _getDBPlates(self, plateIDs):
+        """Returns the plateDB.Plate instances for a list of plate_ids."""
+
+        session = db.Session()
+        with session.begin():
+            dbPlates = session.query(db.plateDB.Plate).filter(
+                db.plateDB.Plate.plate_id.in_(plateIDs)).order_by(
+                    db.plateDB.Plate.plate_id).all()
+
+        return dbPlates
+
+    def testBulkLoad(self):
+        """Tests that bulk-loaded data matches the plates loaded one by one."""
+
+        dbPlates = self._getDBPlates([7495, 7815, 8484, 8486])
+        plateData = loadPlateData(dbPlates)
+
+        for dbPlate in dbPlates:
+            plate = Plate(dbPlate, fullCheck=False, updateSets=False)
+            data = plateData[dbPlate.pk]
+
+            self.assertEqual([ss.pk for ss in data.sets],
+                             sorted([ss.pk for ss in plate.getMangaDBSets()]))
+
+            for ss in plate.sets:
+                self.assertItemsEqual(
+                    [exp.pk for exp in data.setExposures[ss.pk]],
+                    [exp.pk for exp in ss.loadExposures()])
+
+            self.assertItemsEqual(
+                [exp.pk for exp in data.scienceExposures],
+                [exp.pk for exp in plate.getScienceExposures()])
+
+    def testBulkLoadQueries(self):
+        """Tests that the number of queries does not depend on the plates."""
+
+        dbPlates = self._getDBPlates([7495, 7815, 8484, 8486, 8550, 8551])
+        queries = []
+
+        def countQuery(*args):
+            queries.append(args)
+
+        event.listen(db.engine, 'before_cursor_execute', countQuery)
+
+        try:
+            loadPlateData(dbPlates[0:2])
+            nQueriesTwo = len(queries)
+            del queries[:]
+            loadPlateData(dbPlates)
+            nQueriesAll = len(queries)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', countQuery)
+
+        self.assertEqual(nQueriesTwo, nQueriesAll)
+
+    def testPreloadedPlatesQueries(self):
+        """Tests that constructing preloaded plates does not reload the data.
+
+        The first construction flags the sets and exposures, so that the
+        following ones do not change the DB.
+
+        """
+
+        dbPlates = self._getDBPlates([7495, 7815, 8484, 8486, 8550, 8551])
+        Plates(dbPlates)
+
+        queries = []
+
+        def countQuery(*args):
+            queries.append(args)
+
+        event.listen(db.engine, 'before_cursor_execute', countQuery)
+
+        try:
+            Plates(dbPlates[0:2])
+            nQueriesTwo = len(queries)
+            del queries[:]
+            Plates(dbPlates)
+            nQueriesAll = len(queries)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', countQuery)
+
+        self.assertEqual(nQueriesTwo, nQueriesAll)
+
+    def testFilterPushdown(self):
+        """Tests that the filters in the query match filtering the plates."""
+
+        allPlates = getAll()
+        rejectStatuses = ['Rejected', 'Unobservable']
+
+        plates = getAll(rejectSpecial=True, rejectStatuses=rejectStatuses,
+                        location='APO')
+        expected = [
+            plate for plate in allPlates
+            if plate.mangadbPlate is not None and
+            not plate.mangadbPlate.all_sky_plate and
+            not plate.mangadbPlate.commissioning_plate and
+            not plate.mangadbPlate.neverobserve and
+            plate.getLocation() == 'APO' and
+            not any([status.label in rejectStatuses
+                     for status in plate.statuses])]
+        self.assertEqual([plate.pk for plate in plates],
+                         [plate.pk for plate in expected])
+
+        incomplete = getAll(onlyIncomplete=True)
+        self.assertEqual([plate.pk for plate in incomplete],
+                         [plate.pk for plate in allPlates
+                          if not plate.isComplete])
+
+        platesAtAPO = getAtAPO()
+        incompleteAtAPO = getAtAPO(onlyIncomplete=True)
+        self.assertEqual([plate.pk for plate in incompleteAtAPO],
+                         [plate.pk for plate in platesAtAPO
+                          if not plate.isComplete])
+
     # def testSubtransactions(self):
     #     """Fails if trying to load a plate from within a subtransaction."""
     #
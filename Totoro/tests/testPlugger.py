@@ -97,6 +97,26 @@ class TestPlugger(unittest.TestCase):
 
         self.assertEqual(validResult, plugger.getASOutput())
 
+    def testParallelSimulation(self):
+        """Tests that simulating the plates in parallel gives the same result.
+        """
+
+        nWorkers = config['scheduling']['nWorkers']
+        config['scheduling']['nWorkers'] = 3
+
+        validResult = OrderedDict([(1, 8482), (3, 8486), (4, 8550),
+                                   ('cart_order',
+                                    [9, 8, 7, 5, 6, 2, 3, 4, 1])])
+
+        # The plates are scheduled by getASOutput, so it must be called with
+        # the workers enabled.
+        try:
+            plugger = Plugger(startDate=2457157.76042, endDate=2457157.95,
+                              useInitialBuffer=False)
+            self.assertEqual(validResult, plugger.getASOutput())
+        finally:
+            config['scheduling']['nWorkers'] = nWorkers
+
     def test57307(self):
         """Tests replugging when cart is offline."""
 
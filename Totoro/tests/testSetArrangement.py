@@ -15,9 +15,17 @@ Revision history:
 from __future__ import division
 from __future__ import print_function
 from Totoro.db import getConnection
-from Totoro.dbclasses import fromPlateID
-from Totoro.dbclasses.plate_utils import removeOrphanedSets
+from Totoro.dbclasses import fromPlateID, Exposure, Set, Plate
+from Totoro.dbclasses.arrangement import (SetEvaluator, ArrangementSelector,
+                                          BranchAndBound, reduceCandidates)
+from Totoro.dbclasses.flagging import batchFlagging
+from Totoro.dbclasses.plate_utils import (removeOrphanedSets,
+                                          isInsertionOptimal,
+                                          getNumberPermutations,
+                                          _evaluatePermutations)
 from Totoro.bin.rearrangeSets import rearrageSets
+import itertools
+import numpy as np
 import unittest
 
 
@@ -159,6 +167,291 @@ class TestSetArrangement(unittest.TestCase):
                             for exp in plate.sets[ii].totoroExposures]
             self.assertItemsEqual(setExposures, correctSetExposures[ii])
 
+    def testBranchAndBoundRearrangement(self):
+        """Tests that branch and bound matches the exhaustive rearrangement."""
+
+        plate = fromPlateID(7495)
+        plate.rearrangeSets(mode='optimal', LST=0.)
+
+        exhaustiveSetExposures = sorted(
+            [sorted([exp._mangaExposure.pk for exp in ss.totoroExposures])
+             for ss in plate.sets])
+        exhaustiveCompletion = plate.getPlateCompletion()
+
+        self.setUpClass()
+
+        plate = fromPlateID(7495)
+        plate.rearrangeSets(mode='branchAndBound', LST=0.)
+
+        setExposures = sorted(
+            [sorted([exp._mangaExposure.pk for exp in ss.totoroExposures])
+             for ss in plate.sets])
+
+        self.assertAlmostEqual(plate.getPlateCompletion(),
+                               exhaustiveCompletion)
+        self.assertEqual(setExposures, exhaustiveSetExposures)
+
+    def testBranchAndBoundCandidates(self):
+        """Tests that branch and bound selects the exhaustive arrangement."""
+
+        plate = fromPlateID(7495)
+
+        def createExposure(ii, dither):
+            return Exposure.createMockExposure(
+                startTime=2457135.9304166664 + ii * 0.011, expTime=900,
+                ra=plate.ra, dec=plate.dec, ditherPosition=dither,
+                sn2values=np.array([2, 2, 4, 4]))
+
+        # Identical mock exposures, for which many arrangements tie.
+        exposureLists = [[createExposure(ii, dither) for ii in range(2)
+                          for dither in ['N', 'S', 'E']]]
+
+        for plateID in [7495, 7815, 8484, 8486]:
+            exposureLists.append(
+                [Exposure(exp)
+                 for exp in fromPlateID(plateID).getScienceExposures()])
+
+        nTested = 0
+        for exposures in exposureLists:
+
+            ditherPositions = [exp.ditherPosition for exp in exposures]
+            if getNumberPermutations(ditherPositions) > 14400:
+                continue
+
+            evaluator = SetEvaluator(exposures)
+            extraSets = [Set.fromExposures(exposures[0])]
+
+            for offset, extra in [(0., None), (0.5, extraSets)]:
+
+                exhaustive = ArrangementSelector(evaluator, offset=offset,
+                                                 extraSets=extra)
+                for __, completion, arrangement in _evaluatePermutations(
+                        evaluator, ditherPositions, np.zeros(4)):
+                    exhaustive.add(completion, arrangement)
+
+                branchAndBound = ArrangementSelector(
+                    evaluator, offset=offset, extraSets=extra)
+                for completion, arrangement in BranchAndBound(
+                        ditherPositions, evaluator).run():
+                    branchAndBound.add(completion, arrangement)
+
+                for LST in [0., 12.]:
+                    self.assertEqual(branchAndBound.select(LST=LST),
+                                     exhaustive.select(LST=LST))
+
+                nTested += 1
+
+        self.assertGreater(nTested, 2)
+
+    def testBranchAndBoundNodeLimit(self):
+        """Tests that branch and bound stops at the node limit."""
+
+        plate = fromPlateID(7495)
+        exposures = [Exposure(exp) for exp in plate.getScienceExposures()]
+        evaluator = SetEvaluator(exposures)
+
+        branchAndBound = BranchAndBound(evaluator.ditherPositions, evaluator,
+                                        maxNodes=10)
+        list(branchAndBound.run())
+
+        self.assertTrue(branchAndBound.aborted)
+        self.assertEqual(branchAndBound.nNodes, 10)
+
+    def testRearrangementInBatch(self):
+        """Tests the statuses of sets rearranged within batchFlagging."""
+
+        plate = fromPlateID(7495, rearrangeIncomplete=False, force=True)
+
+        with batchFlagging():
+            # Flags the original sets before they are replaced.
+            for ss in plate.sets:
+                ss.getStatus(force=True)
+            plate.rearrangeSets(mode='optimal', LST=0.)
+
+        plate = fromPlateID(7495, rearrangeIncomplete=False, force=True)
+        self.assertGreater(len(plate.sets), 0)
+
+        for ss in plate.sets:
+            mockSet = Set.fromExposures(ss.totoroExposures)
+            status = mockSet.getStatus(silent=True)[0]
+
+            if status in ['Incomplete', 'Unplugged', 'Bad']:
+                statusPK = None
+            else:
+                statusPK = db.lookupTables.getPK(db.mangaDB.SetStatus,
+                                                 status)
+
+            with session.begin():
+                setDB = session.query(db.mangaDB.Set).get(ss.pk)
+                self.assertEqual(setDB.set_status_pk, statusPK)
+
+    def testBranchAndBoundWithBadOverriddenSet(self):
+        """Tests branch and bound with a set overridden bad."""
+
+        overrideBadPK = db.lookupTables.getPK(db.mangaDB.SetStatus,
+                                              'Override Bad')
+
+        results = []
+        for mode in ['optimal', 'branchAndBound']:
+
+            self.setUpClass()
+            with session.begin():
+                set1 = session.query(db.mangaDB.Set).get(1)
+                set1.set_status_pk = overrideBadPK
+
+            plate = fromPlateID(7495)
+            plate.rearrangeSets(mode=mode, LST=0.)
+
+            setExposures = sorted(
+                [sorted([exp._mangaExposure.pk for exp in ss.totoroExposures])
+                 for ss in plate.sets])
+            results.append((setExposures, plate.getPlateCompletion()))
+
+        self.assertEqual(results[0][0], results[1][0])
+        self.assertAlmostEqual(results[0][1], results[1][1])
+
+    def testParallelRearrangement(self):
+        """Tests that the parallel rearrangement matches the serial one."""
+
+        plate = fromPlateID(7495)
+        plate.rearrangeSets(mode='optimal', LST=0., nWorkers=1)
+
+        serialSetExposures = [
+            sorted([exp._mangaExposure.pk for exp in ss.totoroExposures])
+            for ss in plate.sets]
+
+        self.setUpClass()
+
+        plate = fromPlateID(7495)
+        plate.rearrangeSets(mode='optimal', LST=0., nWorkers=3)
+
+        setExposures = [
+            sorted([exp._mangaExposure.pk for exp in ss.totoroExposures])
+            for ss in plate.sets]
+
+        self.assertEqual(setExposures, serialSetExposures)
+
+    def testReduceCandidates(self):
+        """Tests that the reduced candidates give the same selection."""
+
+        plate = fromPlateID(7495)
+        exposures = [Exposure(exp) for exp in plate.getScienceExposures()]
+        ditherPositions = [exp.ditherPosition for exp in exposures]
+        evaluator = SetEvaluator(exposures)
+
+        candidates = list(_evaluatePermutations(evaluator, ditherPositions,
+                                                np.zeros(4)))
+        reduced = reduceCandidates(evaluator, candidates, maxCandidates=3)
+
+        self.assertLessEqual(len(reduced), len(candidates))
+
+        for offset in [0., 0.5]:
+            selector = ArrangementSelector(evaluator, offset=offset,
+                                           maxCandidates=3)
+            for __, completion, arrangement in candidates:
+                selector.add(completion, arrangement)
+
+            reducedSelector = ArrangementSelector(evaluator, offset=offset,
+                                                  maxCandidates=3)
+            for __, completion, arrangement in reduceCandidates(
+                    evaluator, candidates, offset=offset, maxCandidates=3):
+                reducedSelector.add(completion, arrangement)
+
+            self.assertEqual(reducedSelector.select(LST=0.),
+                             selector.select(LST=0.))
+
+    def testInsertionOptimal(self):
+        """Tests isInsertionOptimal when the completed set is not optimal."""
+
+        plate = fromPlateID(7495)
+        mockPlate = Plate.createMockPlate(ra=plate.ra, dec=plate.dec)
+
+        def createExposure(ii, dither, sn2):
+            return Exposure.createMockExposure(
+                startTime=2457135.9304166664 + ii * 0.011, expTime=900,
+                ra=plate.ra, dec=plate.dec, ditherPosition=dither,
+                sn2values=np.array(sn2))
+
+        # Two incomplete sets with the same dithers. The exposures in the
+        # second one have larger SN2.
+        exposuresA = [createExposure(0, 'N', [2, 2, 4, 4]),
+                      createExposure(1, 'S', [2, 2, 4, 4])]
+        exposuresB = [createExposure(0, 'N', [3, 3, 6, 6]),
+                      createExposure(1, 'S', [3, 3, 6, 6])]
+        newExposure = createExposure(2, 'E', [3, 3, 6, 6])
+
+        # Completing the first set, as a greedy insertion could do, is not
+        # optimal.
+        setA = Set.fromExposures(exposuresA + [newExposure])
+        mockPlate.sets = [setA, Set.fromExposures(exposuresB)]
+        self.assertEqual(setA.getStatus(silent=True)[0], 'Good')
+        self.assertFalse(isInsertionOptimal(mockPlate, newExposure, setA))
+
+        setB = Set.fromExposures(exposuresB + [newExposure])
+        mockPlate.sets = [Set.fromExposures(exposuresA), setB]
+        self.assertEqual(setB.getStatus(silent=True)[0], 'Good')
+        self.assertTrue(isInsertionOptimal(mockPlate, newExposure, setB))
+
+    def testInsertionOptimalTie(self):
+        """Tests that isInsertionOptimal fails if the insertion may tie."""
+
+        plate = fromPlateID(7495)
+        mockPlate = Plate.createMockPlate(ra=plate.ra, dec=plate.dec)
+
+        def createExposure(ii, dither):
+            return Exposure.createMockExposure(
+                startTime=2457135.9304166664 + ii * 0.011, expTime=900,
+                ra=plate.ra, dec=plate.dec, ditherPosition=dither,
+                sn2values=np.array([2, 2, 4, 4]))
+
+        # The new exposure could also be added to the other incomplete set,
+        # which would give the same completion.
+        newExposure = createExposure(1, 'S')
+        setA = Set.fromExposures([createExposure(0, 'N'), newExposure])
+        mockPlate.sets = [setA, Set.fromExposures([createExposure(0, 'N')])]
+        self.assertFalse(isInsertionOptimal(mockPlate, newExposure, setA))
+
+        # The exposure in the other incomplete set has the same dither.
+        mockPlate.sets = [setA, Set.fromExposures([createExposure(0, 'S')])]
+        self.assertTrue(isInsertionOptimal(mockPlate, newExposure, setA))
+
+    def testSetEvaluator(self):
+        """Tests that SetEvaluator matches the status of mock sets."""
+
+        plate = fromPlateID(7495)
+        exposures = [Exposure(exp) for exp in plate.getScienceExposures()]
+
+        evaluator = SetEvaluator(exposures)
+
+        for nExp in [1, 2, 3]:
+            for indices in itertools.combinations(range(len(exposures)),
+                                                  nExp):
+                mockSet = Set.fromExposures(
+                    [exposures[ii] for ii in indices])
+                self.assertEqual(evaluator.getStatus(indices),
+                                 mockSet.getStatus(silent=True)[0])
+                np.testing.assert_allclose(evaluator.getSN2Array(indices),
+                                           mockSet.getSN2Array())
+
+    def testArrangementSelectorIsBounded(self):
+        """Tests that ArrangementSelector keeps at most maxCandidates."""
+
+        plate = fromPlateID(7495)
+        exposures = [Exposure(exp) for exp in plate.getScienceExposures()]
+        evaluator = SetEvaluator(exposures)
+
+        selector = ArrangementSelector(evaluator, maxCandidates=3)
+
+        # Arrangements with one set each and the same completion.
+        for ii in range(len(exposures)):
+            selector.add(0.5, [(ii, )])
+            self.assertLessEqual(len(selector._heap), 3)
+
+        # On ties, the arrangements added first are kept.
+        self.assertEqual(sorted(candidate[2] for __, __, candidate
+                                in selector._heap),
+                         [((0, ), ), ((1, ), ), ((2, ), )])
+
     def testRearrangementScript(self):
         """Tests the set rearrangement script."""
 
@@ -14,10 +14,15 @@ Revision history:
 
 from __future__ import division
 from __future__ import print_function
-from Totoro.dbclasses import Plate, Exposure, Set
+from Totoro.dbclasses import Plate, Exposure, Set, MockExposure, MockSet
 from Totoro.db import getConnection
-from Totoro.dbclasses.plate_utils import removeOrphanedSets
+from Totoro.dbclasses.plate_utils import removeOrphanedSets, allocateSetPKs
+from Totoro import exceptions
+from Totoro.dbclasses.exposure import mockExposureTable, setExposureStatus
+from Totoro.dbclasses.set import setSetStatus
+from Totoro.dbclasses.flagging import batchFlagging
 import numpy as np
+import gc
 import unittest
 
 db = getConnection('test')
@@ -146,6 +151,135 @@ class TestSets(unittest.TestCase):
         statuses = [ss.getStatus()[0] for ss in plate8486.sets]
         self.assertEqual(statuses.count('Incomplete'), 2)
 
+    def testMockSet(self):
+        """Tests that mock sets and exposures do not use the DB layer."""
+
+        plate = Plate(7495, format='plate_id')
+
+        exposures = [Exposure.createMockExposure(
+            startTime=2457135.9304166664 + ii * 0.011, expTime=900,
+            ra=plate.ra, dec=plate.dec, ditherPosition=dither)
+            for ii, dither in enumerate(['N', 'S', 'E'])]
+
+        for exp in exposures:
+            self.assertIsInstance(exp, MockExposure)
+            self.assertFalse(hasattr(exp, '__dict__'))
+            self.assertFalse(hasattr(exp, 'session'))
+
+        newSet = Set.fromExposures(exposures)
+
+        self.assertIsInstance(newSet, MockSet)
+        self.assertFalse(hasattr(newSet, '__dict__'))
+        self.assertAlmostEqual(newSet.ra, plate.ra)
+
+        # Compares with a mock set created with the DB-backed wrapper.
+        dbSet = Set(mock=True)
+        dbSet.totoroExposures = exposures
+        self.assertEqual(dbSet.getStatus(), newSet.getStatus())
+        np.testing.assert_almost_equal(dbSet.getSN2Array(),
+                                       newSet.getSN2Array())
+
+        # Checks that the values of the mock exposures are stored in the
+        # exposure table and that copies get their own row.
+        exp = exposures[0]
+        np.testing.assert_almost_equal(
+            mockExposureTable.getSN2Array([exp._index])[0], exp.getSN2Array())
+
+        plate.sets.append(newSet)
+        plateCopy = plate.copy()
+        expCopy = plateCopy.sets[-1].totoroExposures[0]
+        self.assertIsNot(expCopy, exp)
+        self.assertNotEqual(expCopy._index, exp._index)
+        np.testing.assert_almost_equal(expCopy.getSN2Array(),
+                                       exp.getSN2Array())
+
+    def testMockExposureRelease(self):
+        """Tests that mock exposures in reference cycles are collected."""
+
+        plate = Plate(7495, format='plate_id')
+
+        gc.collect()
+        nRows = len(mockExposureTable)
+
+        exposures = [Exposure.createMockExposure(
+            startTime=2457135.9304166664 + ii * 0.011, expTime=900,
+            ra=plate.ra, dec=plate.dec, ditherPosition=dither)
+            for ii, dither in enumerate(['N', 'S', 'E'])]
+        self.assertEqual(len(mockExposureTable), nRows + 3)
+
+        # Creates a reference cycle that includes the set and its exposures.
+        newSet = Set.fromExposures(exposures)
+        cycle = [newSet]
+        cycle.append(cycle)
+
+        del exposures, newSet, cycle
+        gc.collect()
+
+        self.assertEqual(len(mockExposureTable), nRows)
+        self.assertFalse(any(isinstance(obj, MockExposure)
+                             for obj in gc.garbage))
+
+    def testBatchFlagging(self):
+        """Tests that flagging within batchFlagging is applied on exit."""
+
+        with session.begin():
+            ss = session.query(db.mangaDB.Set).get(2)
+            origSetStatusPK = ss.set_status_pk
+
+        with batchFlagging() as buffer:
+            setExposureStatus(18, 'Totoro Bad')
+            setSetStatus(2, 'Good')
+
+            self.assertEqual(len(buffer), 2)
+            self.assertTrue(buffer.hasSetStatus(2))
+
+            # Nothing has been written to the DB yet.
+            with session.begin():
+                exp = session.query(db.mangaDB.Exposure).get(18)
+                self.assertEqual(exp.exposure_status_pk, 4)
+                self.assertEqual(exp.set_pk, 1)
+
+        with session.begin():
+            exp = session.query(db.mangaDB.Exposure).get(18)
+            self.assertEqual(exp.status.label, 'Totoro Bad')
+            self.assertIsNone(exp.set_pk)
+            ss = session.query(db.mangaDB.Set).get(2)
+            self.assertEqual(ss.status.label, 'Good')
+            ss.set_status_pk = origSetStatusPK
+
+        # Changes are discarded if the block fails.
+        with self.assertRaises(ValueError):
+            with batchFlagging():
+                setExposureStatus(19, 'Totoro Bad')
+                raise ValueError('failing block')
+
+        with session.begin():
+            exp = session.query(db.mangaDB.Exposure).get(19)
+            self.assertEqual(exp.exposure_status_pk, 4)
+            self.assertEqual(exp.set_pk, 1)
+
+        self.setUpClass()
+
+    def testAllocateSetPKs(self):
+        """Tests that allocated set pks are consecutive and unused."""
+
+        with session.begin():
+            setPKs = [pk for pk, in session.query(db.mangaDB.Set.pk).all()]
+            pks = allocateSetPKs(session, 3)
+
+        self.assertEqual(pks, range(pks[0], pks[0] + 3))
+        self.assertFalse(any([pk in setPKs for pk in pks]))
+
+        # The lowest gap is used.
+        usedPKs = set(setPKs)
+        firstPK = 1
+        while any([pk in usedPKs for pk in range(firstPK, firstPK + 3)]):
+            firstPK += 1
+        self.assertEqual(pks[0], firstPK)
+
+        with self.assertRaises(exceptions.TotoroError):
+            allocateSetPKs(session, 1)
+
     def testIncompleteExposure(self):
         """Checks if an incompletely reduced exposure behaves properly."""
 
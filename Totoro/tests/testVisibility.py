@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+testVisibility.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import utils
+from Totoro.dbclasses import Plate
+from Totoro.scheduler.ephemeris import getEphemeris
+from Totoro.scheduler.visibility import getVisibilityMatrix
+import numpy as np
+import unittest
+
+
+class TestVisibility(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Loads a few plates and calculates their visibility."""
+
+        cls.plates = [Plate(plateID, format='plate_id')
+                      for plateID in [7495, 7815, 8484, 8486]]
+        cls.jdRange = [2457135.7, 2457136.0]
+
+        cls.visibility, offset = getVisibilityMatrix(
+            cls.plates, cls.jdRange, 'planner')
+
+        assert offset == 0
+
+    def testMatrix(self):
+        """Compares the matrix with the visibility of each plate."""
+
+        ephemeris = getEphemeris()
+        maxAltitude = self.visibility.maxAltitude
+
+        for plate in self.plates:
+            row = self.visibility.getRow(plate)
+            np.testing.assert_almost_equal(self.visibility.lstRange[row],
+                                           plate.getLSTRange())
+
+            for slot, jd in enumerate(self.visibility.jd):
+                expTime = self.visibility.expTimes[slot]
+                lst = ephemeris.getLST(jd)
+                lstMean = ephemeris.getLST(jd + expTime / 2. / 86400.)
+
+                self.assertEqual(
+                    self.visibility.inWindow[row, slot],
+                    utils.isPointInInterval(lst, plate.getLSTRange(),
+                                            wrapAt=24))
+                self.assertEqual(
+                    self.visibility.belowMaxAltitude[row, slot],
+                    plate.getAltitude(lstMean) <= maxAltitude)
+
+    def testReuse(self):
+        """Checks that the matrix is reused for ranges starting at a slot."""
+
+        fork = self.plates[0].fork()
+        jdRange = [self.visibility.jd[2], self.jdRange[1]]
+
+        visibility, offset = getVisibilityMatrix(
+            [fork], jdRange, 'planner', visibility=self.visibility)
+
+        self.assertIs(visibility, self.visibility)
+        self.assertEqual(offset, 2)
+
+        # A range that does not start at a slot needs a new matrix.
+        visibility, offset = getVisibilityMatrix(
+            [fork], [jdRange[0] + 0.01, jdRange[1]], 'planner',
+            visibility=self.visibility)
+
+        self.assertIsNot(visibility, self.visibility)
+        self.assertEqual(offset, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+astro.py
+
+Created by José Sánchez-Gallego on 16 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Revision history:
+    16 Oct 2026 J. Sánchez-Gallego
+      Initial version
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from Totoro import config
+import datetime
+import numpy as np
+
+
+# JD of MJD=0, the origin of plateDB.Exposure.start_time.
+MJD0 = 2400000.5
+J2000 = 2451545.0
+
+# Length of the mean sidereal day, in days.
+SIDEREAL_DAY = 360. / 360.98564736629
+
+_mjd0Datetime = datetime.datetime(1858, 11, 17)
+
+# MJDs at which the leap seconds were introduced and the value of TAI-UTC,
+# in seconds, from that date. Must be updated when a new leap second is
+# announced in the IERS Bulletin C.
+_leapSecondMJDs = np.array([41317, 41499, 41683, 42048, 42413, 42778, 43144,
+                            43509, 43874, 44239, 44786, 45151, 45516, 46247,
+                            47161, 47892, 48257, 48804, 49169, 49534, 50083,
+                            50630, 51179, 53736, 54832, 56109, 57204, 57754],
+                           dtype=float)
+_leapSeconds = np.arange(10., 10. + len(_leapSecondMJDs))
+
+
+def _wrapAngle(angle):
+    """Wraps an angle in degrees to the range (-180, 180]."""
+
+    angle = np.asarray(angle, dtype=float) % 360.
+
+    return np.where(angle > 180., angle - 360., angle)[()]
+
+
+def taiSecondsToJD(seconds):
+    """Converts TAI seconds since MJD=0 (as in plateDB) to JD."""
+
+    return MJD0 + np.asarray(seconds, dtype=float) / 86400.
+
+
+def jdToTAISeconds(jd):
+    """Converts JD to TAI seconds since MJD=0 (as in plateDB)."""
+
+    return (np.asarray(jd, dtype=float) - MJD0) * 86400.
+
+
+def taiSecondsToDatetime(seconds):
+    """Returns the datetime of a time in TAI seconds since MJD=0."""
+
+    return _mjd0Datetime + datetime.timedelta(seconds=float(seconds))
+
+
+def jdToDatetime(jd):
+    """Returns the datetime of a JD."""
+
+    return _mjd0Datetime + datetime.timedelta(days=float(jd) - MJD0)
+
+
+def getTAIMinusUTC(jd):
+    """Returns TAI-UTC, in seconds, at a JD (UTC or TAI).
+
+    Dates before 1972 are not supported and return the value in 1972.
+
+    """
+
+    mjd = np.asarray(jd, dtype=float) - MJD0
+    index = np.searchsorted(_leapSecondMJDs, mjd, side='right') - 1
+
+    return _leapSeconds[np.clip(index, 0, None)][()]
+
+
+def taiToUTC(jd):
+    """Converts a JD in the TAI scale to UTC."""
+
+    return (np.asarray(jd, dtype=float) - getTAIMinusUTC(jd) / 86400.)[()]
+
+
+def utcToTAI(jd):
+    """Converts a JD in the UTC scale to TAI."""
+
+    return (np.asarray(jd, dtype=float) + getTAIMinusUTC(jd) / 86400.)[()]
+
+
+def greenwichSiderealTime(jd):
+    """Returns the Greenwich mean sidereal time, in hours, for a JD."""
+
+    days = np.asarray(jd, dtype=float) - J2000
+    centuries = days / 36525.
+
+    gmst = (280.46061837 + 360.98564736629 * days +
+            0.000387933 * centuries ** 2 - centuries ** 3 / 38710000.)
+
+    return gmst % 360. / 15.
+
+
+def localSiderealTime(jd, longitude=None):
+    """Returns the local sidereal time, in hours, for a JD.
+
+    `jd` must be in the UTC scale (UT1-UTC, always lower than 0.9 seconds, is
+    neglected). Use `taiToUTC` for times in TAI, such as the start time of
+    the exposures. The longitude, in East degrees, defaults to the one of the
+    observatory in the configuration file.
+
+    """
+
+    if longitude is None:
+        longitude = config['observatory']['longitude']
+
+    return (greenwichSiderealTime(jd) + longitude / 15.) % 24.
+
+
+def hourAngle(jd, ra, longitude=None):
+    """Returns the hour angle, in degrees in the range (-180, 180], of a
+    target with right ascension `ra` (in degrees) at a given JD."""
+
+    return _wrapAngle(localSiderealTime(jd, longitude=longitude) * 15. - ra)
+
+
+def altitude(ha, dec, latitude=None):
+    """Returns the altitude, in degrees, of a target for a given HA and Dec.
+
+    The latitude defaults to the one of the observatory in the configuration
+    file.
+
+    """
+
+    if latitude is None:
+        latitude = config['observatory']['latitude']
+
+    haRad = np.deg2rad(ha)
+    decRad = np.deg2rad(dec)
+    latRad = np.deg2rad(latitude)
+
+    sinAlt = (np.sin(decRad) * np.sin(latRad) +
+              np.cos(decRad) * np.cos(latRad) * np.cos(haRad))
+
+    return np.rad2deg(np.arcsin(sinAlt))
+
+
+def airmass(ha, dec, latitude=None, correct=[75., 10.]):
+    """Returns the plane-parallel airmass for a given HA and Dec (in degrees).
+
+    If `correct` is defined, HAs with absolute value greater than
+    ``correct[0]`` are given a flat airmass ``correct[1]``.
+
+    """
+
+    altitudes = altitude(ha, dec, latitude=latitude)
+    airmasses = 1. / np.sin(np.deg2rad(altitudes))
+
+    if correct is not None:
+        airmasses = np.where(np.abs(_wrapAngle(ha)) > correct[0],
+                             correct[1], airmasses)
+
+    return airmasses[()]
@@ -33,6 +33,48 @@ def getIntervalIntersectionLength(aa, bb, wrapAt=360):
             return (intersection[1] - intersection[0]) % wrapAt
 
 
+def getIntervalIntersectionLengths(aa, bb, wrapAt=360):
+    """Vectorised version of `getIntervalIntersectionLength`.
+
+    `aa` and `bb` are Nx2 arrays of intervals (or a single interval, which is
+    broadcast). Returns an array with the length of the intersection of each
+    pair of intervals.
+
+    """
+
+    aa = np.atleast_2d(np.asarray(aa, dtype=float))
+    bb = np.atleast_2d(np.asarray(bb, dtype=float))
+    aa, bb = np.broadcast_arrays(aa, bb)
+
+    if wrapAt is None:
+        lengthA = aa[:, 1] - aa[:, 0]
+        lengthB = bb[:, 1] - bb[:, 0]
+    else:
+        lengthA = (aa[:, 1] - aa[:, 0]) % wrapAt
+        lengthB = (bb[:, 1] - bb[:, 0]) % wrapAt
+
+    # Makes aa the longest interval of each pair.
+    swap = (lengthB > lengthA)[:, np.newaxis]
+    aa, bb = np.where(swap, bb, aa), np.where(swap, aa, bb)
+
+    def inInterval(point):
+        if wrapAt is None:
+            return (point >= aa[:, 0]) & (point <= aa[:, 1])
+        else:
+            return ((point - aa[:, 0]) % wrapAt <=
+                    (aa[:, 1] - aa[:, 0]) % wrapAt)
+
+    start = np.where(inInterval(bb[:, 0]), bb[:, 0], aa[:, 0])
+    end = np.where(inInterval(bb[:, 1]), bb[:, 1], aa[:, 1])
+
+    lengths = end - start if wrapAt is None else (end - start) % wrapAt
+
+    noIntersection = ~inInterval(bb[:, 0]) & ~inInterval(bb[:, 1])
+    lengths[noIntersection] = 0.0
+
+    return lengths
+
+
 def getIntervalIntersection(aa, bb, wrapAt=360):
     """Returns the intersection between two intervals."""
 
@@ -18,6 +18,7 @@ from Totoro import log
 from Totoro import config
 from Totoro import exceptions
 from Totoro.db import getConnection
+from Totoro.utils import astro
 from sdss.manga.mlhalimit import mlhalimit as mlhalimitHours
 from sqlalchemy.exc import InvalidRequestError, ResourceClosedError
 from collections import OrderedDict
@@ -39,21 +40,12 @@ def computeAirmass(dec, ha, lat=config['observatory']['latitude'],
 
     By default, assumes that the latitude of the observation is the one set
     in the configuration file. If correct is defined, abs(HA) anggles greater
-    than correct[0] are given a flat value correct[1].
+    than correct[0] are given a flat value correct[1]. `dec` and `ha` can be
+    arrays.
     """
 
-    dec = np.atleast_1d(dec)
-    ha = np.atleast_1d(ha) % 360.
-
-    if ha > 180:
-        ha -= 360
-
-    airmass = (np.sin(lat * np.pi / 180.) * np.sin(dec * np.pi / 180.) +
-               np.cos(lat * np.pi / 180.) * np.cos(dec * np.pi / 180.) *
-               np.cos(ha * np.pi / 180.)) ** (-1)
-
-    if correct is not None:
-        airmass[np.abs(ha) > correct[0]] = correct[1]
+    airmass = np.atleast_1d(
+        astro.airmass(ha, dec, latitude=lat, correct=correct))
 
     if len(airmass) == 1:
         return airmass[0]